@@ -0,0 +1,636 @@
+# Copyright 2024 VyOS maintainers and contributors <maintainers@vyos.io>
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+CGNAT port block allocation
+
+Every internal address of a rule is given one block of consecutive ports on
+one of the external addresses. The blocks of a rule are numbered in slots,
+external address by external address in order of preference; the occupied
+slots are tracked in a map with one byte per slot. Allocations are kept in
+sorted arrays of 32-bit integers and saved between commits, so subscribers
+keep their port blocks when the pools change and only the changed map
+elements have to be written to nftables.
+
+The changes of every commit, blocks released and allocated, are appended to
+a history of bounded size, so that the subscriber behind an external
+address and port can be found for a time in the past.
+"""
+
+import json
+import os
+import socket
+import struct
+import time
+
+from array import array
+from bisect import bisect_left
+from bisect import bisect_right
+from ipaddress import IPv4Address
+from ipaddress import IPv4Network
+from ipaddress import ip_address
+from ipaddress import ip_network
+from ipaddress import summarize_address_range
+
+cgnat_allocation_state = '/run/nftables-cgnat.state'
+cgnat_allocation_history = '/run/nftables-cgnat.history'
+
+_state_version = 2
+
+# History records are five 32-bit integers: time, event, internal address,
+# external address, first port << 16 | last port
+_history_magic = b'VYCGNAT\x01'
+_history_header = struct.Struct('=II')
+_record_size = 5
+history_size = 32 * 1024 * 1024
+HISTORY_RELEASE = 0
+HISTORY_ALLOCATE = 1
+
+
+def ntoa(addr: int) -> str:
+    """Return dotted quad of an IPv4 address given as integer"""
+    return socket.inet_ntoa(struct.pack('!I', addr))
+
+
+def range_to_ints(ip_range: str) -> tuple[int, int]:
+    """
+    Return first and last address of a prefix or 'start-stop' address range
+    as integers
+
+    Example:
+        % range_to_ints('192.0.2.0/30')
+        (3221225984, 3221225987)
+    """
+    if '-' in ip_range:
+        start, stop = ip_range.split('-')
+        return int(ip_address(start)), int(ip_address(stop))
+    network = ip_network(ip_range)
+    return int(network.network_address), int(network.broadcast_address)
+
+
+def merge_ranges(ranges: list) -> list:
+    """Return sorted list of non-overlapping (first, last) ranges"""
+    merged = []
+    for first, last in sorted(ranges):
+        if merged and first <= merged[-1][1] + 1:
+            merged[-1][1] = max(merged[-1][1], last)
+        else:
+            merged.append([first, last])
+    return [tuple(r) for r in merged]
+
+
+def collapse_addresses(addresses) -> list[IPv4Network]:
+    """Return the shortest list of prefixes covering the integer addresses"""
+    networks = []
+    for first, last in merge_ranges((addr, addr) for addr in addresses):
+        networks.extend(summarize_address_range(IPv4Address(first), IPv4Address(last)))
+    return networks
+
+
+class AllocationError(Exception):
+    """Not enough port blocks left for the internal addresses"""
+
+
+class PortBlockAllocator:
+    """
+    Port block allocation of one CGNAT rule
+
+    externals is the list of external addresses as integers, in order of
+    preference; port_range the external 'start-stop' port range and
+    port_count the number of ports of each block.
+    """
+    def __init__(self, externals: list, port_range: str, port_count: int):
+        self.externals = list(externals)
+        self.port_range = port_range
+        self.port_count = int(port_count)
+        self.start_port, self.end_port = map(int, port_range.split('-'))
+        self.blocks = (self.end_port - self.start_port + 1) // self.port_count
+
+        # allocation sorted by internal address, and the occupied slots
+        self.internal = array('I')
+        self.slot = array('I')
+        self.used = bytearray(len(self.externals) * self.blocks)
+        self._cursor = 0
+
+    def __len__(self):
+        return len(self.internal)
+
+    def same_ports(self, other) -> bool:
+        return (self.start_port, self.end_port, self.port_count) == \
+               (other.start_port, other.end_port, other.port_count)
+
+    def block(self, slot: int) -> tuple[int, int, int]:
+        """Return external address, first and last port of a slot"""
+        index, block = divmod(slot, self.blocks)
+        first = self.start_port + block * self.port_count
+        return self.externals[index], first, first + self.port_count - 1
+
+    def find(self, internal: int):
+        """Return the slot allocated to an internal address, or None"""
+        i = bisect_left(self.internal, internal)
+        if i < len(self.internal) and self.internal[i] == internal:
+            return self.slot[i]
+        return None
+
+    def adopt(self, previous) -> array:
+        """
+        Take over the allocation of the previous commit, which must have the
+        same port ranges. Returns the internal addresses whose external
+        address was removed; they are allocated again by update().
+        """
+        self.internal = array('I', previous.internal)
+        self.slot = array('I', previous.slot)
+        released = array('I')
+
+        if previous.externals != self.externals:
+            position = {addr: i for i, addr in enumerate(self.externals)}
+            moved = [position.get(addr) for addr in previous.externals]
+            internal = array('I')
+            slot = array('I')
+            for addr, old in zip(self.internal, self.slot):
+                index, block = divmod(old, self.blocks)
+                if moved[index] is None:
+                    released.append(addr)
+                else:
+                    internal.append(addr)
+                    slot.append(moved[index] * self.blocks + block)
+            self.internal, self.slot = internal, slot
+
+        for slot in self.slot:
+            self.used[slot] = 1
+        return released
+
+    def _allocate(self, count: int):
+        """Yield runs (start, stop) of free slots for count addresses"""
+        while count:
+            start = self.used.find(0, self._cursor)
+            if start < 0:
+                start = self.used.find(0)
+            if start < 0:
+                raise AllocationError('Not enough port blocks available')
+            stop = self.used.find(1, start, start + count)
+            if stop < 0:
+                stop = min(start + count, len(self.used))
+            self.used[start:stop] = b'\x01' * (stop - start)
+            self._cursor = stop
+            count -= stop - start
+            yield start, stop
+
+    def update(self, ranges: list) -> tuple[array, array, array]:
+        """
+        Allocate blocks to the addresses of ranges, list of (first, last), and
+        release the blocks of addresses no longer included. New addresses
+        are given the first free blocks in ascending address order.
+
+        Returns the released internal addresses, and the newly allocated
+        internal addresses with their slots.
+        """
+        wanted = merge_ranges(ranges)
+        internal, slot = self.internal, self.slot
+
+        # spans of the current allocation inside each wanted range, and
+        # the allocations in between which are released
+        spans = []
+        outside = []
+        previous = 0
+        for first, last in wanted:
+            lo = bisect_left(internal, first, previous)
+            hi = bisect_right(internal, last, lo)
+            outside.append((previous, lo))
+            spans.append((first, last, lo, hi))
+            previous = hi
+        outside.append((previous, len(internal)))
+
+        # free the released blocks before allocating new ones
+        released = array('I')
+        for lo, hi in outside:
+            released.extend(internal[lo:hi])
+            for i in range(lo, hi):
+                self.used[slot[i]] = 0
+        if released:
+            self._cursor = 0
+
+        new_internal = array('I')
+        new_slot = array('I')
+        allocated = array('I')
+        allocated_slot = array('I')
+        for first, last, lo, hi in spans:
+            if hi - lo == last - first + 1:
+                new_internal.extend(internal[lo:hi])
+                new_slot.extend(slot[lo:hi])
+                continue
+
+            # gaps between the allocated addresses of the range
+            gaps = []
+            start = first
+            for i in range(lo, hi):
+                if internal[i] > start:
+                    gaps.append((start, internal[i]))
+                start = internal[i] + 1
+            if start <= last:
+                gaps.append((start, last + 1))
+
+            i = lo
+            for gap_start, gap_stop in gaps:
+                while i < hi and internal[i] < gap_start:
+                    new_internal.append(internal[i])
+                    new_slot.append(slot[i])
+                    i += 1
+                addr = gap_start
+                for run_start, run_stop in self._allocate(gap_stop - gap_start):
+                    count = run_stop - run_start
+                    new_internal.extend(range(addr, addr + count))
+                    new_slot.extend(range(run_start, run_stop))
+                    allocated_slot.extend(range(run_start, run_stop))
+                    addr += count
+                allocated.extend(range(gap_start, gap_stop))
+            new_internal.extend(internal[i:hi])
+            new_slot.extend(slot[i:hi])
+
+        self.internal, self.slot = new_internal, new_slot
+        return released, allocated, allocated_slot
+
+    def elements(self, internal: array = None, slot: array = None):
+        """
+        Yield (internal, external, first port, last port) of the given or of
+        all allocations
+        """
+        if internal is None:
+            internal, slot = self.internal, self.slot
+        for addr, s in zip(internal, slot):
+            yield (addr, *self.block(s))
+
+    def owners(self) -> array:
+        """Return the internal address of every slot, 0 for free slots"""
+        owner = array('I', bytes(4 * len(self.used)))
+        for addr, slot in zip(self.internal, self.slot):
+            owner[slot] = addr
+        return owner
+
+    def _header(self):
+        return {'externals': self.externals, 'port_range': self.port_range,
+                'port_count': self.port_count, 'count': len(self.internal),
+                'slots': len(self.used)}
+
+
+def allocation_changes(previous: PortBlockAllocator = None, released: array = None,
+                       allocator: PortBlockAllocator = None, allocated: array = None,
+                       allocated_slot: array = None) -> array:
+    """
+    Return the history records of a commit for one rule: the blocks of the
+    released internal addresses in the previous allocation, then the newly
+    allocated blocks. The time is set when the records are saved.
+    """
+    records = array('I')
+    if previous is not None and released:
+        for addr in released:
+            slot = previous.find(addr)
+            if slot is None:
+                continue
+            external, first, last = previous.block(slot)
+            records.extend((0, HISTORY_RELEASE, addr, external, first << 16 | last))
+    if allocator is not None and allocated:
+        for addr, slot in zip(allocated, allocated_slot):
+            external, first, last = allocator.block(slot)
+            records.extend((0, HISTORY_ALLOCATE, addr, external, first << 16 | last))
+    return records
+
+
+def _state_time(path: str):
+    try:
+        with open(path, 'rb') as f:
+            header = json.loads(f.readline())
+        if header.get('version') == _state_version:
+            return header['time']
+    except (OSError, ValueError, KeyError):
+        pass
+    return None
+
+
+def _read_history_header(f) -> tuple[int, int]:
+    if f.read(len(_history_magic)) != _history_magic:
+        raise ValueError('invalid allocation history')
+    return _history_header.unpack(f.read(_history_header.size))
+
+
+def _append_history(path: str, now: int, previous_time, records: array):
+    """
+    Append the records of a commit. The history is only continued if it
+    ends with the allocation the commit started from, else it is restarted.
+    """
+    start, state_time = now, None
+    try:
+        with open(path, 'rb') as f:
+            start, state_time = _read_history_header(f)
+    except (OSError, ValueError, struct.error):
+        pass
+
+    records = array('I', records)
+    records[0::_record_size] = array('I', [now]) * (len(records) // _record_size)
+    if state_time is None or state_time != (previous_time or 0):
+        old = array('I')
+        start = now
+    else:
+        old = None
+
+    size = len(_history_magic) + _history_header.size
+    if old is None and os.path.getsize(path) + records.itemsize * len(records) <= history_size:
+        with open(path, 'r+b') as f:
+            f.seek(len(_history_magic))
+            f.write(_history_header.pack(start, now))
+            f.seek(0, os.SEEK_END)
+            records.tofile(f)
+        return
+
+    if old is None:
+        old = array('I')
+        with open(path, 'rb') as f:
+            f.seek(size)
+            old.frombytes(f.read())
+    old.extend(records)
+
+    # drop the oldest records down to three quarters of the maximum size,
+    # and the rest of the commit of the last dropped record; the history
+    # is complete from the time of that commit on
+    limit = (history_size - size) * 3 // 4 // (old.itemsize * _record_size) * _record_size
+    if len(old) * old.itemsize > history_size - size:
+        cut = len(old) - limit
+        start = old[cut - _record_size]
+        while cut < len(old) and old[cut] == start:
+            cut += _record_size
+        del old[:cut]
+
+    tmp = f'{path}.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(_history_magic + _history_header.pack(start, now))
+        old.tofile(f)
+    os.replace(tmp, path)
+
+
+def save_allocation(allocators: dict, path: str = cgnat_allocation_state,
+                    changes: array = None, history: str = None):
+    """
+    Save the allocators of all rules, replacing the file atomically. Next to
+    the allocation sorted by internal address, the owners of all slots are
+    saved for lookups by external address and port.
+
+    changes are the history records of the commit, see allocation_changes(),
+    appended to the history file if given.
+    """
+    now = int(time.time())
+    previous_time = _state_time(path)
+    header = {'version': _state_version, 'time': now,
+              'rules': {rule: alloc._header() for rule, alloc in allocators.items()}}
+    tmp = f'{path}.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(json.dumps(header).encode() + b'\n')
+        for alloc in allocators.values():
+            alloc.internal.tofile(f)
+            alloc.slot.tofile(f)
+            alloc.owners().tofile(f)
+    os.replace(tmp, path)
+
+    if history and changes is not None:
+        _append_history(history, now, previous_time, changes)
+
+
+def release_allocation(path: str = cgnat_allocation_state, history: str = None):
+    """
+    Remove the saved allocation, recording the release of all its blocks in
+    the history if given
+    """
+    previous_time = _state_time(path)
+    allocators = load_allocation(path)
+    if history and allocators is not None:
+        records = array('I')
+        for alloc in allocators.values():
+            records.extend(allocation_changes(alloc, alloc.internal))
+        _append_history(history, int(time.time()), previous_time, records)
+        # the history now ends with an empty allocation
+        with open(history, 'r+b') as f:
+            f.seek(len(_history_magic))
+            start, _ = _history_header.unpack(f.read(_history_header.size))
+            f.seek(len(_history_magic))
+            f.write(_history_header.pack(start, 0))
+    if os.path.isfile(path):
+        os.unlink(path)
+
+
+def _read_allocation(path: str, owners: bool):
+    with open(path, 'rb') as f:
+        header = json.loads(f.readline())
+        if header.get('version') != _state_version:
+            raise ValueError(f'unsupported version {header.get("version")}')
+        allocators = {}
+        for rule, params in header['rules'].items():
+            alloc = PortBlockAllocator(params['externals'], params['port_range'],
+                                       params['port_count'])
+            alloc.internal.fromfile(f, params['count'])
+            alloc.slot.fromfile(f, params['count'])
+            if owners:
+                alloc.owner = array('I')
+                alloc.owner.fromfile(f, params['slots'])
+            else:
+                f.seek(4 * params['slots'], os.SEEK_CUR)
+            allocators[rule] = alloc
+    return header, allocators
+
+
+def load_allocation(path: str = cgnat_allocation_state) -> dict:
+    """
+    Return the allocators of all rules saved by save_allocation, or None if
+    there is no or no usable saved allocation
+    """
+    try:
+        return _read_allocation(path, owners=False)[1]
+    except (OSError, ValueError, KeyError, EOFError):
+        return None
+
+
+class AllocationHistory:
+    """
+    Allocation changes saved by save_allocation, oldest first. Raises
+    OSError or ValueError if there is no usable history.
+    """
+    def __init__(self, path: str = cgnat_allocation_history):
+        with open(path, 'rb') as f:
+            # changes from this time on are complete
+            self.start, self.state_time = _read_history_header(f)
+            records = array('I')
+            records.frombytes(f.read())
+        if len(records) % _record_size:
+            raise ValueError(f'invalid allocation history {path}')
+        self.time = records[0::_record_size]
+        self.event = records[1::_record_size]
+        self.internal = records[2::_record_size]
+        self.external = records[3::_record_size]
+        self.ports = records[4::_record_size]
+        self._by_internal = None
+        self._by_external = None
+
+    def _index(self, column) -> dict:
+        res = {}
+        for i, addr in enumerate(column):
+            res.setdefault(addr, []).append(i)
+        return res
+
+    def by_internal(self, addr: int) -> list:
+        """Positions of the records of an internal address"""
+        if self._by_internal is None:
+            self._by_internal = self._index(self.internal)
+        return self._by_internal.get(addr, [])
+
+    def by_external(self, addr: int) -> list:
+        """Positions of the records of an external address"""
+        if self._by_external is None:
+            self._by_external = self._index(self.external)
+        return self._by_external.get(addr, [])
+
+    def block(self, i: int) -> tuple[int, int, int]:
+        """External address, first and last port of a record"""
+        return self.external[i], self.ports[i] >> 16, self.ports[i] & 0xffff
+
+    def allocated(self, internal: int, block: tuple, when: int):
+        """Time the block was last allocated to internal up to when, None if
+        it was allocated before the start of the history"""
+        for i in reversed(self.by_internal(internal)):
+            if (self.time[i] <= when and self.event[i] == HISTORY_ALLOCATE
+                    and self.block(i) == block):
+                return self.time[i]
+        return None
+
+
+class AllocationIndex:
+    """
+    Lookups in the allocation saved at the last commit, and with history in
+    the allocations at earlier times
+
+    Internal addresses are found by binary search in the allocation sorted by
+    internal address; external addresses by binary search in the sorted
+    external addresses of all rules, their ports through the slot owners.
+    For an earlier time, the changes made since are undone. Raises OSError
+    or ValueError if there is no usable saved allocation.
+    """
+    def __init__(self, path: str = cgnat_allocation_state,
+                 history: str = cgnat_allocation_history):
+        try:
+            header, self.allocators = _read_allocation(path, owners=True)
+        except (KeyError, EOFError) as e:
+            raise ValueError(f'invalid allocation file {path}') from e
+        self.time = header['time']
+
+        self.history = None
+        if history:
+            try:
+                self.history = AllocationHistory(history)
+            except (OSError, ValueError, struct.error):
+                pass
+            # a history not ending with this allocation cannot be used
+            if self.history and self.history.state_time != self.time:
+                self.history = None
+
+        externals = sorted((addr, index, alloc)
+                           for alloc in self.allocators.values()
+                           for index, addr in enumerate(alloc.externals))
+        self._external = array('I', (addr for addr, _, _ in externals))
+        self._external_ref = [(alloc, index) for _, index, alloc in externals]
+
+    @property
+    def start(self) -> int:
+        """Earliest time allocations can be looked up for"""
+        return self.history.start if self.history else self.time
+
+    def _past(self, when) -> bool:
+        if when is None or when >= self.time:
+            return False
+        if when < self.start:
+            raise ValueError(f'no allocation history before {self.start}')
+        return True
+
+    def _entry(self, internal, block, when=None):
+        external, first, last = block
+        allocated = None
+        if self.history:
+            allocated = self.history.allocated(internal, block,
+                                               self.time if when is None else when)
+        return {'internal_address': ntoa(internal),
+                'external_address': ntoa(external),
+                'port_range': f'{first}-{last}',
+                'allocated': allocated}
+
+    def all(self):
+        """Yield all allocations"""
+        for alloc in self.allocators.values():
+            for addr, slot in zip(alloc.internal, alloc.slot):
+                yield self._entry(addr, alloc.block(slot))
+
+    def internal(self, addr: int, when: int = None) -> list:
+        """Return the allocation of an internal address, at time when if given"""
+        blocks = []
+        for alloc in self.allocators.values():
+            slot = alloc.find(addr)
+            if slot is not None:
+                blocks.append(alloc.block(slot))
+
+        if self._past(when):
+            history = self.history
+            for i in reversed(history.by_internal(addr)):
+                if history.time[i] <= when:
+                    break
+                block = history.block(i)
+                if history.event[i] == HISTORY_ALLOCATE:
+                    if block in blocks:
+                        blocks.remove(block)
+                else:
+                    blocks.append(block)
+
+        return [self._entry(addr, block, when) for block in blocks]
+
+    def external(self, addr: int, port: int = None, when: int = None) -> list:
+        """
+        Return the allocations on an external address, only the one of the
+        port if given, at time when if given
+        """
+        owners = {}
+        lo = bisect_left(self._external, addr)
+        hi = bisect_right(self._external, addr, lo)
+        for alloc, index in self._external_ref[lo:hi]:
+            first_slot = index * alloc.blocks
+            if port is None:
+                slots = range(first_slot, first_slot + alloc.blocks)
+            else:
+                block = (port - alloc.start_port) // alloc.port_count
+                if port < alloc.start_port or block >= alloc.blocks:
+                    continue
+                slots = [first_slot + block]
+            for slot in slots:
+                if alloc.owner[slot]:
+                    owners[alloc.block(slot)] = alloc.owner[slot]
+
+        if self._past(when):
+            history = self.history
+            for i in reversed(history.by_external(addr)):
+                if history.time[i] <= when:
+                    break
+                block = history.block(i)
+                if port is not None and not block[1] <= port <= block[2]:
+                    continue
+                if history.event[i] == HISTORY_ALLOCATE:
+                    if owners.get(block) == history.internal[i]:
+                        del owners[block]
+                else:
+                    owners[block] = history.internal[i]
+
+        return [self._entry(owners[block], block, when) for block in sorted(owners)]
@@ -59,6 +59,17 @@ def apply_func(self, func: Callable):
                 self.config_tree = self.checkpoint
             raise ComposeConfigError(e) from e
 
+    def apply_batch(self, ops: list) -> list:
+        """Apply a list of operations to the config tree in one pass; see
+        ConfigTree.apply_batch for the format of ops and results.
+        """
+        res = []
+        def batch(config_tree: ConfigTree):
+            res.extend(config_tree.apply_batch(ops))
+
+        self.apply_func(batch)
+        return res
+
     def apply_file(self, func_file: str, func_name: str):
         """Apply named function from file.
         """
@@ -279,6 +279,43 @@ def get_cached_root_dict(self, effective=False):
 
         return config_dict
 
+    def get_cached_sub_dict(self, path: list, effective=False) -> dict:
+        """
+        Returns the sub-dict of the config under path, as get_sub_dict()
+        of the root dict would, without serializing the complete config:
+        only the subtree under path is converted, and cached per path.
+        If the root dict is already cached, or path is a leaf node, the
+        root dict is used.
+        """
+        if not path or effective in self._dict_cache:
+            return get_sub_dict(self.get_cached_root_dict(effective), path)
+
+        key = (effective, tuple(path))
+        if key in self._dict_cache:
+            return self._dict_cache[key]
+
+        config = self.get_config_tree(effective)
+        if not config or not config.exists(path):
+            sub_dict = {}
+        elif config.is_leaf(path):
+            return get_sub_dict(self.get_cached_root_dict(effective), path)
+        else:
+            subtree = config.get_subtree(path)
+            sub_dict = {path[-1]: json.loads(subtree.to_json())}
+
+        self._dict_cache[key] = sub_dict
+
+        return sub_dict
+
+    def _get_sub_dict(self, lpath: list, effective=False, get_first_key=False):
+        conf_dict = self.get_cached_sub_dict(lpath, effective)
+        if get_first_key and lpath and conf_dict:
+            tmp = next(iter(conf_dict.values()))
+            if not isinstance(tmp, dict):
+                raise TypeError("Data under node is not of type dict")
+            conf_dict = tmp
+        return conf_dict
+
     def verify_mangling(self, key_mangling):
         if not (isinstance(key_mangling, tuple) and \
                 (len(key_mangling) == 2) and \
@@ -310,8 +347,7 @@ def get_config_dict(self, path=[], effective=False, key_mangling=None,
         del kwargs['with_pki']
 
         lpath = self._make_path(path)
-        root_dict = self.get_cached_root_dict(effective)
-        conf_dict = get_sub_dict(root_dict, lpath, get_first_key=get_first_key)
+        conf_dict = self._get_sub_dict(lpath, effective, get_first_key)
 
         rpath = lpath if get_first_key else lpath[:-1]
 
@@ -344,8 +380,8 @@ def get_config_dict(self, path=[], effective=False, key_mangling=None,
 
             conf_dict['pki'] = pki_dict
 
-        interfaces_root = root_dict.get('interfaces', {})
-        setattr(conf_dict, 'interfaces_root', interfaces_root)
+        interfaces_root = self.get_cached_sub_dict(['interfaces'], effective)
+        setattr(conf_dict, 'interfaces_root', interfaces_root.get('interfaces', {}))
 
         # save optional args for a call to get_config_defaults
         setattr(conf_dict, '_dict_kwargs', kwargs)
@@ -356,8 +392,7 @@ def get_config_defaults(self, path=[], effective=False, key_mangling=None,
                             no_tag_node_value_mangle=False, get_first_key=False,
                             recursive=False) -> dict:
         lpath = self._make_path(path)
-        root_dict = self.get_cached_root_dict(effective)
-        conf_dict = get_sub_dict(root_dict, lpath, get_first_key)
+        conf_dict = self._get_sub_dict(lpath, effective, get_first_key)
 
         defaults = relative_defaults(lpath, conf_dict,
                                      get_first_key=get_first_key,
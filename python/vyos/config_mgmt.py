@@ -23,9 +23,8 @@
 from typing import Tuple
 from filecmp import cmp
 from datetime import datetime
-from textwrap import dedent
-from pathlib import Path
 from tabulate import tabulate
+from glob import glob
 from shutil import copy, chown
 from urllib.parse import urlsplit
 from urllib.parse import urlunsplit
@@ -36,6 +35,10 @@
 from vyos.configsession import ConfigSession
 from vyos.configsession import ConfigSessionError
 from vyos.configtree import show_diff
+from vyos.config_revisions import RevisionStore
+from vyos.config_revisions import RevisionStoreError
+from vyos.config_revisions import config_section
+from vyos.config_revisions import text_hash
 from vyos.load_config import load
 from vyos.load_config import LoadConfigError
 from vyos.defaults import directories
@@ -62,6 +65,8 @@
 config_file = os.path.join(directories['config'], 'config.boot')
 archive_dir = os.path.join(directories['config'], 'archive')
 archive_config_file = os.path.join(archive_dir, 'config.boot')
+revision_dir = os.path.join(archive_dir, 'revisions')
+# archive rotated by logrotate, imported into the revision store
 commit_log_file = os.path.join(archive_dir, 'commits')
 logrotate_conf = os.path.join(archive_dir, 'lr.conf')
 logrotate_state = os.path.join(archive_dir, 'lr.state')
@@ -100,11 +105,9 @@ def unsaved_commits(allow_missing_config=False) -> bool:
 
 
 def get_file_revision(rev: int):
-    revision = os.path.join(archive_dir, f'config.boot.{rev}.gz')
     try:
-        with gzip.open(revision) as f:
-            r = f.read().decode()
-    except FileNotFoundError:
+        r = RevisionStore(revision_dir).text(rev)
+    except RevisionStoreError:
         logger.warning(f'commit revision {rev} not available')
         return ''
     return r
@@ -116,14 +119,11 @@ def get_config_tree_revision(rev: int):
 
 
 def is_node_revised(path: list = [], rev1: int = 1, rev2: int = 0) -> bool:
-    from vyos.configtree import DiffTree
-
-    left = get_config_tree_revision(rev1)
-    right = get_config_tree_revision(rev2)
-    diff_tree = DiffTree(left, right)
-    if diff_tree.add.exists(path) or diff_tree.sub.exists(path):
+    try:
+        return RevisionStore(revision_dir).is_revised(path, rev1, rev2)
+    except RevisionStoreError as e:
+        logger.warning(f'cannot compare commit revisions: {e}')
         return True
-    return False
 
 
 class ConfigMgmtError(Exception):
@@ -178,6 +178,9 @@ def __init__(self, session_env=None, config=None):
         self.active_config = config._running_config
         self.working_config = config._session_config
 
+        self._store = RevisionStore(revision_dir)
+        self._archive_text = None
+
     # Console script functions
     #
     def commit_confirm(
@@ -260,8 +263,7 @@ def confirm(self) -> Tuple[str, int]:
         entry = self._read_tmp_log_entry()
 
         if self._archive_active_config():
-            self._add_log_entry(**entry)
-            self._update_archive()
+            self._add_revision(**entry)
 
         if self.reboot_unconfirmed:
             msg = 'Reboot timer stopped'
@@ -325,11 +327,9 @@ def rollback(self, rev: int, no_prompt: bool = False) -> Tuple[str, int]:
         if rc != 0:
             raise ConfigMgmtError(out)
 
-        path = os.path.join(archive_dir, f'config.boot.{rev}.gz')
-        with gzip.open(path) as f:
-            config = f.read()
+        config = self._get_file_revision(rev)
         try:
-            with open(rollback_config, 'wb') as f:
+            with open(rollback_config, 'w') as f:
                 f.write(config)
             copy(rollback_config, config_file)
         except OSError as e:
@@ -372,6 +372,9 @@ def compare(
         revision n vs. revision m; working version vs. active version;
         or working version vs. saved version.
         """
+        # revisions are only parsed as far as needed for the diff of path
+        path = [] if commands else self.edit_path
+
         ct1 = self.active_config
         ct2 = self.working_config
         msg = 'No changes between working and active configurations.\n'
@@ -382,7 +385,7 @@ def compare(
         if rev1 is not None:
             if not self._check_revision_number(rev1):
                 return f'Invalid revision number {rev1}', 1
-            ct1 = self._get_config_tree_revision(rev1)
+            ct1 = self._get_config_tree_revision(rev1, path)
             ct2 = self.working_config
             msg = f'No changes between working and revision {rev1} configurations.\n'
         if rev2 is not None:
@@ -390,11 +393,10 @@ def compare(
                 return f'Invalid revision number {rev2}', 1
             # compare older to newer
             ct2 = ct1
-            ct1 = self._get_config_tree_revision(rev2)
+            ct1 = self._get_config_tree_revision(rev2, path)
             msg = f'No changes between revisions {rev2} and {rev1} configurations.\n'
 
         out = ''
-        path = [] if commands else self.edit_path
         try:
             if commands:
                 out = show_diff(ct1, ct2, path=path, commands=True)
@@ -441,17 +443,25 @@ def initialize_revision(self):
         except OSError as e:
             logger.warning(f'cannot create {json_dir}: {e}')
 
-        self._add_logrotate_conf()
+        # the commit hooks of config group members update the archive
+        for directory in (archive_dir, revision_dir, self._store.objects_dir):
+            try:
+                os.makedirs(directory, exist_ok=True)
+                chown(directory, group='vyattacfg')
+                os.chmod(directory, 0o2775)
+            except OSError as e:
+                logger.warning(f'cannot set permissions of {directory}: {e}')
+
+        self._import_logrotate_archive()
 
-        if not os.path.exists(commit_log_file) or self._get_number_of_revisions() == 0:
+        if self._get_number_of_revisions() == 0:
             user = self._get_user()
             via = 'init'
             comment = ''
             # add empty init config before boot-config load for revision
             # and diff consistency
             if self._archive_active_config():
-                self._add_log_entry(user, via, comment)
-                self._update_archive()
+                self._add_revision(user, via, comment)
 
         os.umask(mask)
 
@@ -466,8 +476,7 @@ def commit_revision(self):
             return
 
         if self._archive_active_config():
-            self._add_log_entry()
-            self._update_archive()
+            self._add_revision()
 
     def commit_archive(self):
         """Upload config to remote archive."""
@@ -498,11 +507,16 @@ def get_raw_log_data(self) -> list:
         """Return list of dicts of log data:
         keys: [timestamp, user, commit_via, commit_comment]
         """
-        log = self._get_log_entries()
         res_l = []
-        for line in log:
-            d = self._get_log_entry(line)
-            res_l.append(d)
+        for entry in self._get_revision_entries():
+            res_l.append(
+                {
+                    'user': entry['user'],
+                    'commit_via': entry['commit_via'],
+                    'commit_comment': entry['commit_comment'],
+                    'timestamp': str(entry['timestamp']),
+                }
+            )
 
         return res_l
 
@@ -570,28 +584,50 @@ def _get_saved_config_tree(self):
     def _get_file_revision(self, rev: int):
         if rev not in range(0, self._get_number_of_revisions()):
             raise ConfigMgmtError('revision not available')
-        revision = os.path.join(archive_dir, f'config.boot.{rev}.gz')
-        with gzip.open(revision) as f:
-            r = f.read().decode()
+        try:
+            r = self._store.text(rev)
+        except RevisionStoreError as e:
+            raise ConfigMgmtError(e) from e
         return r
 
-    def _get_config_tree_revision(self, rev: int):
+    def _get_config_tree_revision(self, rev: int, path: list = []):
         c = self._get_file_revision(rev)
+        if path:
+            c = config_section(c, path) or '\n'
         return ConfigTree(c)
 
-    def _add_logrotate_conf(self):
-        conf: str = dedent(f"""\
-        {archive_config_file} {{
-            su root vyattacfg
-            rotate {self.max_revisions}
-            start 0
-            compress
-            copy
-        }}
-        """)
-        conf_file = Path(logrotate_conf)
-        conf_file.write_text(conf)
-        conf_file.chmod(0o644)
+    def _import_logrotate_archive(self):
+        # Revisions archived by logrotate with earlier versions
+        if self._get_number_of_revisions() > 0 or not os.path.exists(commit_log_file):
+            return
+
+        with open(commit_log_file) as f:
+            entries = [self._get_log_entry(line) for line in f.readlines()]
+
+        for rev in reversed(range(len(entries))):
+            if not entries[rev]:
+                continue
+            revision = os.path.join(archive_dir, f'config.boot.{rev}.gz')
+            try:
+                with gzip.open(revision) as f:
+                    text = f.read().decode()
+            except (OSError, EOFError) as e:
+                logger.warning(f'cannot import commit revision {rev}: {e}')
+                continue
+            self._store.add(
+                text,
+                user=entries[rev]['user'],
+                commit_via=entries[rev]['commit_via'],
+                commit_comment=entries[rev]['commit_comment'],
+                timestamp=int(entries[rev]['timestamp']),
+                max_revisions=self.max_revisions,
+            )
+
+        for revision in glob(os.path.join(archive_dir, 'config.boot.*.gz')):
+            os.unlink(revision)
+        for file in (commit_log_file, logrotate_conf, logrotate_state):
+            if os.path.exists(file):
+                os.unlink(file)
 
     def _archive_active_config(self) -> bool:
         save_to_tmp = boot_configuration_complete() or not os.path.isfile(
@@ -618,42 +654,43 @@ def _archive_active_config(self) -> bool:
                 logger.warning(f'cannot create {config_json}: {e}')
 
         try:
-            if cmp(cmp_saved, archive_config_file, shallow=False):
-                os.unlink(cmp_saved)
-                os.umask(mask)
-                return False
-        except FileNotFoundError:
-            pass
-
-        rc, out = rc_cmd(f'sudo mv {cmp_saved} {archive_config_file}')
-        os.umask(mask)
-
-        if rc != 0:
-            logger.critical(f'mv file to archive failed: {out}')
+            with open(cmp_saved) as f:
+                text = f.read()
+            os.unlink(cmp_saved)
+        except OSError as e:
+            logger.critical(f'read of saved config failed: {e}')
+            os.umask(mask)
             return False
 
-        return True
+        entries = self._get_revision_entries()
+        if entries and entries[0]['hash'] == text_hash(text):
+            os.umask(mask)
+            return False
 
-    @staticmethod
-    def _update_archive():
-        cmd = f'sudo logrotate -f -s {logrotate_state} {logrotate_conf}'
-        rc, out = rc_cmd(cmd)
-        if rc != 0:
-            logger.critical(f'logrotate failure: {out}')
+        # the latest revision is kept as a file for commit-archive uploads
+        try:
+            tmp = f'{archive_config_file}.{ext}'
+            with open(tmp, 'w') as f:
+                f.write(text)
+            os.replace(tmp, archive_config_file)
+        except OSError as e:
+            logger.critical(f'write to archive failed: {e}')
+            os.umask(mask)
+            return False
 
-    @staticmethod
-    def _get_log_entries() -> list:
-        """Return lines of commit log as list of strings"""
-        entries = []
-        if os.path.exists(commit_log_file):
-            with open(commit_log_file) as f:
-                entries = f.readlines()
+        os.umask(mask)
+        self._archive_text = text
+        return True
 
-        return entries
+    def _get_revision_entries(self) -> list:
+        try:
+            return self._store.entries()
+        except RevisionStoreError as e:
+            logger.critical(e)
+            return []
 
     def _get_number_of_revisions(self) -> int:
-        log_entries = self._get_log_entries()
-        return len(log_entries)
+        return len(self._get_revision_entries())
 
     def _check_revision_number(self, rev: int) -> bool:
         self.num_revisions = self._get_number_of_revisions()
@@ -749,13 +786,14 @@ def _read_tmp_log_entry(self) -> dict:
 
         return self._get_log_entry(entry)
 
-    def _add_log_entry(
+    def _add_revision(
         self,
         user: str = '',
         commit_via: str = '',
         commit_comment: str = '',
         timestamp: Optional[int] = None,
     ):
+        # add the config archived by _archive_active_config
         mask = os.umask(0o113)
 
         entry = self._new_log_entry(
@@ -764,16 +802,18 @@ def _add_log_entry(
             commit_comment=commit_comment,
             timestamp=timestamp,
         )
-
-        log_entries = self._get_log_entries()
-        log_entries.insert(0, entry)
-        if len(log_entries) > self.max_revisions:
-            log_entries = log_entries[:-1]
+        d = self._get_log_entry(entry)
 
         try:
-            with open(commit_log_file, 'w') as f:
-                f.writelines(log_entries)
-        except OSError as e:
+            self._store.add(
+                self._archive_text,
+                user=d['user'],
+                commit_via=d['commit_via'],
+                commit_comment=d['commit_comment'],
+                timestamp=int(d['timestamp']),
+                max_revisions=self.max_revisions,
+            )
+        except (OSError, RevisionStoreError) as e:
             logger.critical(e)
 
         os.umask(mask)
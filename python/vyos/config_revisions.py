@@ -0,0 +1,311 @@
+# Copyright 2024 VyOS maintainers and contributors <maintainers@vyos.io>
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this library.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Store of config.boot revisions
+
+Revision texts are stored as compressed objects named by the SHA-256 of
+their content, so identical revisions share an object. An object holds
+either the full text or the line differences to the object of the previous
+revision; a full snapshot is stored at least every snapshot_interval
+revisions, bounding the work to rebuild one. The index lists the revisions,
+newest first, with the commit log data of each.
+"""
+
+import hashlib
+import json
+import os
+import shlex
+import zlib
+
+from difflib import SequenceMatcher
+
+index_version = 1
+snapshot_interval = 10
+# beyond this many line pairs to compare, a full snapshot is stored
+max_delta_work = 25_000_000
+
+
+class RevisionStoreError(Exception):
+    pass
+
+
+def text_hash(text: str) -> str:
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+def make_delta(base: list, lines: list) -> list:
+    """
+    Operations rebuilding lines from base: [start, end] copies lines of
+    base, a list of strings inserts them. None if too costly to compute.
+    """
+    n = min(len(base), len(lines))
+    prefix = 0
+    while prefix < n and base[prefix] == lines[prefix]:
+        prefix += 1
+    suffix = 0
+    while suffix < n - prefix and base[-1 - suffix] == lines[-1 - suffix]:
+        suffix += 1
+
+    # commits usually change a small part of the config, only the lines
+    # between the common prefix and suffix are compared
+    old = base[prefix:len(base) - suffix]
+    new = lines[prefix:len(lines) - suffix]
+    if len(old) * len(new) > max_delta_work:
+        return None
+
+    ops = []
+    if prefix:
+        ops.append([0, prefix])
+    matcher = SequenceMatcher(None, old, new, autojunk=False)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == 'equal':
+            ops.append([prefix + i1, prefix + i2])
+        elif j2 > j1:
+            ops.append(new[j1:j2])
+    if suffix:
+        ops.append([len(base) - suffix, len(base)])
+    return ops
+
+
+def apply_delta(base: list, ops: list) -> list:
+    lines = []
+    for op in ops:
+        if op and isinstance(op[0], int):
+            lines.extend(base[op[0]:op[1]])
+        else:
+            lines.extend(op)
+    return lines
+
+
+def _node_words(line: str) -> list:
+    line = line.strip().removesuffix('{').strip()
+    try:
+        return shlex.split(line)
+    except ValueError:
+        return line.split()
+
+
+def config_section(text: str, path: list) -> str:
+    """
+    The lines of a config.boot text for the node at path and its parent
+    nodes. The result is a valid config, so diffs limited to path need not
+    parse the whole config.
+    """
+    if not path:
+        return text
+
+    out = []
+    # per open node: number of path elements matched, None if not on the
+    # path, and whether it is inside the requested node
+    stack = []
+    comment = None
+    for line in text.splitlines(keepends=True):
+        stripped = line.strip()
+        opens = stripped.endswith('{')
+        matched, inside = stack[-1] if stack else (0, False)
+
+        if stripped == '}':
+            if stack and (stack[-1][0] is not None or stack[-1][1]):
+                out.append(line)
+            if stack:
+                stack.pop()
+            continue
+        if inside:
+            out.append(line)
+            if opens:
+                stack.append((None, True))
+            continue
+        if stripped.startswith('/*'):
+            comment = line
+            continue
+        if matched is None or not stripped or stripped.startswith('//'):
+            if opens:
+                stack.append((None, False))
+            comment = None
+            continue
+
+        words = _node_words(stripped)
+        rest = path[matched:]
+        consumed = 0
+        if words and words[0] == rest[0]:
+            if len(rest) == 1:
+                consumed = 1
+            elif len(words) > 1 and words[1] == rest[1]:
+                consumed = 2
+            elif len(words) == 1 and opens:
+                consumed = 1
+
+        if consumed and matched + consumed == len(path):
+            if comment:
+                out.append(comment)
+            out.append(line)
+            if opens:
+                stack.append((None, True))
+        elif consumed and opens:
+            out.append(line)
+            stack.append((matched + consumed, False))
+        elif opens:
+            stack.append((None, False))
+        comment = None
+
+    return ''.join(out)
+
+
+class RevisionStore:
+    """
+    % store = RevisionStore('/config/archive/revisions')
+    % store.add(text, user='vyos', commit_via='cli')
+    % store.text(0) == text
+    True
+    """
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.objects_dir = os.path.join(directory, 'objects')
+        self.index_file = os.path.join(directory, 'index.json')
+        self._index = None
+        self._texts = {}
+
+    @property
+    def index(self) -> dict:
+        if self._index is None:
+            try:
+                with open(self.index_file) as f:
+                    self._index = json.load(f)
+            except FileNotFoundError:
+                self._index = {'version': index_version, 'revisions': [], 'objects': {}}
+            except (OSError, ValueError) as e:
+                raise RevisionStoreError(f'cannot read {self.index_file}: {e}') from e
+        return self._index
+
+    def __len__(self) -> int:
+        return len(self.index['revisions'])
+
+    def entries(self) -> list:
+        """Commit log data of the revisions, newest first"""
+        return [dict(entry) for entry in self.index['revisions']]
+
+    def entry(self, rev: int) -> dict:
+        if not 0 <= rev < len(self):
+            raise RevisionStoreError(f'revision {rev} not available')
+        return dict(self.index['revisions'][rev])
+
+    def _object_file(self, digest: str) -> str:
+        return os.path.join(self.objects_dir, digest)
+
+    def _read_object(self, digest: str) -> dict:
+        try:
+            with open(self._object_file(digest), 'rb') as f:
+                return json.loads(zlib.decompress(f.read()))
+        except (OSError, ValueError, zlib.error) as e:
+            raise RevisionStoreError(f'cannot read object {digest}: {e}') from e
+
+    def _write(self, path: str, data: bytes):
+        tmp = f'{path}.{os.getpid()}.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, path)
+
+    def _object_text(self, digest: str) -> str:
+        if digest in self._texts:
+            return self._texts[digest]
+
+        # walk back to the nearest full snapshot, then apply the deltas
+        chain = []
+        while digest not in self._texts:
+            obj = self._read_object(digest)
+            if 'text' in obj:
+                self._texts[digest] = obj['text']
+                break
+            chain.append((digest, obj))
+            digest = obj['base']
+
+        text = self._texts[digest]
+        for digest, obj in reversed(chain):
+            lines = apply_delta(text.splitlines(keepends=True), obj['ops'])
+            text = ''.join(lines)
+            self._texts[digest] = text
+        return text
+
+    def text(self, rev: int) -> str:
+        return self._object_text(self.entry(rev)['hash'])
+
+    def section(self, rev: int, path: list) -> str:
+        return config_section(self.text(rev), path)
+
+    def is_revised(self, path: list = [], rev1: int = 1, rev2: int = 0) -> bool:
+        """Whether the node at path differs between revisions rev1 and rev2"""
+        if self.entry(rev1)['hash'] == self.entry(rev2)['hash']:
+            return False
+        return self.section(rev1, path) != self.section(rev2, path)
+
+    def add(self, text: str, user: str, commit_via: str, commit_comment: str = 'commit',
+            timestamp: int = 0, max_revisions: int = 0) -> str:
+        """Add text as revision 0, returns its hash"""
+        index = self.index
+        digest = text_hash(text)
+
+        if digest not in index['objects']:
+            os.makedirs(self.objects_dir, exist_ok=True)
+            obj = None
+            meta = {'base': None, 'depth': 0}
+            if index['revisions']:
+                base = index['revisions'][0]['hash']
+                depth = index['objects'][base]['depth'] + 1
+                if depth < snapshot_interval:
+                    ops = make_delta(self._object_text(base).splitlines(keepends=True),
+                                     text.splitlines(keepends=True))
+                    if ops is not None:
+                        obj = {'base': base, 'ops': ops}
+                        meta = {'base': base, 'depth': depth}
+            if obj is None:
+                obj = {'text': text}
+            self._write(self._object_file(digest), zlib.compress(json.dumps(obj).encode()))
+            index['objects'][digest] = meta
+            self._texts[digest] = text
+
+        entry = {
+            'hash': digest,
+            'timestamp': timestamp,
+            'user': user,
+            'commit_via': commit_via,
+            'commit_comment': commit_comment,
+        }
+        index['revisions'].insert(0, entry)
+        if max_revisions > 0:
+            del index['revisions'][max_revisions:]
+
+        removed = self._unreferenced()
+        for unused in removed:
+            del index['objects'][unused]
+            self._texts.pop(unused, None)
+        self._write(self.index_file, json.dumps(index, indent=1).encode())
+        for unused in removed:
+            try:
+                os.unlink(self._object_file(unused))
+            except FileNotFoundError:
+                pass
+
+        return digest
+
+    def _unreferenced(self) -> list:
+        objects = self.index['objects']
+        needed = set()
+        for entry in self.index['revisions']:
+            digest = entry['hash']
+            while digest is not None and digest not in needed:
+                needed.add(digest)
+                digest = objects[digest]['base']
+        return [digest for digest in objects if digest not in needed]
@@ -0,0 +1,101 @@
+# Copyright 2024 VyOS maintainers and contributors <maintainers@vyos.io>
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this library.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Speculative preparation of commit scripts in vyos-configd
+
+The commit scripts of a batch have no ordering relation with each other.
+When the commit algorithm requests the first script of a batch, get_config
+and verify of all scripts of the batch are run in a pool of workers; these
+phases only read the config and the system. generate and apply are run by
+the daemon when the commit algorithm requests the script, so nothing is
+written for scripts which are not requested, for example after an earlier
+script failed.
+"""
+
+import logging
+import time
+import typing
+
+logger = logging.getLogger(__name__)
+
+
+class BatchPlan:
+    """
+    Prepared results of the commit scripts of one commit
+
+    batches are lists of commit script records, dispatch(records) submits
+    their preparation and returns a dict of record to a result object with
+    get(), as returned by multiprocessing.Pool.apply_async(). A prepared
+    result is a dict with at least the script arguments 'args' and the
+    'start' and 'end' times.
+    """
+    def __init__(self, batches: list[list[str]],
+                 dispatch: typing.Callable[[list[str]], dict], log=logger):
+        self.dispatch = dispatch
+        self.log = log
+        self.batches = {}
+        for batch in batches:
+            if len(batch) < 2:
+                continue
+            info = {'records': batch, 'pending': set(batch), 'results': [],
+                    'jobs': None, 'start': None}
+            for record in batch:
+                self.batches[record] = info
+
+    def __contains__(self, record: str) -> bool:
+        return record in self.batches
+
+    def result(self, record: str, args: list) -> typing.Optional[dict]:
+        """
+        Prepared result for record, None if the script must be run serially:
+        it is not part of a batch, its preparation failed to complete, or it
+        was prepared with arguments other than args
+        """
+        # pylint: disable=broad-exception-caught
+
+        info = self.batches.pop(record, None)
+        if info is None:
+            return None
+        if info['jobs'] is None:
+            info['start'] = time.monotonic()
+            info['jobs'] = self.dispatch(info['records'])
+            self.log.debug(f'dispatched batch: {info["records"]}')
+
+        try:
+            res = info['jobs'][record].get()
+        except Exception as e:
+            self.log.error(f'batch result for {record} unavailable: {e}')
+            res = None
+
+        info['pending'].discard(record)
+        if res is not None:
+            info['results'].append(res)
+        if not info['pending']:
+            self._report(info)
+
+        # the commit algorithm may call a script with arguments not derivable
+        # from the record
+        if res is None or res['args'] != args:
+            return None
+        return res
+
+    def _report(self, info: dict):
+        if not info['results']:
+            return
+        wall = max(r['end'] for r in info['results']) - info['start']
+        serial = sum(r['end'] - r['start'] for r in info['results'])
+        self.log.info(f'batch {info["records"]}: get_config/verify wall time '
+                      f'{wall:.3f}s, serial time {serial:.3f}s')
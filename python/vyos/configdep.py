@@ -201,6 +201,45 @@ def is_acyclic(d: dict) -> bool:
 
     return True
 
+def independent_batches(scripts: list[tuple[str, str, int]],
+                        d: dict) -> list[list[str]]:
+    """Partition commit scripts into batches without ordering relation
+
+    Each element of scripts is a tuple (record, target, priority), where
+    record is the name of the commit script with tag extension and target
+    the name of the conf_mode script. Scripts of equal priority which
+    neither set dependents nor are dependents of another script of the
+    commit are grouped into one batch; all others are returned as single
+    element batches. The input order, sorted by priority, is preserved.
+    """
+    # dependency dict keys are module names, values are script names
+    g = graph_from_dependency_dict(d)
+    targets = {canon_name(t) for (_, t, _) in scripts}
+    related = {canon_name(k) for k in g}
+    for k, v in g.items():
+        if canon_name(k) in targets:
+            related |= {canon_name(t) for t in v}
+
+    res = []
+    batch = []
+    prio = None
+    for record, target, priority in sorted(scripts, key=lambda x: x[2]):
+        if batch and priority != prio:
+            res.append(batch)
+            batch = []
+        prio = priority
+        if canon_name(target) in related:
+            if batch:
+                res.append(batch)
+                batch = []
+            res.append([record])
+            continue
+        batch.append(record)
+    if batch:
+        res.append(batch)
+
+    return res
+
 def check_dependency_graph(dependency_dir: str = dependency_dir,
                            supplement: str = None) -> bool:
     d = read_dependency_dict(dependency_dir=dependency_dir)
@@ -129,8 +129,21 @@ def get_commit_scripts(config) -> list:
     res = [x[1] for x in sorted(s, key=lambda x: x[0])]
     setattr(config, 'commit_scripts', res)
 
+    prio = {}
+    for p_priority, p_owner in s:
+        prio[p_owner] = min(p_priority, prio.get(p_owner, p_priority))
+    setattr(config, 'commit_script_priority', prio)
+
     return res
 
+def get_commit_script_priority(config) -> dict:
+    """Return a dict mapping the commit scripts to their priority
+    """
+    if not hasattr(config, 'commit_script_priority'):
+        get_commit_scripts(config)
+
+    return getattr(config, 'commit_script_priority')
+
 class ConfigDiff(object):
     """
     The class of config changes as represented by comparison between the
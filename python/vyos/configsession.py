@@ -224,11 +224,32 @@ def load_section(self, path: list, d: dict):
         except (ValueError, ConfigSessionError) as e:
             raise ConfigSessionError(e)
 
+    def __is_set(self, paths: list) -> list:
+        """Return for each path if it is already set in the session config,
+        querying a single parse of the session config with one batch
+        """
+        from vyos.configtree import ConfigTree
+
+        try:
+            config = ConfigTree(self.show_config([]))
+        except (ValueError, ConfigSessionError):
+            return [False] * len(paths)
+
+        ops = [('exists', p) for p in paths]
+        ops += [('return_values', p[:-1]) for p in paths]
+        res = config.apply_batch(ops)
+        exists, values = res[:len(paths)], res[len(paths):]
+
+        return [e or (v is not None and p[-1] in v)
+                for p, e, v in zip(paths, exists, values)]
+
     def set_section_tree(self, d: dict):
         try:
             if d:
-                for p in dict_to_paths(d):
-                    self.set(p)
+                paths = list(dict_to_paths(d))
+                for p, is_set in zip(paths, self.__is_set(paths)):
+                    if not is_set:
+                        self.set(p)
         except (ValueError, ConfigSessionError) as e:
             raise ConfigSessionError(e)
 
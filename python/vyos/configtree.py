@@ -393,6 +393,67 @@ def get_subtree(self, path, with_node=False):
         subt = ConfigTree(address=res)
         return subt
 
+    def apply_batch(self, ops):
+        """Apply a list of operations and return the per-operation results.
+        ops: list of tuples, one of
+                 ('set', path[, value[, replace]])
+                 ('delete', path)
+                 ('delete_value', path, value)
+                 ('exists', path)
+                 ('return_values', path)
+        All paths and values are checked and encoded before the first
+        operation is applied. Failing operations do not raise; the result
+        list holds, per operation, the status returned by libvyosconfig for
+        mutations (0 on success), a bool for 'exists' and the list of values,
+        or None if the path does not exist, for 'return_values'.
+        """
+        encoded = []
+        for op in ops:
+            name, path, *args = op
+            check_path(path)
+            path_str = " ".join(map(str, path)).encode()
+            if name == 'set':
+                value = args[0] if args else None
+                replace = args[1] if len(args) > 1 else True
+                value_str = None if value is None else str(value).encode()
+                encoded.append((name, path, path_str, value_str, replace))
+            elif name == 'delete_value':
+                encoded.append((name, path, path_str, args[0].encode(), None))
+            elif name in ('delete', 'exists', 'return_values'):
+                encoded.append((name, path, path_str, None, None))
+            else:
+                raise ValueError(f"Unsupported batch operation: {name}")
+
+        config = self.__config
+        migration = self.__migration
+        res = []
+        for name, path, path_str, value_str, replace in encoded:
+            if name == 'set':
+                if value_str is None:
+                    ret = self.__set_valueless(config, path_str)
+                elif replace:
+                    ret = self.__set_replace_value(config, path_str, value_str)
+                else:
+                    ret = self.__set_add_value(config, path_str, value_str)
+                if migration:
+                    value = None if value_str is None else value_str.decode()
+                    self.migration_log.info(f"- op: set path: {path} value: {value} replace: {replace}")
+            elif name == 'delete':
+                ret = self.__delete(config, path_str)
+                if migration and ret == 0:
+                    self.migration_log.info(f"- op: delete path: {path}")
+            elif name == 'delete_value':
+                ret = self.__delete_value(config, path_str, value_str)
+                if migration and ret == 0:
+                    self.migration_log.info(f"- op: delete_value path: {path} value: {value_str.decode()}")
+            elif name == 'exists':
+                ret = self.__exists(config, path_str) != 0
+            else:
+                ret = json.loads(self.__return_values(config, path_str).decode())
+            res.append(ret)
+
+        return res
+
 def show_diff(left, right, path=[], commands=False, libpath=LIBPATH):
     if left is None:
         left = ConfigTree(config_string='\n')
@@ -22,12 +22,14 @@
   'data' : '/usr/share/vyos/',
   'conf_mode' : f'{base_dir}/conf_mode',
   'op_mode' : f'{base_dir}/op_mode',
+  'op_templates' : '/opt/vyatta/share/vyatta-op/templates',
   'services' : f'{base_dir}/services',
   'config' : '/opt/vyatta/etc/config',
   'migrate' : '/opt/vyatta/etc/config-migrate/migrate',
   'activate' : f'{base_dir}/activate',
   'log' : '/var/log/vyatta',
   'templates' : '/usr/share/vyos/templates/',
+  'templates_compiled' : '/usr/share/vyos/templates-compiled/',
   'certbot' : '/config/auth/letsencrypt',
   'api_schema': f'{base_dir}/services/api/graphql/graphql/schema/',
   'api_client_op': f'{base_dir}/services/api/graphql/graphql/client_op/',
@@ -48,8 +50,14 @@
 
 commit_lock = os.path.join(directories['vyos_configdir'], '.lock')
 
+# Incremented by a commit post-hook, lets caches of the running config
+# know when it changed
+commit_generation = os.path.join(directories['vyos_configdir'], '.generation')
+
 component_version_json = os.path.join(directories['data'], 'component-versions.json')
 
+migration_timings_json = os.path.join(directories['data'], 'migration-timings.json')
+
 config_default = os.path.join(directories['data'], 'config.boot.default')
 
 rt_symbolic_names = {
@@ -14,18 +14,24 @@
 
 import csv
 import gzip
+import heapq
+import json
 import os
 import re
+import struct
+import sys
 
+from array import array
 from pathlib import Path
 from socket import AF_INET
 from socket import AF_INET6
 from socket import getaddrinfo
+from socket import inet_ntop
+from socket import inet_pton
 from time import strftime
 
 from vyos.remote import download
 from vyos.template import is_ipv4
-from vyos.template import render
 from vyos.utils.dict import dict_search_args
 from vyos.utils.dict import dict_search_recursive
 from vyos.utils.process import cmd
@@ -684,24 +690,206 @@ def parse_time(time):
 nftables_geoip_conf = '/run/nftables-geoip.conf'
 geoip_database = '/usr/share/vyos-geoip/dbip-country-lite.csv.gz'
 geoip_lock_file = '/run/vyos-geoip.lock'
+# Per-country address ranges preprocessed from geoip_database
+geoip_index = '/usr/share/vyos-geoip/dbip-country-lite.idx'
+# Set handle, country codes and index loaded into each GeoIP set
+geoip_state = '/run/vyos-geoip.state'
+
+geoip_index_magic = b'VYOSGEO1'
+# Elements per nft statement
+geoip_chunk_size = 10000
+
+def _geoip_source(database):
+    stat = os.stat(database)
+    return f'{stat.st_size}-{stat.st_mtime_ns}'
+
+def _geoip_int(family, address):
+    return int.from_bytes(inet_pton(family, address), 'big')
+
+def _geoip_add_range(ranges, start, end):
+    """
+    Append range to flat array [start, end, start, end, ...] sorted by start,
+    merging it into the last range if they overlap or are adjacent
+    """
+    if ranges and start <= ranges[-1] + 1:
+        ranges[-1] = max(ranges[-1], end)
+    else:
+        ranges.append(start)
+        ranges.append(end)
+
+def geoip_build_index(database=geoip_database, index=geoip_index):
+    """
+    Preprocess the GeoIP CSV database into an index of the merged address
+    ranges of each country. The previous index is kept as index.prev to
+    update existing sets by difference.
+    """
+    # IPv4 ranges are stored as native 32-bit integers, IPv6 ranges as
+    # lists of Python integers until written as 128-bit big-endian
+    ipv4 = {}
+    ipv6 = {}
+    try:
+        with gzip.open(database, mode='rt') as csv_fh:
+            for start, end, code in csv.reader(csv_fh):
+                code = code.lower()
+                if ':' in start:
+                    _geoip_add_range(ipv6.setdefault(code, []),
+                                     _geoip_int(AF_INET6, start), _geoip_int(AF_INET6, end))
+                else:
+                    _geoip_add_range(ipv4.setdefault(code, array('I')),
+                                     _geoip_int(AF_INET, start), _geoip_int(AF_INET, end))
+    except (OSError, EOFError, ValueError, csv.Error) as e:
+        print(f'Error: Failed to read GeoIP database: {e}')
+        return False
+
+    directory = {}
+    chunks = []
+    offset = 0
+    for family, ranges in [('ipv4', ipv4), ('ipv6', ipv6)]:
+        for code, values in ranges.items():
+            if family == 'ipv4':
+                data = values.tobytes()
+            else:
+                data = b''.join(value.to_bytes(16, 'big') for value in values)
+            directory.setdefault(code, {})[family] = [offset, len(values) // 2]
+            chunks.append(data)
+            offset += len(data)
+
+    header = json.dumps({'source': _geoip_source(database),
+                         'byteorder': sys.byteorder,
+                         'countries': directory}).encode()
+
+    if os.path.exists(index):
+        os.replace(index, f'{index}.prev')
+    tmp = f'{index}.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(geoip_index_magic + struct.pack('!I', len(header)) + header)
+        for data in chunks:
+            f.write(data)
+    os.replace(tmp, index)
+    return True
+
+class GeoIPIndex:
+    """
+    Read access to the ranges of an index built by geoip_build_index
+
+    % index = GeoIPIndex(geoip_index)
+    % index.ranges('se')[:1]
+    [(33554432, 33554687)]
+    """
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            if f.read(len(geoip_index_magic)) != geoip_index_magic:
+                raise ValueError(f'{path} is not a GeoIP index')
+            length, = struct.unpack('!I', f.read(4))
+            header = json.loads(f.read(length))
+        if header['byteorder'] != sys.byteorder:
+            raise ValueError(f'{path} was built on another architecture')
+        self.path = path
+        self.source = header['source']
+        self.countries = header['countries']
+        self.data_offset = len(geoip_index_magic) + 4 + length
+
+    def ranges(self, code, ipv6=False):
+        """Sorted, merged (start, end) integer ranges of the country"""
+        family = 'ipv6' if ipv6 else 'ipv4'
+        if family not in self.countries.get(code, {}):
+            return []
+        offset, count = self.countries[code][family]
+        size = 32 if ipv6 else 8
+        with open(self.path, 'rb') as f:
+            f.seek(self.data_offset + offset)
+            data = f.read(count * size)
+
+        if ipv6:
+            values = [int.from_bytes(data[i:i + 16], 'big') for i in range(0, len(data), 16)]
+        else:
+            values = array('I')
+            values.frombytes(data)
+        return list(zip(values[0::2], values[1::2]))
+
+    def set_ranges(self, codes, ipv6=False):
+        """Merged ranges of all countries in codes"""
+        out = []
+        for start, end in heapq.merge(*(self.ranges(code, ipv6) for code in codes)):
+            if out and start <= out[-1][1] + 1:
+                out[-1] = (out[-1][0], max(out[-1][1], end))
+            else:
+                out.append((start, end))
+        return out
 
-def geoip_load_data(codes=[]):
-    data = None
+def geoip_load_index(database=geoip_database, index=geoip_index):
+    """Return index of the database, rebuilding it if it is outdated"""
+    try:
+        current = GeoIPIndex(index)
+        if current.source == _geoip_source(database):
+            return current
+    except (OSError, ValueError, KeyError):
+        pass
 
-    if not os.path.exists(geoip_database):
-        return []
+    if not geoip_build_index(database, index):
+        return None
+    return GeoIPIndex(index)
 
+def geoip_previous_index(index=geoip_index):
     try:
-        with gzip.open(geoip_database, mode='rt') as csv_fh:
-            reader = csv.reader(csv_fh)
-            out = []
-            for start, end, code in reader:
-                if code.lower() in codes:
-                    out.append([start, end, code.lower()])
-            return out
-    except:
-        print('Error: Failed to open GeoIP database')
-    return []
+        return GeoIPIndex(f'{index}.prev')
+    except (OSError, ValueError, KeyError):
+        return None
+
+def _geoip_format(ranges, ipv6):
+    family = AF_INET6 if ipv6 else AF_INET
+    size = 16 if ipv6 else 4
+    out = []
+    for start, end in ranges:
+        first = inet_ntop(family, start.to_bytes(size, 'big'))
+        out.append(first if start == end else
+                   f'{first}-{inet_ntop(family, end.to_bytes(size, "big"))}')
+    return out
+
+def geoip_set_commands(table, set_name, ipv6, new, old=None):
+    """
+    nft commands changing the set from the old ranges to the new ones,
+    replacing the whole content if old is None
+    """
+    out = []
+    if old is None:
+        out.append(f'add set {table} {set_name} {{ type {"ipv6_addr" if ipv6 else "ipv4_addr"}; flags interval; }}')
+        out.append(f'flush set {table} {set_name}')
+        removed, added = [], new
+    else:
+        old_ranges, new_ranges = set(old), set(new)
+        removed = sorted(old_ranges - new_ranges)
+        added = sorted(new_ranges - old_ranges)
+
+    for action, ranges in [('delete', removed), ('add', added)]:
+        for i in range(0, len(ranges), geoip_chunk_size):
+            elements = ','.join(_geoip_format(ranges[i:i + geoip_chunk_size], ipv6))
+            out.append(f'{action} element {table} {set_name} {{ {elements} }}')
+    return out
+
+def _geoip_set_handles():
+    """
+    Handles of the GeoIP sets in nftables, keyed by 'family set'. The
+    kernel numbers sets per table, so a set recreated along with its table
+    can get its previous handle back; the handle of the table is included.
+    """
+    handles = {}
+    try:
+        tables = {}
+        for obj in json.loads(cmd('nft --json list tables'))['nftables']:
+            if 'table' in obj and obj['table']['name'] == 'vyos_filter':
+                tables[obj['table']['family']] = obj['table']['handle']
+
+        for obj in json.loads(cmd('nft --json list sets'))['nftables']:
+            if 'set' not in obj:
+                continue
+            nft_set = obj['set']
+            if nft_set['table'] == 'vyos_filter' and nft_set['name'].startswith('GEOIP_CC'):
+                handles[f"{nft_set['family']} {nft_set['name']}"] = [
+                    tables.get(nft_set['family']), nft_set['handle']]
+    except (OSError, ValueError, KeyError):
+        pass
+    return handles
 
 def geoip_download_data():
     url = 'https://download.db-ip.com/free/dbip-country-lite-{}.csv.gz'.format(strftime("%Y-%m"))
@@ -731,7 +919,11 @@ def __enter__(self):
     def __exit__(self, exc_type, exc_value, tb):
         os.unlink(self.file)
 
-def geoip_update(firewall, force=False):
+def geoip_update(firewall, force=False, reload=False):
+    """
+    Load the GeoIP sets of the firewall, reload is set after the firewall
+    tables were recreated, when all sets are empty and must be filled
+    """
     with GeoIPLock(geoip_lock_file) as lock:
         if not lock:
             print("Script is already running")
@@ -747,50 +939,81 @@ def geoip_update(firewall, force=False):
         elif force:
             geoip_download_data()
 
-        ipv4_codes = {}
-        ipv6_codes = {}
-
-        ipv4_sets = {}
-        ipv6_sets = {}
-
-        # Map country codes to set names
+        # Map set names to country codes
+        geoip_sets = {}
         for codes, path in dict_search_recursive(firewall, 'country_code'):
-            set_name = f'GEOIP_CC_{path[1]}_{path[2]}_{path[4]}'
             if ( path[0] == 'ipv4'):
-                for code in codes:
-                    ipv4_codes.setdefault(code, []).append(set_name)
+                set_name = f'GEOIP_CC_{path[1]}_{path[2]}_{path[4]}'
+                geoip_sets[f'ip {set_name}'] = sorted(codes)
             elif ( path[0] == 'ipv6' ):
                 set_name = f'GEOIP_CC6_{path[1]}_{path[2]}_{path[4]}'
-                for code in codes:
-                    ipv6_codes.setdefault(code, []).append(set_name)
+                geoip_sets[f'ip6 {set_name}'] = sorted(codes)
 
-        if not ipv4_codes and not ipv6_codes:
+        if not geoip_sets:
             if force:
                 print("GeoIP not in use by firewall")
             return True
 
-        geoip_data = geoip_load_data([*ipv4_codes, *ipv6_codes])
-
-        # Iterate IP blocks to assign to sets
-        for start, end, code in geoip_data:
-            ipv4 = is_ipv4(start)
-            if code in ipv4_codes and ipv4:
-                ip_range = f'{start}-{end}' if start != end else start
-                for setname in ipv4_codes[code]:
-                    ipv4_sets.setdefault(setname, []).append(ip_range)
-            if code in ipv6_codes and not ipv4:
-                ip_range = f'{start}-{end}' if start != end else start
-                for setname in ipv6_codes[code]:
-                    ipv6_sets.setdefault(setname, []).append(ip_range)
-
-        render(nftables_geoip_conf, 'firewall/nftables-geoip-update.j2', {
-            'ipv4_sets': ipv4_sets,
-            'ipv6_sets': ipv6_sets
-        })
-
-        result = run(f'nft --file {nftables_geoip_conf}')
-        if result != 0:
-            print('Error: GeoIP failed to update firewall')
+        index = geoip_load_index(geoip_database, geoip_index)
+        if not index:
             return False
+        previous = geoip_previous_index(geoip_index)
+
+        try:
+            with open(geoip_state) as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            state = {}
+
+        # Sets are recreated empty with a new table handle when the firewall
+        # is reloaded, they are filled completely. Sets loaded from the same
+        # codes are updated by difference, or skipped if the index is
+        # unchanged.
+        handles = _geoip_set_handles()
+        full = {}
+        changes = {}
+        for key, codes in geoip_sets.items():
+            family, set_name = key.split()
+            ipv6 = family == 'ip6'
+            loaded = None if reload else state.get(key)
+            if (loaded and handles.get(key) and loaded['handle'] == handles.get(key)
+                    and loaded['codes'] == codes):
+                if loaded['index'] == index.source:
+                    continue
+                if previous and loaded['index'] == previous.source:
+                    changes[key] = (previous.set_ranges(codes, ipv6), index.set_ranges(codes, ipv6))
+                    continue
+            full[key] = index.set_ranges(codes, ipv6)
+
+        def write_commands(diff):
+            with open(nftables_geoip_conf, 'w') as f:
+                for key, new in full.items():
+                    family, set_name = key.split()
+                    for line in geoip_set_commands(f'{family} vyos_filter', set_name, family == 'ip6', new):
+                        f.write(line + '\n')
+                for key, (old, new) in diff.items():
+                    family, set_name = key.split()
+                    for line in geoip_set_commands(f'{family} vyos_filter', set_name, family == 'ip6', new, old):
+                        f.write(line + '\n')
+
+        if full or changes:
+            write_commands(changes)
+            result = run(f'nft --file {nftables_geoip_conf}')
+            if result != 0 and changes:
+                # Set contents differ from the state, replace them
+                for key, (old, new) in changes.items():
+                    full[key] = new
+                write_commands({})
+                result = run(f'nft --file {nftables_geoip_conf}')
+
+            if result != 0:
+                print('Error: GeoIP failed to update firewall')
+                Path(geoip_state).unlink(missing_ok=True)
+                return False
+
+        state = {key: {'handle': handles.get(key), 'codes': codes, 'index': index.source}
+                 for key, codes in geoip_sets.items()}
+        with open(geoip_state, 'w') as f:
+            json.dump(state, f)
 
         return True
@@ -18,6 +18,9 @@
 It supports simple configuration manipulation and loading using the official tools
 supplied with FRR (vtysh and frr-reload)
 
+Commands addressed to a single daemon are sent over persistent connections
+to the vty socket of the daemon, falling back to vtysh if unavailable.
+
 All configuration management and manipulation is done using strings and regex.
 
 
@@ -67,6 +70,8 @@
 
 import tempfile
 import re
+import socket
+import threading
 
 from vyos import ConfigError
 from vyos.utils.process import cmd
@@ -92,6 +97,8 @@
 path_vtysh = '/usr/bin/vtysh'
 path_frr_reload = '/usr/lib/frr/frr-reload.py'
 path_config = '/run/frr'
+# daemon vty sockets are at {path_config}/{daemon}.vty
+vty_timeout = 60
 
 default_add_before = r'(ip prefix-list .*|route-map .*|line vty|end)'
 
@@ -124,6 +131,133 @@ class ConfigSectionNotFound(FrrError):
     """
     pass
 
+
+class VtyError(FrrError):
+    """
+    The vty socket of a daemon is unavailable, or the connection to it failed
+
+    used by: VtyConnection, VtyPool
+    """
+    pass
+
+
+class VtyConnection:
+    """ Persistent connection to the vty socket of an FRR daemon
+
+    The daemon reads NUL terminated commands and answers with the output,
+    terminated by three NUL bytes and the command status (CMD_SUCCESS = 0).
+    Commands on one connection are serialized.
+    """
+    def __init__(self, daemon, timeout=vty_timeout):
+        self.daemon = daemon
+        self.timeout = timeout
+        self.sock = None
+        self.lock = threading.Lock()
+        # commands completed by the current call to run()
+        self.completed = 0
+
+    def connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        try:
+            sock.connect(os.path.join(path_config, f'{self.daemon}.vty'))
+        except OSError as e:
+            sock.close()
+            raise VtyError(f'{self.daemon}: {e}') from e
+        self.sock = sock
+        # vtysh does the same, to run privileged commands
+        self._command('enable')
+
+    def close(self):
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+
+    def _command(self, command):
+        try:
+            self.sock.sendall(command.encode() + b'\0')
+            buf = bytearray()
+            while len(buf) < 4 or buf[-4:-1] != b'\0\0\0':
+                chunk = self.sock.recv(65536)
+                if not chunk:
+                    raise VtyError(f'{self.daemon}: connection closed')
+                buf += chunk
+        except OSError as e:
+            raise VtyError(f'{self.daemon}: {e}') from e
+        return buf[-1], buf[:-4].decode(errors='replace')
+
+    def _run(self, commands):
+        status, output = 0, []
+        for c in commands:
+            status, out = self._command(c)
+            output.append(out)
+            self.completed += 1
+            if status:
+                break
+        return status, ''.join(output)
+
+    def run(self, commands, configure=False):
+        """ Run commands in order, stopping at the first failing one
+        commands:  list of commands
+        configure: run the commands in configuration mode
+        return:    tuple of status of the last command run and the output
+        """
+        if configure:
+            commands = ['configure terminal'] + commands
+        with self.lock:
+            # a connection kept from earlier calls may have gone stale, for
+            # example on restart of the daemon: reconnect once, unless some
+            # of the commands already went through
+            for retry in (True, False):
+                fresh = self.sock is None
+                self.completed = 0
+                try:
+                    if fresh:
+                        self.connect()
+                    status, output = self._run(commands)
+                    break
+                except VtyError:
+                    self.close()
+                    if fresh or not retry or self.completed:
+                        raise
+            if configure:
+                # always leave configuration mode, releasing the config lock
+                try:
+                    self._command('end')
+                except VtyError:
+                    self.close()
+        return status, output
+
+
+class VtyPool:
+    """ Connections to the vty sockets of the FRR daemons, kept open across
+    calls
+    """
+    def __init__(self):
+        self.connections = {}
+        self.lock = threading.Lock()
+
+    def connection(self, daemon):
+        if daemon not in _frr_daemons:
+            raise ValueError(f'The specified daemon type is not supported {repr(daemon)}')
+        with self.lock:
+            if daemon not in self.connections:
+                self.connections[daemon] = VtyConnection(daemon)
+            return self.connections[daemon]
+
+    def run(self, daemon, commands, configure=False):
+        return self.connection(daemon).run(commands, configure=configure)
+
+    def close(self):
+        with self.lock:
+            for conn in self.connections.values():
+                with conn.lock:
+                    conn.close()
+            self.connections.clear()
+
+
+vty_pool = VtyPool()
+
 def init_debugging():
     global DEBUG
 
@@ -143,6 +277,8 @@ def get_configuration(daemon=None, marked=False):
     if daemon and daemon not in _frr_daemons:
         raise ValueError(f'The specified daemon type is not supported {repr(daemon)}')
 
+    # The configuration is read through vtysh, which merges and normalizes
+    # the daemon output FRRConfig operates on
     cmd = f"{path_vtysh} -c 'show run'"
     if daemon:
         cmd += f' -d {daemon}'
@@ -228,14 +364,28 @@ def save_configuration():
     return cmd(f'{path_vtysh} -n -w')
 
 
-def execute(command):
+def execute(command, daemon=None):
     """ Run commands inside vtysh
     command:  str containing commands to execute inside a vtysh session
+    daemon:   run the command on the specified FRR daemon only, over its
+              vty socket
     """
     if not isinstance(command, str):
         raise ValueError(f'command needs to be a string: {repr(command)}')
 
+    if daemon:
+        try:
+            code, output = vty_pool.run(daemon, [command])
+        except VtyError as e:
+            LOG.debug(f'execute: falling back to vtysh: {e}')
+        else:
+            if code:
+                raise OSError(code, output)
+            return output.replace('\r', '')
+
     cmd = f"{path_vtysh} -c '{command}'"
+    if daemon:
+        cmd += f' -d {daemon}'
 
     output, code = popen(cmd, stderr=STDOUT)
     if code:
@@ -261,6 +411,16 @@ def configure(lines, daemon=False):
     if daemon and daemon not in _frr_daemons:
         raise ValueError(f'The specified daemon type is not supported {repr(daemon)}')
 
+    if daemon:
+        try:
+            code, output = vty_pool.run(daemon, lines, configure=True)
+        except VtyError as e:
+            LOG.debug(f'configure: falling back to vtysh: {e}')
+        else:
+            if code:
+                raise ConfigurationNotValid(f'Configuration FRR failed: {repr(output)}')
+            return output.replace('\r', '')
+
     cmd = f'{path_vtysh}'
     if daemon:
         cmd += f' -d {daemon}'
@@ -1,6 +1,8 @@
 import json
 import zmq
 
+from contextlib import contextmanager
+
 SOCKET_PATH = "ipc:///run/vyos-hostsd/vyos-hostsd.sock"
 
 class VyOSHostsdError(Exception):
@@ -16,8 +18,34 @@ def __init__(self):
             self.__socket.connect(SOCKET_PATH)
         except zmq.error.Again:
             raise VyOSHostsdError("Could not connect to vyos-hostsd")
+        self.__batch = None
+
+    @contextmanager
+    def batch(self):
+        """
+        Collect the add, delete, set and apply requests made in the context
+        and send them as one transaction when it is left. Get requests are
+        answered immediately, from the state before the batch.
+
+        % with client.batch():
+        %     client.delete_name_servers(['dhcp-eth0'])
+        %     client.add_name_servers({'dhcp-eth0': ['192.0.2.1']})
+        %     client.apply()
+        """
+        self.__batch = []
+        try:
+            yield self
+            msgs = self.__batch
+        finally:
+            self.__batch = None
+        if msgs:
+            self._communicate({'op': 'batch', 'data': msgs})
 
     def _communicate(self, msg):
+        if self.__batch is not None and msg['op'] != 'get':
+            self.__batch.append(msg)
+            return None
+
         try:
             request = json.dumps(msg).encode()
             self.__socket.send(request)
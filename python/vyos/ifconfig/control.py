@@ -14,10 +14,12 @@
 # License along with this library.  If not, see <http://www.gnu.org/licenses/>.
 
 import os
+import re
 
 from inspect import signature
 from inspect import _empty
 
+from vyos.ifconfig import netlink
 from vyos.ifconfig.section import Section
 from vyos.utils.process import popen
 from vyos.utils.process import cmd
@@ -25,6 +27,106 @@
 from vyos.utils.file import write_file
 from vyos import debug
 
+# per-interface sysctl directories, whose files are plain settings
+_sysctl_dir = re.compile(r'^(/proc/sys/net/ipv[46]/(?:conf|neigh)/[^/]+)/([^/]+)$')
+
+# sysfs/procfs writes issued and skipped as no-op, see sysfs_stats()
+_sysfs_stats = {'written': 0, 'elided': 0}
+
+def sysfs_stats(reset=False) -> dict:
+    """
+    Return counters of sysfs/procfs writes issued and elided since the last
+    reset, e.g. for one commit
+    """
+    stats = dict(_sysfs_stats)
+    if reset:
+        _sysfs_stats.update(written=0, elided=0)
+    return stats
+
+class SysctlCache:
+    """
+    Current values of the per-interface sysctl directories
+    /proc/sys/net/ipv{4,6}/{conf,neigh}/<ifname>/. All values of a directory
+    are read at once on first access, through a directory fd held until
+    close(), and are updated on write, so that writes of the current value
+    can be skipped.
+    """
+    def __init__(self):
+        self._dirs = {}
+
+    def _load(self, dirname):
+        if dirname not in self._dirs:
+            try:
+                fd = os.open(dirname, os.O_RDONLY | os.O_DIRECTORY)
+            except OSError:
+                return None
+            values = {}
+            for entry in os.scandir(fd):
+                try:
+                    f = os.open(entry.name, os.O_RDONLY, dir_fd=fd)
+                except OSError:
+                    # write-only or unreadable, e.g. stable_secret
+                    continue
+                try:
+                    values[entry.name] = os.read(f, 4096).decode().strip()
+                except OSError:
+                    pass
+                finally:
+                    os.close(f)
+            self._dirs[dirname] = (fd, values)
+        return self._dirs[dirname]
+
+    def read(self, dirname, name):
+        entry = self._load(dirname)
+        if entry is None:
+            return None
+        return entry[1].get(name)
+
+    def write(self, dirname, name, value):
+        """
+        Write value unless it is the current one. Returns False if the file
+        does not exist, True otherwise.
+        """
+        entry = self._load(dirname)
+        if entry is None:
+            return False
+        fd, values = entry
+        if values.get(name) == value:
+            _sysfs_stats['elided'] += 1
+            return True
+        try:
+            f = os.open(name, os.O_WRONLY | os.O_TRUNC, dir_fd=fd)
+        except FileNotFoundError:
+            # the kernel may have recreated the directory, e.g. ipv6/conf on
+            # MTU changes: retry with fresh values
+            self._drop(dirname)
+            entry = self._load(dirname)
+            if entry is None or name not in os.listdir(entry[0]):
+                return False
+            fd, values = entry
+            if values.get(name) == value:
+                _sysfs_stats['elided'] += 1
+                return True
+            f = os.open(name, os.O_WRONLY | os.O_TRUNC, dir_fd=fd)
+        try:
+            os.write(f, value.encode())
+        finally:
+            os.close(f)
+        _sysfs_stats['written'] += 1
+        values[name] = value
+        return True
+
+    def _drop(self, dirname):
+        fd, _ = self._dirs.pop(dirname)
+        os.close(fd)
+
+    def close(self):
+        for dirname in list(self._dirs):
+            self._drop(dirname)
+
+    def __del__(self):
+        self.close()
+
 class Control(Section):
     _command_get = {}
     _command_set = {}
@@ -67,6 +169,15 @@ def _get_command(self, config, name):
         """
         Using the defined names, set data write to sysfs.
         """
+        # 'netlink' names the link attribute to read with the netlink
+        # backend, the shell command is used as fallback
+        attr = self._command_get[name].get('netlink', None)
+        if attr and netlink.enabled:
+            try:
+                return netlink.get_link(config['ifname'], config.get('netns'))[attr]
+            except netlink.NetlinkBackendError as e:
+                self._debug_msg(f'netlink get {name} failed: {e}')
+
         cmd = self._command_get[name]['shellcmd'].format(**config)
         return self._command_get[name].get('format', lambda _: _)(self._cmd(cmd))
 
@@ -108,6 +219,11 @@ def _set_command(self, config, name, value):
             except Exception as e:
                 raise e.__class__(f'Could not set {name}. {e}')
 
+        # 'netlink' maps the value to the link attributes to set with the
+        # netlink backend, the shell command is used as fallback
+        attrs = self._command_set[name].get('netlink', None)
+        attrs = attrs(value) if attrs else None
+
         convert = self._command_set[name].get('convert', None)
         if convert:
             value = convert(value)
@@ -116,6 +232,14 @@ def _set_command(self, config, name, value):
         if possible and not possible(config['ifname'], value):
             return False
 
+        if attrs is not None and netlink.enabled:
+            try:
+                netlink.set_link(config['ifname'], config.get('netns'), **attrs)
+                self._debug_msg(f'netlink set {name} {attrs}')
+                return ''
+            except netlink.NetlinkBackendError as e:
+                self._debug_msg(f'netlink set {name} failed: {e}')
+
         config = {**config, **{'value': value}}
 
         cmd = self._command_set[name]['shellcmd'].format(**config)
@@ -124,12 +248,29 @@ def _set_command(self, config, name, value):
     _sysfs_get = {}
     _sysfs_set = {}
 
+    def _sysctl_cache(self):
+        # created on first use, as not all subclasses call __init__()
+        if '_sysctl' not in self.__dict__:
+            self._sysctl = SysctlCache()
+        return self._sysctl
+
+    def _drop_sysctl_cache(self):
+        """
+        Forget cached sysctl values, when the kernel may have reset them
+        """
+        if '_sysctl' in self.__dict__:
+            self._sysctl.close()
+
     def _read_sysfs(self, filename):
         """
         Provide a single primitive w/ error checking for reading from sysfs.
         """
         value = None
-        if os.path.exists(filename):
+        sysctl = _sysctl_dir.match(filename)
+        if sysctl:
+            value = self._sysctl_cache().read(*sysctl.groups())
+            self._debug_msg("read '{}' < '{}'".format(value, filename))
+        elif os.path.exists(filename):
             value = read_file(filename)
             self._debug_msg("read '{}' < '{}'".format(value, filename))
         return value
@@ -137,9 +278,17 @@ def _read_sysfs(self, filename):
     def _write_sysfs(self, filename, value):
         """
         Provide a single primitive w/ error checking for writing to sysfs.
+        Writes to per-interface sysctls are skipped if the value is current.
         """
+        sysctl = _sysctl_dir.match(filename)
+        if sysctl:
+            commited = self._sysctl_cache().write(*sysctl.groups(), str(value))
+            if commited:
+                self._debug_msg("write '{}' > '{}'".format(value, filename))
+            return commited
         if os.path.isfile(filename):
             write_file(filename, str(value))
+            _sysfs_stats['written'] += 1
             self._debug_msg("write '{}' > '{}'".format(value, filename))
             return True
         return False
@@ -22,6 +22,7 @@
 from glob import glob
 
 from ipaddress import IPv4Network
+from ipaddress import ip_interface
 from netifaces import ifaddresses
 # this is not the same as socket.AF_INET/INET6
 from netifaces import AF_INET
@@ -57,6 +58,7 @@
 from vyos.utils.assertion import assert_mtu
 from vyos.utils.assertion import assert_positive
 from vyos.utils.assertion import assert_range
+from vyos.ifconfig import netlink
 from vyos.ifconfig.control import Control
 from vyos.ifconfig.vrrp import VRRP
 from vyos.ifconfig.operational import Operational
@@ -92,34 +94,42 @@ class Interface(Control):
     _command_get = {
         'admin_state': {
             'shellcmd': 'ip -json link show dev {ifname}',
+            'netlink': 'admin_state',
             'format': lambda j: 'up' if 'UP' in jmespath.search('[*].flags | [0]', json.loads(j)) else 'down',
         },
         'alias': {
             'shellcmd': 'ip -json -detail link list dev {ifname}',
+            'netlink': 'alias',
             'format': lambda j: jmespath.search('[*].ifalias | [0]', json.loads(j)) or '',
         },
         'mac': {
             'shellcmd': 'ip -json -detail link list dev {ifname}',
+            'netlink': 'mac',
             'format': lambda j: jmespath.search('[*].address | [0]', json.loads(j)),
         },
         'min_mtu': {
             'shellcmd': 'ip -json -detail link list dev {ifname}',
+            'netlink': 'min_mtu',
             'format': lambda j: jmespath.search('[*].min_mtu | [0]', json.loads(j)),
         },
         'max_mtu': {
             'shellcmd': 'ip -json -detail link list dev {ifname}',
+            'netlink': 'max_mtu',
             'format': lambda j: jmespath.search('[*].max_mtu | [0]', json.loads(j)),
         },
         'mtu': {
             'shellcmd': 'ip -json -detail link list dev {ifname}',
+            'netlink': 'mtu',
             'format': lambda j: jmespath.search('[*].mtu | [0]', json.loads(j)),
         },
         'oper_state': {
             'shellcmd': 'ip -json -detail link list dev {ifname}',
+            'netlink': 'oper_state',
             'format': lambda j: jmespath.search('[*].operstate | [0]', json.loads(j)),
         },
         'vrf': {
             'shellcmd': 'ip -json -detail link list dev {ifname}',
+            'netlink': 'vrf',
             'format': lambda j: jmespath.search('[?linkinfo.info_slave_kind == `vrf`].master | [0]', json.loads(j)),
         },
     }
@@ -127,10 +137,12 @@ class Interface(Control):
     _command_set = {
         'admin_state': {
             'validate': lambda v: assert_list(v, ['up', 'down']),
+            'netlink': lambda v: {'state': v},
             'shellcmd': 'ip link set dev {ifname} {value}',
         },
         'alias': {
             'convert': lambda name: name if name else '',
+            'netlink': lambda v: {'ifalias': v},
             'shellcmd': 'ip link set dev {ifname} alias "{value}"',
         },
         'bridge_port_isolation': {
@@ -139,14 +151,17 @@ class Interface(Control):
         },
         'mac': {
             'validate': assert_mac,
+            'netlink': lambda v: {'address': v},
             'shellcmd': 'ip link set dev {ifname} address {value}',
         },
         'mtu': {
             'validate': assert_mtu,
+            'netlink': lambda v: {'mtu': int(v)},
             'shellcmd': 'ip link set dev {ifname} mtu {value}',
         },
         'vrf': {
             'convert': lambda v: f'master {v}' if v else 'nomaster',
+            'netlink': lambda v: {'master': v},
             'shellcmd': 'ip link set dev {ifname} {value}',
         },
     }
@@ -411,6 +426,7 @@ def _delete(self):
         # for delete we can't get data from self.config{'netns'}
         netns = get_interface_namespace(self.ifname)
         if netns: cmd = f'ip netns exec {netns} {cmd}'
+        self._drop_sysctl_cache()
         return self._cmd(cmd)
 
     def _nft_check_and_run(self, nft_command):
@@ -474,6 +490,8 @@ def set_mtu(self, mtu):
         tmp = self.get_interface('mtu')
         if str(tmp) == mtu:
             return None
+        # the kernel recreates ipv6/conf with defaults when crossing 1280
+        self._drop_sysctl_cache()
         return self.set_interface('mtu', mtu)
 
     def get_mac(self):
@@ -577,6 +595,7 @@ def set_netns(self, netns: str) -> bool:
         >>> Interface('dum0').set_netns('foo')
         """
         self._cmd(f'ip link set dev {self.ifname} netns {netns}')
+        self._drop_sysctl_cache()
         return True
 
     def get_vrf(self):
@@ -1179,6 +1198,22 @@ def get_addr(self):
         """
         return self.get_addr_v4() + self.get_addr_v6()
 
+    def _is_addr_assigned(self, addr, netns=None):
+        """
+        Check if address is assigned to the interface, over netlink if
+        available. Same semantics as is_intf_addr_assigned().
+        """
+        try:
+            assigned = netlink.get_addr(self.ifname, netns)
+        except netlink.NetlinkBackendError:
+            return is_intf_addr_assigned(self.ifname, addr, netns=netns)
+
+        addr = addr.split('%')[0]
+        for interface in assigned:
+            if str(interface.ip) == addr or ip_interface(addr) == interface:
+                return True
+        return False
+
     def add_addr(self, addr):
         """
         Add IP(v6) address to interface. Address is only added if it is not
@@ -1215,13 +1250,16 @@ def add_addr(self, addr):
             self.set_dhcp(True)
         elif addr == 'dhcpv6':
             self.set_dhcpv6(True)
-        elif not is_intf_addr_assigned(self.ifname, addr, netns=netns):
-            netns_cmd  = f'ip netns exec {netns}' if netns else ''
-            tmp = f'{netns_cmd} ip addr add {addr} dev {self.ifname}'
-            # Add broadcast address for IPv4
-            if is_ipv4(addr): tmp += ' brd +'
-
-            self._cmd(tmp)
+        elif not self._is_addr_assigned(addr, netns):
+            try:
+                netlink.add_addr(self.ifname, addr, netns)
+            except netlink.NetlinkBackendError:
+                netns_cmd  = f'ip netns exec {netns}' if netns else ''
+                tmp = f'{netns_cmd} ip addr add {addr} dev {self.ifname}'
+                # Add broadcast address for IPv4
+                if is_ipv4(addr): tmp += ' brd +'
+
+                self._cmd(tmp)
         else:
             return False
 
@@ -1265,9 +1303,12 @@ def del_addr(self, addr):
             self.set_dhcp(False)
         elif addr == 'dhcpv6':
             self.set_dhcpv6(False)
-        elif is_intf_addr_assigned(self.ifname, addr, netns=netns):
-            netns_cmd  = f'ip netns exec {netns}' if netns else ''
-            self._cmd(f'{netns_cmd} ip addr del {addr} dev {self.ifname}')
+        elif self._is_addr_assigned(addr, netns):
+            try:
+                netlink.del_addr(self.ifname, addr, netns)
+            except netlink.NetlinkBackendError:
+                netns_cmd  = f'ip netns exec {netns}' if netns else ''
+                self._cmd(f'{netns_cmd} ip addr del {addr} dev {self.ifname}')
         else:
             return False
 
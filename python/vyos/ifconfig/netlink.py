@@ -0,0 +1,174 @@
+# Copyright 2024 VyOS maintainers and contributors <maintainers@vyos.io>
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+rtnetlink backend for interface programming
+
+Link attributes and addresses are read and set with rtnetlink requests over
+one long-lived socket per network namespace and process, instead of running
+an ip command for each of them. All functions raise NetlinkBackendError if
+the backend is unavailable or the request failed, in which case the callers
+fall back to the iproute2 commands.
+"""
+
+import os
+import atexit
+
+from ipaddress import ip_interface
+
+try:
+    from pyroute2 import IPRoute
+    from pyroute2 import NetNS
+    from pyroute2.netlink.exceptions import NetlinkError
+except ImportError:
+    IPRoute = None
+
+# Can be cleared to force the iproute2 commands, e.g. for comparison
+enabled = IPRoute is not None
+
+IFF_UP = 0x1
+
+_sockets = {}
+_pid = None
+
+
+class NetlinkBackendError(Exception):
+    """Netlink request could not be completed"""
+
+
+def _close_sockets():
+    for sock in _sockets.values():
+        sock.close()
+    _sockets.clear()
+
+
+atexit.register(_close_sockets)
+
+
+def _socket(netns=None):
+    """
+    Return socket for netns, opening it on first use. Sockets are not
+    shared with forked child processes.
+    """
+    global _pid
+    if not enabled:
+        raise NetlinkBackendError('netlink backend is not available')
+    if _pid != os.getpid():
+        _sockets.clear()
+        _pid = os.getpid()
+
+    if netns not in _sockets:
+        try:
+            # flags=0: never create a missing namespace
+            _sockets[netns] = NetNS(netns, flags=0) if netns else IPRoute()
+        except Exception as e:
+            raise NetlinkBackendError(f'cannot open netlink socket: {e}') from e
+    return _sockets[netns]
+
+
+def _request(netns, func, *args, **kwargs):
+    try:
+        return func(_socket(netns), *args, **kwargs)
+    except NetlinkBackendError:
+        raise
+    except (NetlinkError, OSError, ValueError) as e:
+        raise NetlinkBackendError(str(e)) from e
+
+
+def _interface(addr):
+    try:
+        return ip_interface(addr)
+    except ValueError as e:
+        raise NetlinkBackendError(str(e)) from e
+
+
+def _index(ipr, ifname):
+    index = ipr.link_lookup(ifname=ifname)
+    if not index:
+        raise NetlinkBackendError(f'interface {ifname} does not exist')
+    return index[0]
+
+
+def get_link(ifname, netns=None):
+    """
+    Return the link attributes of the interface with one request, using
+    the keys and values of 'ip -json -detail link show'
+    """
+    def request(ipr):
+        msg = ipr.link('get', index=_index(ipr, ifname))[0]
+        master = msg.get_attr('IFLA_MASTER')
+        vrf = None
+        if master and msg.get_nested('IFLA_LINKINFO', 'IFLA_INFO_SLAVE_KIND') == 'vrf':
+            vrf = ipr.link('get', index=master)[0].get_attr('IFLA_IFNAME')
+        return {
+            'admin_state': 'up' if msg['flags'] & IFF_UP else 'down',
+            'alias': msg.get_attr('IFLA_IFALIAS') or '',
+            'mac': msg.get_attr('IFLA_ADDRESS'),
+            'min_mtu': msg.get_attr('IFLA_MIN_MTU'),
+            'max_mtu': msg.get_attr('IFLA_MAX_MTU'),
+            'mtu': msg.get_attr('IFLA_MTU'),
+            'oper_state': msg.get_attr('IFLA_OPERSTATE'),
+            'vrf': vrf,
+        }
+    return _request(netns, request)
+
+
+def set_link(ifname, netns=None, **attrs):
+    """
+    Set link attributes of the interface in a single request. A 'master'
+    is given by interface name, or as '' to release the interface.
+    """
+    def request(ipr):
+        index = _index(ipr, ifname)
+        if isinstance(attrs.get('master'), str):
+            attrs['master'] = _index(ipr, attrs['master']) if attrs['master'] else 0
+        ipr.link('set', index=index, **attrs)
+    return _request(netns, request)
+
+
+def get_addr(ifname, netns=None):
+    """
+    Return the addresses assigned to the interface as list of ip_interface
+    """
+    def request(ipr):
+        # IFA_LOCAL is the local address of point-to-point links (IPv4 only)
+        return [ip_interface(f"{msg.get_attr('IFA_LOCAL') or msg.get_attr('IFA_ADDRESS')}"
+                             f"/{msg['prefixlen']}")
+                for msg in ipr.get_addr(index=_index(ipr, ifname))]
+    return _request(netns, request)
+
+
+def add_addr(ifname, addr, netns=None):
+    """
+    Add address to the interface; like 'ip addr add <addr> brd +' for IPv4
+    """
+    addr = _interface(addr)
+    kwargs = {}
+    if addr.version == 4 and addr.network.prefixlen < 31:
+        kwargs['broadcast'] = str(addr.network.broadcast_address)
+
+    def request(ipr):
+        ipr.addr('add', index=_index(ipr, ifname), address=str(addr.ip),
+                 prefixlen=addr.network.prefixlen, **kwargs)
+    return _request(netns, request)
+
+
+def del_addr(ifname, addr, netns=None):
+    addr = _interface(addr)
+
+    def request(ipr):
+        ipr.addr('del', index=_index(ipr, ifname), address=str(addr.ip),
+                 prefixlen=addr.network.prefixlen)
+    return _request(netns, request)
@@ -13,9 +13,11 @@
 # You should have received a copy of the GNU Lesser General Public
 # License along with this library.  If not, see <http://www.gnu.org/licenses/>.
 
+import asyncio
 import json
 import os
 import socket
+import threading
 
 from vyos.template import is_ipv6
 from vyos.template import isc_static_route
@@ -57,6 +59,9 @@
 
 kea_ctrl_socket = '/run/kea/dhcp{inet}-ctrl-socket'
 
+# leases per lease{inet}-get-page request
+kea_lease_page_size = 1000
+
 def kea_parse_options(config):
     options = []
 
@@ -295,39 +300,281 @@ def kea6_parse_subnet(subnet, config):
 
     return out
 
-def _ctrl_socket_command(inet, command, args=None):
-    path = kea_ctrl_socket.format(inet=inet)
-
-    if not os.path.exists(path):
-        return None
+class KeaCtrlError(Exception):
+    """Kea control socket command could not be completed"""
 
+def _ctrl_socket_permissions(path):
+    # checked per connection, not per command
     if file_permissions(path) != '0775':
         run(f'sudo chmod 775 {path}')
 
-    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
-        sock.connect(path)
+def _ctrl_payload(command, args=None):
+    payload = {'command': command}
+    if args:
+        payload['arguments'] = args
+    return json.dumps(payload).encode()
+
+class _ResponseBuffer:
+    """
+    Collects a response from the control socket. The response carries no
+    length header; it is complete once the received data form one JSON
+    document. Decoding is only attempted when the data end with a closing
+    brace and the last read did not fill the buffer, as otherwise more data
+    are already pending.
+    """
+    def __init__(self, recv_size):
+        self.recv_size = recv_size
+        self.data = bytearray()
+
+    def feed(self, chunk):
+        self.data += chunk
+        if len(chunk) == self.recv_size or not self.data.rstrip().endswith(b'}'):
+            return None
+        return self.finish()
+
+    def finish(self):
+        """Decode data received up to the end of the connection"""
+        try:
+            return json.loads(self.data)
+        except ValueError:
+            return None
+
+class KeaCtrlClient:
+    """
+    Client for the control socket of the Kea DHCP server
+
+    The connection is kept open for further commands if the server keeps it
+    open, and is re-established transparently if the server closed it.
+    Responses of any size are read until complete. Commands on one client
+    are serialized, so it can be shared between threads.
+    """
+    recv_size = 65536
+
+    def __init__(self, inet, path=None, timeout=30):
+        self.path = path or kea_ctrl_socket.format(inet=inet)
+        self.timeout = timeout
+        self.sock = None
+        # reentrant, as command() closes the connection on errors
+        self.lock = threading.RLock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def available(self):
+        return os.path.exists(self.path)
+
+    def close(self):
+        with self.lock:
+            if self.sock:
+                self.sock.close()
+                self.sock = None
+
+    def _connect(self):
+        _ctrl_socket_permissions(self.path)
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        try:
+            sock.connect(self.path)
+        except OSError:
+            sock.close()
+            raise
+        return sock
+
+    def _peer_closed(self):
+        self.sock.setblocking(False)
+        try:
+            return self.sock.recv(1, socket.MSG_PEEK) == b''
+        except BlockingIOError:
+            return False
+        except OSError:
+            return True
+        finally:
+            self.sock.settimeout(self.timeout)
+
+    def command(self, command, args=None):
+        """Run command and return the decoded response"""
+        payload = _ctrl_payload(command, args)
+
+        with self.lock:
+            # A reused connection may have been closed by the server since the
+            # last command, in which case nothing was received: reconnect once.
+            while True:
+                reused = self.sock is not None
+                if not reused:
+                    self.sock = self._connect()
+
+                response = _ResponseBuffer(self.recv_size)
+                result = None
+                try:
+                    self.sock.sendall(payload)
+                    while result is None:
+                        chunk = self.sock.recv(self.recv_size)
+                        if not chunk:
+                            result = response.finish()
+                            break
+                        result = response.feed(chunk)
+                except (BrokenPipeError, ConnectionResetError):
+                    pass
+                except socket.timeout as e:
+                    self.close()
+                    raise KeaCtrlError(f'{command}: timeout waiting for response') from e
+
+                if result is not None:
+                    if self._peer_closed():
+                        self.close()
+                    return result
+
+                self.close()
+                if not reused or response.data:
+                    raise KeaCtrlError(f'{command}: connection closed by server')
+
+    def commands(self, requests):
+        """Run list of (command, args) in order and return the responses"""
+        return [self.command(command, args) for command, args in requests]
+
+class AsyncKeaCtrlClient:
+    """
+    asyncio variant of KeaCtrlClient; commands on one client are serialized
+    """
+    recv_size = KeaCtrlClient.recv_size
+
+    def __init__(self, inet, path=None, timeout=30):
+        self.path = path or kea_ctrl_socket.format(inet=inet)
+        self.timeout = timeout
+        self.reader = None
+        self.writer = None
+        self.lock = asyncio.Lock()
+
+    def available(self):
+        return os.path.exists(self.path)
+
+    async def close(self):
+        if self.writer:
+            self.writer.close()
+            try:
+                await self.writer.wait_closed()
+            except OSError:
+                pass
+        self.reader = self.writer = None
+
+    async def _exchange(self, payload, response):
+        self.writer.write(payload)
+        await self.writer.drain()
+        while chunk := await self.reader.read(self.recv_size):
+            if (result := response.feed(chunk)) is not None:
+                return result
+        return response.finish()
+
+    async def command(self, command, args=None):
+        """Run command and return the decoded response"""
+        payload = _ctrl_payload(command, args)
+
+        async with self.lock:
+            while True:
+                reused = self.writer is not None
+                if not reused:
+                    _ctrl_socket_permissions(self.path)
+                    self.reader, self.writer = await asyncio.wait_for(
+                        asyncio.open_unix_connection(self.path), self.timeout)
+
+                response = _ResponseBuffer(self.recv_size)
+                result = None
+                try:
+                    result = await asyncio.wait_for(
+                        self._exchange(payload, response), self.timeout)
+                except (BrokenPipeError, ConnectionResetError):
+                    pass
+                except asyncio.TimeoutError as e:
+                    await self.close()
+                    raise KeaCtrlError(f'{command}: timeout waiting for response') from e
+
+                if result is not None:
+                    if self.reader.at_eof():
+                        await self.close()
+                    return result
+
+                await self.close()
+                if not reused or response.data:
+                    raise KeaCtrlError(f'{command}: connection closed by server')
+
+# one client per address family, kept for the lifetime of the process
+_ctrl_clients = {}
+_async_ctrl_clients = {}
+
+def _ctrl_socket_command(inet, command, args=None):
+    if inet not in _ctrl_clients:
+        _ctrl_clients[inet] = KeaCtrlClient(inet)
+    client = _ctrl_clients[inet]
 
-        payload = {'command': command}
-        if args:
-            payload['arguments'] = args
+    if not client.available():
+        return None
 
-        sock.send(bytes(json.dumps(payload), 'utf-8'))
-        result = b''
-        while True:
-            data = sock.recv(4096)
-            result += data
-            if len(data) < 4096:
-                break
+    return client.command(command, args)
 
-        return json.loads(result.decode('utf-8'))
+async def _async_ctrl_socket_command(inet, command, args=None):
+    if inet not in _async_ctrl_clients:
+        _async_ctrl_clients[inet] = AsyncKeaCtrlClient(inet)
+    client = _async_ctrl_clients[inet]
 
-def kea_get_leases(inet):
-    leases = _ctrl_socket_command(inet, f'lease{inet}-get-all')
+    if not client.available():
+        return None
 
-    if not leases or 'result' not in leases or leases['result'] != 0:
-        return []
+    return await client.command(command, args)
+
+def _lease_page_args(start, page_size):
+    return {'from': start, 'limit': page_size}
+
+def _lease_page(page, page_size):
+    """
+    Return the leases of a lease{inet}-get-page response and the start of
+    the next page, None after the last page
+    """
+    # result 3: no more leases
+    if not page or page.get('result') != 0:
+        return [], None
+
+    leases = page['arguments']['leases']
+    if len(leases) < page_size:
+        return leases, None
+    return leases, leases[-1]['ip-address']
+
+def kea_get_leases_paged(inet, page_size=kea_lease_page_size):
+    """
+    Yield all leases, fetched page by page with lease{inet}-get-page rather
+    than all at once
+    """
+    start = 'start'
+    while start is not None:
+        page = _ctrl_socket_command(inet, f'lease{inet}-get-page',
+                                    _lease_page_args(start, page_size))
+        leases, start = _lease_page(page, page_size)
+        yield from leases
+
+async def kea_get_leases_paged_async(inet, page_size=kea_lease_page_size):
+    """
+    Yield all leases like kea_get_leases_paged, with the asyncio client
+    """
+    start = 'start'
+    while start is not None:
+        page = await _async_ctrl_socket_command(inet, f'lease{inet}-get-page',
+                                                _lease_page_args(start, page_size))
+        leases, start = _lease_page(page, page_size)
+        for lease in leases:
+            yield lease
+
+def kea_get_lease(inet, ip_address):
+    """
+    Return the lease for an address, or None if there is no lease
+    """
+    lease = _ctrl_socket_command(inet, f'lease{inet}-get', {'ip-address': ip_address})
+
+    if not lease or 'result' not in lease or lease['result'] != 0:
+        return None
 
-    return leases['arguments']['leases']
+    return lease['arguments']
 
 def kea_delete_lease(inet, ip_address):
     args = {'ip-address': ip_address}
@@ -347,6 +594,29 @@ def kea_get_active_config(inet):
 
     return config
 
+async def kea_get_active_config_async(inet):
+    config = await _async_ctrl_socket_command(inet, 'config-get')
+
+    if not config or 'result' not in config or config['result'] != 0:
+        return None
+
+    return config
+
+def kea_get_subnet_pool_index(config, inet):
+    """
+    Return dict of subnet id to the name of its pool (shared network), to
+    look up the pool of many leases
+    """
+    index = {}
+    shared_networks = dict_search_args(config, 'arguments', f'Dhcp{inet}', 'shared-networks')
+
+    for network in shared_networks or []:
+        for subnet in network.get(f'subnet{inet}', []):
+            if 'id' in subnet:
+                index.setdefault(int(subnet['id']), network['name'])
+
+    return index
+
 def kea_get_pool_from_subnet_id(config, inet, subnet_id):
     shared_networks = dict_search_args(config, 'arguments', f'Dhcp{inet}', 'shared-networks')
 
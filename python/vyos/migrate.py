@@ -17,6 +17,7 @@
 import re
 import json
 import logging
+from time import perf_counter
 from pathlib import Path
 from grp import getgrnam
 
@@ -30,6 +31,7 @@
 from vyos.configtree import ConfigTree
 from vyos.defaults import directories as default_dir
 from vyos.defaults import component_version_json
+from vyos.defaults import migration_timings_json
 
 
 log_file = Path(default_dir['config']).joinpath('vyos-migrate.log')
@@ -51,6 +53,7 @@ def __init__(self, config_file: str, force=False,
         self.checkpoint_file = checkpoint_file
         self.logger = None
         self.config_modified = True
+        self.timings: dict = {}
 
         if self.file_version is None:
             raise ConfigMigrateError(f'failed to read config file {self.config_file}')
@@ -174,6 +177,12 @@ def run_migration_scripts(self):
         sort_func = ConfigMigrate.sort_function()
 
         for key in components:
+            if (not self.force and not self.file_version.component_is_none() and
+                self.file_version.component.get(key) == self.system_version.component[key]):
+                # component already at system version
+                revision.update_component(key, self.system_version.component[key])
+                continue
+
             p = migrate_dir.joinpath(key)
             script_list = list(p.glob('*-to-*'))
             script_list = sorted(script_list, key=sort_func)
@@ -190,9 +199,11 @@ def run_migration_scripts(self):
             for file in script_list:
                 f = file.as_posix()
                 self.logger.info(f'applying {f}')
+                start_time = perf_counter()
                 try:
                     self.compose.apply_file(f, func_name='migrate')
                 except ComposeConfigError as e:
+                    self.timings[f'{key}/{file.stem}'] = round(perf_counter() - start_time, 4)
                     self.logger.error(e)
                     if self.checkpoint_file:
                         check = f'{self.checkpoint_file}_{ConfigMigrate.file_ext(file)}'
@@ -201,6 +212,7 @@ def run_migration_scripts(self):
                         revision.write(check)
                     break
                 else:
+                    self.timings[f'{key}/{file.stem}'] = round(perf_counter() - start_time, 4)
                     revision.update_component(key, sort_func(file)[1])
 
         revision.update_config_body(self.compose.to_string())
@@ -214,7 +226,8 @@ def run_migration_scripts(self):
 
     def save_json_record(self):
         """
-        Write component versions to a json file
+        Write component versions to a json file, and the run time in seconds
+        of each migration script applied, if any, to a companion file
         """
         version_file = component_version_json
 
@@ -222,6 +235,9 @@ def save_json_record(self):
             with open(version_file, 'w') as f:
                 f.write(json.dumps(self.system_version.component,
                                    indent=2, sort_keys=True))
+            if self.timings:
+                with open(migration_timings_json, 'w') as f:
+                    f.write(json.dumps(self.timings, indent=2))
         except OSError:
             pass
 
@@ -254,7 +270,10 @@ def run(self):
 
         self.load_config()
 
-        self.run_migration_scripts()
+        try:
+            self.run_migration_scripts()
+        finally:
+            self.save_json_record()
 
         self.update_release()
         self.write_config()
@@ -203,12 +203,13 @@ def _normalize_field_names(value):
     else:
         return value
 
-def run(module):
+def _get_arg_parser(functions, parser_class=None):
     from argparse import ArgumentParser
 
-    functions = _get_op_mode_functions(module)
+    if parser_class is None:
+        parser_class = ArgumentParser
 
-    parser = ArgumentParser()
+    parser = parser_class()
     subparsers = parser.add_subparsers(dest="subcommand")
 
     for function_name in functions:
@@ -227,6 +228,11 @@ def run(module):
 
             if _get_arg_type(th) == bool:
                 subparser.add_argument(f"--{opt}", action='store_true')
+            elif typing.get_origin(_get_arg_type(th)) == list:
+                # list[t] options take one or more values
+                subparser.add_argument(f"--{opt}", nargs='+',
+                                       type=typing.get_args(_get_arg_type(th))[0],
+                                       required=not _is_optional_type(th))
             else:
                 if _is_optional_type(th):
                     if _is_literal_type(th):
@@ -245,6 +251,22 @@ def run(module):
                         subparser.add_argument(f"--{opt}",
                                                type=_get_arg_type(th), required=True)
 
+    return parser
+
+def _format_raw_output(res):
+    if not isinstance(res, dict) and not isinstance(res, list):
+        raise InternalError(f"Bare literal is not an acceptable raw output, must be a list or an object.\
+          The output was:{res}")
+    res = decamelize(res)
+    res = _normalize_field_names(res)
+    from json import dumps
+    return dumps(res, indent=4)
+
+def run(module):
+    functions = _get_op_mode_functions(module)
+
+    parser = _get_arg_parser(functions)
+
     # Get options as a dict rather than a namespace,
     # so that we can modify it and pack for passing to functions
     args = vars(parser.parse_args())
@@ -275,13 +297,7 @@ def run(module):
         if not args["raw"]:
             return res
         else:
-            if not isinstance(res, dict) and not isinstance(res, list):
-                raise InternalError(f"Bare literal is not an acceptable raw output, must be a list or an object.\
-                  The output was:{res}")
-            res = decamelize(res)
-            res = _normalize_field_names(res)
-            from json import dumps
-            return dumps(res, indent=4)
+            return _format_raw_output(res)
     else:
         # Other functions should not return anything,
         # although they may print their own warnings or status messages
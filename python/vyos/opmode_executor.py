@@ -0,0 +1,319 @@
+# Copyright 2024 VyOS maintainers and contributors <maintainers@vyos.io>
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+In-process execution of op-mode show functions
+
+Standardized op-mode scripts, those using vyos.opmode.run(), are imported
+once and their show functions are called from a thread pool, instead of
+starting a new interpreter for every command. Raw results are reused for a
+few seconds, so that polling the same data does not query the system for
+every request.
+"""
+
+import io
+import os
+import re
+import shlex
+import sys
+import threading
+import time
+
+from argparse import ArgumentParser
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from contextlib import contextmanager
+
+from vyos.defaults import directories
+from vyos.opmode import DataUnavailable
+from vyos.opmode import InternalError
+from vyos.opmode import _format_raw_output
+from vyos.opmode import _get_arg_parser
+from vyos.opmode import _get_op_mode_functions
+from vyos.utils.system import load_as_module
+
+# Seconds a raw result is reused, per '<script>.<function>', 0 disables it
+cache_ttl_default = 2
+cache_ttl = {
+    'bgp.show_summary': 5,
+    'interfaces.show_summary': 5,
+    'interfaces.show_counters': 5,
+}
+cache_size = 256
+
+max_workers = 8
+call_timeout = 30
+
+_positional = re.compile(r'\$\{?([0-9]+)\}?')
+
+
+class ExecutorBusy(Exception):
+    """
+    All workers are busy, possibly with calls which timed out and are still
+    running; the caller should run the command another way
+    """
+
+
+class _ArgumentParser(ArgumentParser):
+    """Parser raising ValueError instead of exiting the process"""
+    def exit(self, status=0, message=None):
+        raise ValueError(message)
+
+    def error(self, message):
+        raise ValueError(message)
+
+
+class _ThreadOutput:
+    """Standard output which each thread can redirect to a buffer of its own"""
+    def __init__(self, stream):
+        self.stream = stream
+        self.local = threading.local()
+
+    def write(self, s):
+        buffer = getattr(self.local, 'buffer', None)
+        if buffer is None:
+            return self.stream.write(s)
+        return buffer.write(s)
+
+    def flush(self):
+        if getattr(self.local, 'buffer', None) is None:
+            self.stream.flush()
+
+    @contextmanager
+    def capture(self):
+        self.local.buffer = io.StringIO()
+        try:
+            yield self.local.buffer
+        finally:
+            self.local.buffer = None
+
+    def __getattr__(self, name):
+        return getattr(self.stream, name)
+
+
+class OpModeExecutor:
+    """
+    Runs op-mode show functions in the current process
+
+    % executor = OpModeExecutor()
+    % executor.call('bgp.py', 'show_summary', {'family': None}, raw=True)
+    % executor.show(['interfaces', 'ethernet'])
+    """
+    def __init__(self, workers=max_workers, timeout=call_timeout, ttl=None):
+        self.timeout = timeout
+        self.ttl = dict(cache_ttl)
+        self.ttl.update(ttl or {})
+        self.workers = workers
+        self.pool = ThreadPoolExecutor(max_workers=workers,
+                                       thread_name_prefix='op-mode')
+        self._lock = threading.RLock()
+        self._modules = {}
+        self._parsers = {}
+        self._cache = {}
+        self._pending = {}
+        # calls submitted and not yet completed; a call which timed out
+        # cannot be stopped and keeps its worker until it returns
+        self._running = set()
+        self._timed_out = set()
+
+        # functions may print their output instead of returning it
+        if not isinstance(sys.stdout, _ThreadOutput):
+            sys.stdout = _ThreadOutput(sys.stdout)
+        self._stdout = sys.stdout
+
+    def module(self, script):
+        """Imported op-mode script, None if it is not a standardized one"""
+        with self._lock:
+            if script not in self._modules:
+                path = os.path.join(directories['op_mode'], script)
+                module = None
+                with open(path) as f:
+                    if 'vyos.opmode.run(' in f.read():
+                        name = os.path.splitext(script)[0].replace('-', '_')
+                        module = load_as_module(name, path)
+                self._modules[script] = module
+            return self._modules[script]
+
+    def _function(self, script, function):
+        module = self.module(script)
+        if module is None:
+            raise ValueError(f'"{script}" is not a standardized op-mode script')
+        functions = _get_op_mode_functions(module)
+        if not function.startswith('show') or function not in functions:
+            raise ValueError(f'"{script}" has no show function "{function}"')
+        return functions[function]
+
+    def _run(self, func, args):
+        with self._stdout.capture() as output:
+            try:
+                res = func(**args)
+            except SystemExit as e:
+                if e.code:
+                    raise InternalError(output.getvalue() or str(e.code)) from None
+                res = None
+        if args['raw']:
+            return res
+        if res:
+            output.write(f'{res}\n')
+        return output.getvalue()
+
+    def call(self, script, function, args, raw=False):
+        """
+        Call the show function of an op-mode script with keyword arguments
+        args. Raw results are shared between callers and must not be
+        modified, other results are the text the script would print.
+
+        Raises ExecutorBusy rather than queueing the call if all workers
+        are busy.
+        """
+        func = self._function(script, function)
+        args = dict(args, raw=raw)
+
+        ttl = self.ttl.get(f'{os.path.splitext(script)[0]}.{function}', cache_ttl_default)
+        key = None
+        if raw and ttl > 0:
+            key = (script, function, repr(sorted(args.items())))
+
+        with self._lock:
+            if key in self._cache and self._cache[key][0] > time.monotonic():
+                return self._cache[key][1]
+            # identical calls running at the same time share the result
+            future = self._pending.get(key)
+            if future is None:
+                if len(self._running) >= self.workers:
+                    raise ExecutorBusy(f'all {self.workers} op-mode workers are busy, '
+                                       f'{len(self._timed_out)} with calls which timed out')
+                future = self.pool.submit(self._run, func, args)
+                self._running.add(future)
+                future.add_done_callback(self._finished)
+                if key:
+                    self._pending[key] = future
+                    future.add_done_callback(lambda f: self._done(key, f, ttl))
+
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            with self._lock:
+                if not future.done():
+                    self._timed_out.add(future)
+            raise DataUnavailable(f'"{function}" did not complete within {self.timeout}s') from None
+
+    def _finished(self, future):
+        with self._lock:
+            self._running.discard(future)
+            self._timed_out.discard(future)
+
+    def _done(self, key, future, ttl):
+        with self._lock:
+            del self._pending[key]
+            if future.exception():
+                return
+            now = time.monotonic()
+            if len(self._cache) >= cache_size:
+                for k in [k for k, v in self._cache.items() if v[0] <= now]:
+                    del self._cache[k]
+            if len(self._cache) < cache_size:
+                self._cache[key] = (now + ttl, future.result())
+
+    def resolve(self, path):
+        """
+        Returns (script, function, arguments) of the op-mode command
+        'show <path>', None unless it calls a show function of a
+        standardized op-mode script
+        """
+        words = ['show'] + list(path)
+        node = directories['op_templates']
+        for word in words:
+            if ('/' not in word and word not in ('', '.', '..', 'node.tag') and
+                    os.path.isdir(os.path.join(node, word))):
+                node = os.path.join(node, word)
+            elif os.path.isdir(os.path.join(node, 'node.tag')):
+                node = os.path.join(node, 'node.tag')
+            else:
+                return None
+
+        try:
+            with open(os.path.join(node, 'node.def')) as f:
+                node_def = f.read()
+        except OSError:
+            return None
+        command = re.search(r'^run:(.*)', node_def, re.MULTILINE | re.DOTALL)
+        if not command:
+            return None
+        command = command.group(1).strip()
+        # anything beyond a single call with positional arguments is left
+        # to the shell
+        if '\n' in command or re.search(r'[|;&<>`]', command):
+            return None
+        command = command.replace('${vyos_op_scripts_dir}', directories['op_mode'])
+        if '$' in _positional.sub('', command):
+            return None
+
+        try:
+            argv = shlex.split(command)
+        except ValueError:
+            return None
+        if argv and argv[0] == 'sudo':
+            argv = argv[1:]
+        if len(argv) < 2:
+            return None
+        script_dir, script = os.path.split(os.path.normpath(argv[0]))
+        if script_dir != os.path.normpath(directories['op_mode']) or not script.endswith('.py'):
+            return None
+
+        def position(m):
+            n = int(m.group(1))
+            return words[n - 1] if 0 < n <= len(words) else ''
+
+        argv = [_positional.sub(position, arg) for arg in argv[1:]]
+
+        module = self.module(script)
+        if module is None:
+            return None
+        with self._lock:
+            if script not in self._parsers:
+                functions = _get_op_mode_functions(module)
+                self._parsers[script] = _get_arg_parser(functions, _ArgumentParser)
+            parser = self._parsers[script]
+        try:
+            args = vars(parser.parse_args(argv))
+        except ValueError:
+            return None
+
+        function = args.pop('subcommand')
+        if not function or not function.startswith('show'):
+            return None
+        return script, function, args
+
+    def show(self, path):
+        """
+        Output of the op-mode command 'show <path>', None if it cannot be
+        run in process or all workers are busy
+        """
+        resolved = self.resolve(path)
+        if resolved is None:
+            return None
+        script, function, args = resolved
+        raw = args.pop('raw', False)
+        try:
+            res = self.call(script, function, args, raw=raw)
+        except ExecutorBusy:
+            return None
+        if raw:
+            return _format_raw_output(res) + '\n'
+        return res
+
+    def shutdown(self):
+        self.pool.shutdown(wait=False, cancel_futures=True)
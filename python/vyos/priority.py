@@ -15,11 +15,12 @@
 
 from pathlib import Path
 from typing import List
+from collections.abc import Mapping
 
 from vyos.xml_ref import load_reference
 from vyos.base import Warning as Warn
 
-def priority_data(d: dict) -> list:
+def priority_data(d: Mapping) -> list:
     def func(d, path, res, hier):
         for k,v in d.items():
             if not 'node_data' in v:
@@ -39,7 +40,7 @@ def func(d, path, res, hier):
                 o = Path(o.split()[0]).name
                 p = int(p)
                 res.append((subpath, o, p))
-            if isinstance(v, dict):
+            if isinstance(v, Mapping):
                 func(v, subpath, res, hier_prio)
         return res
     ret = func(d, [], [], 0)
@@ -0,0 +1,318 @@
+# Copyright 2024 VyOS maintainers and contributors <maintainers@vyos.io>
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+In-process reachability probes
+
+Targets are checked by ICMP echo over raw sockets, by ARP request over packet
+sockets, or by TCP connect, all from one asyncio event loop so that any
+number of targets can be checked at the same time. ICMP and ARP use one
+socket per interface, replies are dispatched to the waiting probes.
+"""
+
+import asyncio
+import itertools
+import os
+import socket
+import struct
+import time
+
+from bisect import bisect_left
+
+ICMP_ECHO_REPLY = 0
+ICMP_ECHO_REQUEST = 8
+
+ETH_P_IP = 0x0800
+ETH_P_ARP = 0x0806
+ARP_REQUEST = 1
+ARP_REPLY = 2
+
+SO_BINDTODEVICE = getattr(socket, 'SO_BINDTODEVICE', 25)
+
+# Requests sent per probe and how long to wait for each reply, in seconds
+probe_attempts = {'icmp': 2, 'arp': 2, 'tcp': 1}
+probe_timeout = {'icmp': 1, 'arp': 1, 'tcp': 2}
+
+
+class ProbeError(Exception):
+    """Probe could not be sent"""
+
+
+def checksum(data):
+    """Internet checksum (RFC 1071)"""
+    if len(data) % 2:
+        data += b'\0'
+    total = sum(struct.unpack(f'!{len(data) // 2}H', data))
+    while total >> 16:
+        total = (total & 0xffff) + (total >> 16)
+    return ~total & 0xffff
+
+
+def icmp_echo_request(ident, seq, payload=b''):
+    header = struct.pack('!BBHHH', ICMP_ECHO_REQUEST, 0, 0, ident, seq)
+    csum = checksum(header + payload)
+    return struct.pack('!BBHHH', ICMP_ECHO_REQUEST, 0, csum, ident, seq) + payload
+
+
+def parse_icmp_echo_reply(packet):
+    """
+    Return (source, identifier, sequence) of an echo reply as received on
+    a raw socket, including the IPv4 header, None for any other packet
+    """
+    if len(packet) < 20:
+        return None
+    ihl = (packet[0] & 0x0f) * 4
+    if len(packet) < ihl + 8:
+        return None
+    icmp_type, _, _, ident, seq = struct.unpack_from('!BBHHH', packet, ihl)
+    if icmp_type != ICMP_ECHO_REPLY:
+        return None
+    return socket.inet_ntoa(packet[12:16]), ident, seq
+
+
+def arp_request(src_mac, src_ip, target):
+    """Broadcast Ethernet frame asking for the address of target"""
+    ethernet = b'\xff' * 6 + src_mac + struct.pack('!H', ETH_P_ARP)
+    arp = struct.pack('!HHBBH6s4s6s4s', 1, ETH_P_IP, 6, 4, ARP_REQUEST,
+                      src_mac, socket.inet_aton(src_ip),
+                      b'\0' * 6, socket.inet_aton(target))
+    return ethernet + arp
+
+
+def parse_arp_reply(frame):
+    """Return the sender address of an ARP reply, None for any other frame"""
+    if len(frame) < 42:
+        return None
+    if struct.unpack_from('!H', frame, 12)[0] != ETH_P_ARP:
+        return None
+    _, ptype, _, plen, op = struct.unpack_from('!HHBBH', frame, 14)
+    if op != ARP_REPLY or ptype != ETH_P_IP or plen != 4:
+        return None
+    return socket.inet_ntoa(frame[28:32])
+
+
+def _source_address(iface, target):
+    """Address the kernel would use to reach target over iface"""
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as s:
+        try:
+            s.setsockopt(socket.SOL_SOCKET, SO_BINDTODEVICE, iface.encode())
+            s.connect((target, 9))
+            return s.getsockname()[0]
+        except OSError:
+            # ARP probe (RFC 5227), still answered by the target
+            return '0.0.0.0'
+
+
+class _Listener:
+    """
+    Socket shared by the probes of one kind on one interface. Received
+    packets are parsed into a key, waking up the probes waiting for it.
+    """
+    def __init__(self, sock, parse):
+        self.sock = sock
+        self.parse = parse
+        self.waiting = {}
+        self.loop = asyncio.get_running_loop()
+        sock.setblocking(False)
+        self.loop.add_reader(sock.fileno(), self._read)
+
+    def _read(self):
+        while True:
+            try:
+                data = self.sock.recv(65535)
+            except OSError:
+                return
+            received = time.perf_counter()
+            for future in self.waiting.get(self.parse(data), ()):
+                if not future.done():
+                    future.set_result(received)
+
+    async def request(self, key, packet, address=None, timeout=1):
+        """Send packet, return the round-trip time or None without reply"""
+        future = self.loop.create_future()
+        self.waiting.setdefault(key, set()).add(future)
+        try:
+            start = time.perf_counter()
+            if address:
+                self.sock.sendto(packet, address)
+            else:
+                self.sock.send(packet)
+            return await asyncio.wait_for(future, timeout) - start
+        except (asyncio.TimeoutError, OSError):
+            return None
+        finally:
+            self.waiting[key].discard(future)
+            if not self.waiting[key]:
+                del self.waiting[key]
+
+    def close(self):
+        self.loop.remove_reader(self.sock.fileno())
+        self.sock.close()
+
+
+class ProbeEngine:
+    """
+    Sends the probes, must be used from within a running event loop
+
+    % engine = ProbeEngine()
+    % await engine.probe('icmp', '192.0.2.1', iface='eth1')
+    0.00042
+    """
+    def __init__(self):
+        self._listeners = {}
+        self._ident = os.getpid() & 0xffff
+        self._seq = itertools.count()
+        self._src = {}
+
+    def _listener(self, proto, iface):
+        key = (proto, iface)
+        if key in self._listeners:
+            return self._listeners[key]
+
+        try:
+            if proto == 'icmp':
+                sock = socket.socket(socket.AF_INET, socket.SOCK_RAW, socket.IPPROTO_ICMP)
+                if iface:
+                    sock.setsockopt(socket.SOL_SOCKET, SO_BINDTODEVICE, iface.encode())
+                listener = _Listener(sock, parse_icmp_echo_reply)
+            else:
+                sock = socket.socket(socket.AF_PACKET, socket.SOCK_RAW, socket.htons(ETH_P_ARP))
+                sock.bind((iface, ETH_P_ARP))
+                listener = _Listener(sock, parse_arp_reply)
+        except OSError as e:
+            raise ProbeError(f'cannot open {proto} socket on "{iface}": {e}') from e
+
+        self._listeners[key] = listener
+        return listener
+
+    async def icmp(self, target, iface=None, timeout=1):
+        listener = self._listener('icmp', iface)
+        seq = next(self._seq) & 0xffff
+        packet = icmp_echo_request(self._ident, seq, struct.pack('!d', time.time()))
+        return await listener.request((target, self._ident, seq), packet,
+                                      (target, 0), timeout)
+
+    async def arp(self, target, iface, timeout=1):
+        if not iface:
+            raise ProbeError('ARP probe requires an interface')
+        listener = self._listener('arp', iface)
+        if (iface, target) not in self._src:
+            self._src[(iface, target)] = _source_address(iface, target)
+        mac = listener.sock.getsockname()[4]
+        packet = arp_request(mac, self._src[(iface, target)], target)
+        return await listener.request(target, packet, timeout=timeout)
+
+    async def tcp(self, target, port, timeout=2):
+        loop = asyncio.get_running_loop()
+        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+            sock.setblocking(False)
+            start = time.perf_counter()
+            try:
+                await asyncio.wait_for(loop.sock_connect(sock, (target, int(port))), timeout)
+            except (asyncio.TimeoutError, OSError):
+                return None
+            rtt = time.perf_counter() - start
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            return rtt
+
+    async def probe(self, proto, target, iface=None, port=None):
+        """
+        Check target with up to probe_attempts[proto] requests. Returns the
+        round-trip time of the first answered one, or None.
+        """
+        for _ in range(probe_attempts[proto]):
+            timeout = probe_timeout[proto]
+            if proto == 'icmp':
+                rtt = await self.icmp(target, iface, timeout)
+            elif proto == 'arp':
+                rtt = await self.arp(target, iface, timeout)
+            elif proto == 'tcp' and port is not None:
+                rtt = await self.tcp(target, port, timeout)
+            else:
+                raise ProbeError(f'unsupported probe "{proto}"')
+            if rtt is not None:
+                return rtt
+        return None
+
+    def close(self):
+        for listener in self._listeners.values():
+            listener.close()
+        self._listeners.clear()
+
+
+class RttHistogram:
+    """Round-trip times counted in buckets of upper bounds in milliseconds"""
+    bounds = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000)
+
+    def __init__(self):
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.lost = 0
+        self.total = 0.0
+
+    def add(self, rtt):
+        if rtt is None:
+            self.lost += 1
+            return
+        ms = rtt * 1000
+        self.counts[bisect_left(self.bounds, ms)] += 1
+        self.total += ms
+
+    def to_dict(self):
+        buckets = {f'<={bound}': count for bound, count in zip(self.bounds, self.counts)}
+        buckets[f'>{self.bounds[-1]}'] = self.counts[-1]
+        received = sum(self.counts)
+        return {
+            'buckets_ms': buckets,
+            'received': received,
+            'lost': self.lost,
+            'average_ms': round(self.total / received, 3) if received else None,
+        }
+
+
+class TargetState:
+    """
+    Target is up after rise consecutive answered probes and down after fall
+    consecutive failed ones, and unknown until either happened
+    """
+    def __init__(self, rise=1, fall=1):
+        self.rise = rise
+        self.fall = fall
+        self.state = 'unknown'
+        self.successes = 0
+        self.failures = 0
+        self.histogram = RttHistogram()
+
+    @property
+    def alive(self):
+        return self.state == 'up'
+
+    def update(self, rtt):
+        """Account probe result, returns True if the state changed"""
+        self.histogram.add(rtt)
+        if rtt is None:
+            self.successes = 0
+            self.failures += 1
+            new_state = 'down' if self.failures >= self.fall else self.state
+        else:
+            self.failures = 0
+            self.successes += 1
+            new_state = 'up' if self.successes >= self.rise else self.state
+
+        changed = new_state != self.state
+        self.state = new_state
+        return changed
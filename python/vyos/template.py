@@ -14,11 +14,16 @@
 # License along with this library.  If not, see <http://www.gnu.org/licenses/>.
 
 import functools
+import hashlib
+import json
 import os
 
+from jinja2 import __version__ as jinja2_version
 from jinja2 import Environment
 from jinja2 import FileSystemLoader
+from jinja2 import ModuleLoader
 from jinja2 import ChainableUndefined
+from jinja2 import TemplateNotFound
 from vyos.defaults import directories
 from vyos.utils.dict import dict_search_args
 from vyos.utils.file import makedir
@@ -33,19 +38,60 @@
 # to the repository path.
 DEFAULT_TEMPLATE_DIR = directories["templates"]
 
+# Templates of DEFAULT_TEMPLATE_DIR compiled to Python modules when the
+# package is built, see precompile_templates()
+PRECOMPILED_TEMPLATE_DIR = directories["templates_compiled"]
+_PRECOMPILED_MANIFEST = 'manifest.json'
+
 # Holds template filters registered via register_filter()
 _FILTERS = {}
 _TESTS = {}
 
+def _source_hash(source):
+    return hashlib.sha256(source.encode()).hexdigest()
+
+class _PrecompiledLoader(FileSystemLoader):
+    """FileSystemLoader using the modules written by precompile_templates()
+
+    A precompiled template is only used if its source file is unchanged
+    since it was compiled, any other template is compiled as usual.
+    """
+    def __init__(self, searchpath, compiled):
+        super().__init__(searchpath)
+        with open(os.path.join(compiled, _PRECOMPILED_MANIFEST)) as f:
+            manifest = json.load(f)
+        # code generated by another Jinja2 version may not run
+        if manifest.get('jinja2') == jinja2_version:
+            self.hashes = manifest.get('templates', {})
+        else:
+            self.hashes = {}
+        self.modules = ModuleLoader(compiled)
+
+    def load(self, environment, name, globals=None):
+        source, filename, uptodate = self.get_source(environment, name)
+        if self.hashes.get(name) == _source_hash(source):
+            try:
+                return self.modules.load(environment, name, globals)
+            except TemplateNotFound:
+                pass
+        code = environment.compile(source, name, filename)
+        return environment.template_class.from_code(environment, code,
+                                                    globals or {}, uptodate)
+
+def _get_loader(location):
+    if location is None:
+        location = DEFAULT_TEMPLATE_DIR
+        if os.path.isfile(os.path.join(PRECOMPILED_TEMPLATE_DIR, _PRECOMPILED_MANIFEST)):
+            try:
+                return _PrecompiledLoader(location, PRECOMPILED_TEMPLATE_DIR)
+            except (OSError, ValueError):
+                pass
+    return FileSystemLoader(location)
+
 # reuse Environments with identical settings to improve performance
 @functools.lru_cache(maxsize=2)
 def _get_environment(location=None):
-    from os import getenv
-
-    if location is None:
-        loc_loader=FileSystemLoader(DEFAULT_TEMPLATE_DIR)
-    else:
-        loc_loader=FileSystemLoader(location)
+    loc_loader = _get_loader(location)
     env = Environment(
         # Don't check if template files were modified upon re-rendering
         auto_reload=False,
@@ -112,10 +158,9 @@ def render_to_string(template, content, formater=None, location=None):
 
     The parsed template files are cached, so rendering the same file multiple times
     does not cause as too much overhead.
-    If used everywhere, it could be changed to load the template from Python
-    environment variables from an importable Python module generated when the Debian
-    package is build (recovering the load time and overhead caused by having the
-    file out of the code).
+    Templates from the default template directory are loaded from the Python
+    modules generated when the Debian package is built, see precompile_templates(),
+    so that a process rendering a template does not have to compile it first.
     """
     template = _get_environment(location).get_template(template)
     rendered = template.render(content)
@@ -124,6 +169,44 @@ def render_to_string(template, content, formater=None, location=None):
     return rendered
 
 
+def precompile_templates(target, location=None):
+    """Compile all templates of a template directory to Python modules.
+
+    :param target: directory to write the modules and their manifest to
+    :param location: template directory, DEFAULT_TEMPLATE_DIR if not given
+
+    The templates are compiled with the settings and filters used for rendering,
+    the manifest records a hash of each template source so that a modified
+    template is compiled again when loaded.
+
+    :raise TemplateSyntaxError: when a template cannot be compiled
+    """
+    import compileall
+    from py_compile import PycInvalidationMode
+
+    if location is None:
+        location = DEFAULT_TEMPLATE_DIR
+    env = _get_environment(location)
+    names = env.list_templates(extensions=['j2'])
+
+    makedir(target)
+    env.compile_templates(target, filter_func=set(names).__contains__,
+                          zip=None, ignore_errors=False)
+    # generated modules are never edited, their bytecode need not be
+    # checked against the source
+    compileall.compile_dir(target, quiet=1,
+                           invalidation_mode=PycInvalidationMode.UNCHECKED_HASH)
+
+    hashes = {}
+    for name in names:
+        source, _, _ = env.loader.get_source(env, name)
+        hashes[name] = _source_hash(source)
+    manifest = {'jinja2': jinja2_version, 'templates': hashes}
+    with open(os.path.join(target, _PRECOMPILED_MANIFEST), 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    return names
+
+
 def render(
     destination,
     template,
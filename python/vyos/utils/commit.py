@@ -13,6 +13,19 @@
 # You should have received a copy of the GNU Lesser General Public
 # License along with this library.  If not, see <http://www.gnu.org/licenses/>.
 
+def commit_generation():
+    """
+    Number of commits since boot, or None if it is unknown. The running
+    config did not change as long as it returns the same number.
+    """
+    from vyos.defaults import commit_generation
+
+    try:
+        with open(commit_generation) as f:
+            return int(f.read())
+    except (OSError, ValueError):
+        return None
+
 def commit_in_progress():
     """ Not to be used in normal op mode scripts! """
 
@@ -13,6 +13,7 @@
 # You should have received a copy of the GNU Lesser General Public License
 # along with this library.  If not, see <http://www.gnu.org/licenses/>.
 
+import os
 from typing import Optional, Union, TYPE_CHECKING
 from vyos.xml_ref import definition
 from vyos.xml_ref import op_definition
@@ -26,10 +27,16 @@ def load_reference(cache=[]):
 
     xml = definition.Xml()
 
+    # prefer the memory-mapped binary cache, which is decoded lazily
+    binary_cache = os.path.join(os.path.dirname(__file__), 'cache.bin')
     try:
-        from vyos.xml_ref.cache import reference
-    except Exception:
-        raise ImportError('no xml reference cache !!')
+        from vyos.xml_ref.binary_cache import load
+        reference = load(binary_cache)
+    except (OSError, ValueError):
+        try:
+            from vyos.xml_ref.cache import reference
+        except Exception:
+            raise ImportError('no xml reference cache !!')
 
     if not reference:
         raise ValueError('empty xml reference cache !!')
@@ -83,6 +90,9 @@ def relative_defaults(rpath: list, conf: dict, get_first_key=False,
                                               get_first_key=get_first_key,
                                               recursive=recursive)
 
+def defaults_cache_stats(reset=False) -> dict:
+    return load_reference().defaults_cache_stats(reset=reset)
+
 def from_source(d: dict, path: list) -> bool:
     return definition.from_source(d, path)
 
@@ -0,0 +1,185 @@
+# Copyright 2024 VyOS maintainers and contributors <maintainers@vyos.io>
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this library.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Binary, memory-mapped form of the XML reference cache
+
+The reference dict is stored as a flat node table, in which each node
+points to a contiguous range of child entries. An entry holds the name of
+the child and either the index of a child node, or the location of a JSON
+encoded value in the string table; dicts of scalars, such as 'node_data',
+are stored as a single value. The file is mmapped and nodes are decoded
+on first access only, so that a process pays for the parts of the
+reference tree it actually queries.
+
+This module is used by the cache generation scripts at build and install
+time, hence depends on the standard library only.
+"""
+
+import os
+import json
+import mmap
+import struct
+from collections.abc import Mapping
+
+MAGIC = b'VYXR'
+VERSION = 1
+
+# magic, version, node count, offsets of node table, entry table, strings
+_header = struct.Struct('<4sIIIII')
+# first entry, entry count
+_node = struct.Struct('<II')
+# name offset, name length, kind, value offset or node index, value length
+_entry = struct.Struct('<IHHII')
+
+KIND_NODE = 0
+KIND_VALUE = 1
+
+
+def _has_subtree(d: dict) -> bool:
+    return any(isinstance(v, dict) for v in d.values())
+
+
+def dump(ref: dict, path: str):
+    """Write reference dict in binary format to path
+    """
+    nodes: list = []
+    entries: list = []
+    strings = bytearray()
+    interned: dict = {}
+
+    def intern(b: bytes) -> tuple:
+        if b not in interned:
+            interned[b] = (len(strings), len(b))
+            strings.extend(b)
+        return interned[b]
+
+    def add(d: dict) -> int:
+        index = len(nodes)
+        nodes.append(None)
+        node_entries = []
+        for k, v in d.items():
+            name = intern(k.encode())
+            if isinstance(v, dict) and _has_subtree(v):
+                node_entries.append((*name, KIND_NODE, add(v), 0))
+            else:
+                value = intern(json.dumps(v).encode())
+                node_entries.append((*name, KIND_VALUE, *value))
+        nodes[index] = (len(entries), len(node_entries))
+        entries.extend(node_entries)
+        return index
+
+    add(ref)
+
+    nodes_off = _header.size
+    entries_off = nodes_off + len(nodes) * _node.size
+    strings_off = entries_off + len(entries) * _entry.size
+
+    buf = bytearray(strings_off)
+    _header.pack_into(buf, 0, MAGIC, VERSION, len(nodes), nodes_off,
+                      entries_off, strings_off)
+    for i, n in enumerate(nodes):
+        _node.pack_into(buf, nodes_off + i * _node.size, *n)
+    for i, e in enumerate(entries):
+        _entry.pack_into(buf, entries_off + i * _entry.size, *e)
+    buf.extend(strings)
+
+    tmp = f'{path}.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(buf)
+    os.replace(tmp, path)
+
+
+class _Table:
+    """Shared view of the mapped file"""
+    __slots__ = ('buf', 'nodes_off', 'entries_off', 'strings_off')
+
+    def __init__(self, buf):
+        magic, version, _, nodes_off, entries_off, strings_off = \
+            _header.unpack_from(buf, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError('invalid binary xml reference cache')
+        self.buf = buf
+        self.nodes_off = nodes_off
+        self.entries_off = entries_off
+        self.strings_off = strings_off
+
+    def string(self, offset: int, length: int) -> str:
+        start = self.strings_off + offset
+        return self.buf[start:start + length].decode()
+
+
+class Node(Mapping):
+    """Read-only dict view of a node of the binary reference cache
+
+    Child entries are decoded on first access to the node; child nodes
+    and values are materialized on first access to each.
+    """
+    __slots__ = ('_table', '_index', '_entries', '_values')
+
+    def __init__(self, table: _Table, index: int):
+        self._table = table
+        self._index = index
+        self._entries = None
+        self._values: dict = {}
+
+    def _load(self) -> dict:
+        if self._entries is None:
+            t = self._table
+            first, count = _node.unpack_from(t.buf,
+                                             t.nodes_off + self._index * _node.size)
+            entries = {}
+            offset = t.entries_off + first * _entry.size
+            for _ in range(count):
+                name_off, name_len, kind, a, b = _entry.unpack_from(t.buf, offset)
+                entries[t.string(name_off, name_len)] = (kind, a, b)
+                offset += _entry.size
+            self._entries = entries
+        return self._entries
+
+    def __getitem__(self, key):
+        if key in self._values:
+            return self._values[key]
+        kind, a, b = self._load()[key]
+        if kind == KIND_NODE:
+            value = Node(self._table, a)
+        else:
+            value = json.loads(self._table.string(a, b))
+        self._values[key] = value
+        return value
+
+    def __contains__(self, key):
+        return key in self._load()
+
+    def __iter__(self):
+        return iter(self._load())
+
+    def __len__(self):
+        return len(self._load())
+
+    def __repr__(self):
+        return f'{type(self).__name__}({list(self)})'
+
+    def to_dict(self) -> dict:
+        """Materialize the subtree as dict"""
+        return {k: v.to_dict() if isinstance(v, Node) else v
+                for k, v in self.items()}
+
+
+def load(path: str) -> Node:
+    """Map binary reference cache at path and return root node
+    """
+    with open(path, 'rb') as f:
+        buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    return Node(_Table(buf), 0)
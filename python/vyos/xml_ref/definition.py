@@ -14,6 +14,7 @@
 # along with this library.  If not, see <http://www.gnu.org/licenses/>.
 
 from typing import Tuple, Optional, Union, Any, TYPE_CHECKING
+from collections.abc import Mapping
 
 # https://peps.python.org/pep-0484/#forward-references
 # for type 'ConfigDict'
@@ -59,12 +60,22 @@ def from_source(d: dict, path: list) -> bool:
             return False
     return d.get('_source', False)
 
+def copy_defaults(o: Union[dict, list, str]) -> Union[dict, list, str]:
+    if isinstance(o, dict):
+        return {k: copy_defaults(v) for k, v in o.items()}
+    if isinstance(o, list):
+        return list(o)
+    return o
+
 class Xml:
     def __init__(self):
         self.ref = {}
+        self._defaults_cache: dict = {}
+        self._defaults_stats = {'hits': 0, 'misses': 0}
 
-    def define(self, ref: dict):
+    def define(self, ref: Mapping):
         self.ref = ref
+        self._defaults_cache.clear()
 
     def _get_ref_node_data(self, node: dict, data: str) -> Union[bool, str]:
         res = node.get('node_data', {})
@@ -202,7 +213,7 @@ def priority(self, path: list) -> str:
     def _dict_get(d: dict, path: list) -> dict:
         for i in path:
             d = d.get(i, {})
-            if not isinstance(d, dict):
+            if not isinstance(d, Mapping):
                 return {}
             if not d:
                 break
@@ -214,7 +225,7 @@ def _dict_find(self, d: dict, key: str, non_local=False) -> bool:
                 continue
             if k == key:
                 return True
-            if non_local and isinstance(d[k], dict):
+            if non_local and isinstance(d[k], Mapping):
                 if self._dict_find(d[k], key):
                     return True
         return False
@@ -264,16 +275,32 @@ def default_value(self, path: list) -> Optional[Union[str, list]]:
             return default.split()
         return default
 
-    def get_defaults(self, path: list, get_first_key=False, recursive=False) -> dict:
-        """Return dict containing default values below path
+    def _schema_path(self, path: list) -> tuple:
+        """Return path with tag node values collapsed to None"""
+        res = []
+        ref_path = path.copy()
+        d = self.ref
+        while ref_path and d:
+            d = d.get(ref_path[0], {})
+            res.append(ref_path.pop(0))
+            if self._is_tag_node(d) and ref_path:
+                ref_path.pop(0)
+                res.append(None)
+        return tuple(res + ref_path)
 
-        Note that descent below path will not proceed beyond an encountered
-        tag node, as no tag node value is known. For a default dict relative
-        to an existing config dict containing tag node values, see function:
-        'relative_defaults'
+    def _defaults(self, path: list, recursive=False) -> Union[dict, str, list]:
+        """Return the defaults below path, or the default value of a leaf
+        node; the result is a cached template and must not be modified
         """
+        key = (self._schema_path(path), recursive)
+        if key in self._defaults_cache:
+            self._defaults_stats['hits'] += 1
+            return self._defaults_cache[key]
+        self._defaults_stats['misses'] += 1
+
         res: dict = {}
         if self.is_tag(path):
+            self._defaults_cache[key] = res
             return res
 
         d = self._get_ref_path(path)
@@ -281,7 +308,8 @@ def get_defaults(self, path: list, get_first_key=False, recursive=False) -> dict
         if self._is_leaf_node(d):
             default_value = self._get_default(d)
             if default_value is not None:
-                return {path[-1]: default_value} if path else {}
+                self._defaults_cache[key] = default_value
+                return default_value
 
         for k in list(d):
             if k in ('node_data', 'component_version') :
@@ -296,9 +324,39 @@ def get_defaults(self, path: list, get_first_key=False, recursive=False) -> dict
                 pass
             else:
                 if recursive:
-                    pos = self.get_defaults(path + [k], recursive=True)
-                    res |= pos
+                    pos = self._defaults(path + [k], recursive=True)
+                    if pos:
+                        res |= {k: pos}
+
+        self._defaults_cache[key] = res
+        return res
+
+    def defaults_cache_stats(self, reset=False) -> dict:
+        """Return hits and misses since the last reset and the cache size"""
+        stats = self._defaults_stats | {'size': len(self._defaults_cache)}
+        if reset:
+            self._defaults_stats = {'hits': 0, 'misses': 0}
+        return stats
+
+    def get_defaults(self, path: list, get_first_key=False, recursive=False) -> dict:
+        """Return dict containing default values below path
+
+        Note that descent below path will not proceed beyond an encountered
+        tag node, as no tag node value is known. For a default dict relative
+        to an existing config dict containing tag node values, see function:
+        'relative_defaults'
+
+        Defaults are cached per schema path, with tag node values collapsed;
+        a copy of the cached template is returned.
+        """
+        res = self._defaults(path, recursive=recursive)
+
+        if not isinstance(res, dict):
+            # default value of leaf node
+            return {path[-1]: copy_defaults(res)} if path else {}
+
         if res:
+            res = copy_defaults(res)
             if get_first_key or not path:
                 return res
             return {path[-1]: res}
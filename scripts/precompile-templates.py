@@ -0,0 +1,39 @@
+#!/usr/bin/env python3
+# Copyright (C) 2024 VyOS maintainers and contributors
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 2 or later as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Compile the Jinja2 templates to Python modules, installed along with
+# the templates and loaded by vyos.template instead of the template sources
+
+import sys
+
+from argparse import ArgumentParser
+from jinja2 import TemplateSyntaxError
+
+from vyos.template import precompile_templates
+
+parser = ArgumentParser(description='precompile Jinja2 templates')
+parser.add_argument('--template-dir', type=str, required=True,
+                    help='directory of the templates to compile')
+parser.add_argument('--output-dir', type=str, required=True,
+                    help='directory to write the compiled templates to')
+args = parser.parse_args()
+
+try:
+    names = precompile_templates(args.output_dir, location=args.template_dir)
+except TemplateSyntaxError as e:
+    print(f'Cannot compile template "{e.name}" line {e.lineno}: {e.message}')
+    sys.exit(1)
+
+print(f'Precompiled {len(names)} templates to {args.output_dir}')
@@ -133,6 +133,42 @@ def test_cgnat_sequence(self):
 
         self.verify_nftables(nftables_search, 'ip cgnat', inverse=False, args='-s')
 
+    def test_cgnat_incremental(self):
+        internal_name = 'vyos-int-01'
+        external_name = 'vyos-ext-01'
+        rule = '100'
+
+        self.cli_set(base_path + ['pool', 'external', external_name, 'external-port-range', '40000-60000'])
+        self.cli_set(base_path + ['pool', 'external', external_name, 'per-user-limit', 'port', '5000'])
+        self.cli_set(base_path + ['pool', 'external', external_name, 'range', '192.0.2.1-192.0.2.2'])
+        self.cli_set(base_path + ['pool', 'internal', internal_name, 'range', '100.64.0.0/30'])
+        self.cli_set(base_path + ['pool', 'internal', internal_name, 'range', '100.64.0.4/30'])
+        self.cli_set(base_path + ['rule', rule, 'source', 'pool', internal_name])
+        self.cli_set(base_path + ['rule', rule, 'translation', 'pool', external_name])
+        self.cli_commit()
+
+        # the remaining subscribers keep their port blocks
+        self.cli_delete(base_path + ['pool', 'internal', internal_name, 'range', '100.64.0.0/30'])
+        self.cli_commit()
+
+        nftables_search = [
+            ['100.64.0.4 : 192.0.2.2 . 40000-44999'],
+            ['100.64.0.7 : 192.0.2.2 . 55000-59999'],
+        ]
+        self.verify_nftables(nftables_search, 'ip cgnat', inverse=False, args='-s')
+        self.verify_nftables([['100.64.0.0 :']], 'ip cgnat', inverse=True, args='-s')
+
+        # new subscribers are given the free port blocks
+        self.cli_set(base_path + ['pool', 'internal', internal_name, 'range', '100.64.0.8/30'])
+        self.cli_commit()
+
+        nftables_search = [
+            ['100.64.0.4 : 192.0.2.2 . 40000-44999'],
+            ['100.64.0.8 : 192.0.2.1 . 40000-44999'],
+            ['100.64.0.11 : 192.0.2.1 . 55000-59999'],
+        ]
+        self.verify_nftables(nftables_search, 'ip cgnat', inverse=False, args='-s')
+
 
 if __name__ == '__main__':
     unittest.main(verbosity=2)
@@ -359,6 +359,34 @@ def test_api_add_delete(self):
         # api deleted; expect 503
         self.assertEqual(r.status_code, 503)
 
+    @ignore_warning(InsecureRequestWarning)
+    def test_api_retrieve_after_commit(self):
+        address = '127.0.0.1'
+        key = 'VyOS-key'
+        url = f'https://{address}/retrieve'
+        headers = {}
+
+        self.cli_set(base_path + ['api', 'keys', 'id', 'key-01', 'key', key])
+        self.cli_set(base_path + ['api', 'rest'])
+        self.cli_commit()
+        sleep(2)
+
+        path = json.dumps(base_path + ['api', 'graphql'])
+        payload = {'data': f'{{"op": "exists", "path": {path}}}', 'key': key}
+        for _ in range(2):
+            r = request('POST', url, verify=False, headers=headers, data=payload)
+            self.assertEqual(r.status_code, 200)
+            self.assertFalse(r.json()['data'])
+
+        # cached responses must not outlive a commit
+        self.cli_set(base_path + ['api', 'graphql'])
+        self.cli_commit()
+        sleep(2)
+
+        r = request('POST', url, verify=False, headers=headers, data=payload)
+        self.assertEqual(r.status_code, 200)
+        self.assertTrue(r.json()['data'])
+
     @ignore_warning(InsecureRequestWarning)
     def test_api_show(self):
         address = '127.0.0.1'
@@ -421,6 +449,48 @@ def test_api_configure(self):
         r = request('POST', url, verify=False, headers=headers, data=payload)
         self.assertEqual(r.status_code, 200)
 
+    @ignore_warning(InsecureRequestWarning)
+    def test_api_commit_queue(self):
+        address = '127.0.0.1'
+        key = 'VyOS-key'
+        url = f'https://{address}/configure'
+        url_queue = f'https://{address}/commit-queue'
+        headers = {}
+        conf_addresses = {'dum0': '192.0.2.44/32', 'dum1': 'invalid'}
+
+        self.cli_set(base_path + ['api', 'keys', 'id', 'key-01', 'key', key])
+        self.cli_set(base_path + ['api', 'rest', 'commit-queue'])
+        self.cli_commit()
+        sleep(2)
+
+        jobs = []
+        for interface, conf_address in conf_addresses.items():
+            payload_path = ['interfaces', 'dummy', interface, 'address', conf_address]
+            payload = {'data': json.dumps({'op': 'set', 'path': payload_path}), 'key': key}
+            r = request('POST', url, verify=False, headers=headers, data=payload)
+            self.assertEqual(r.status_code, 200)
+            jobs.append(r.json()['data']['job_id'])
+
+        # the job with the invalid address fails on its own
+        for job_id, expected in zip(jobs, ['committed', 'failed']):
+            payload = {'data': json.dumps({'op': 'status', 'id': job_id}), 'key': key}
+            for _ in range(60):
+                r = request('POST', url_queue, verify=False, headers=headers, data=payload)
+                self.assertEqual(r.status_code, 200)
+                if r.json()['data']['status'] in ['committed', 'failed']:
+                    break
+                sleep(1)
+            self.assertEqual(r.json()['data']['status'], expected)
+
+        payload = {'data': json.dumps({'op': 'status'}), 'key': key}
+        r = request('POST', url_queue, verify=False, headers=headers, data=payload)
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual(r.json()['data']['queued'], 0)
+        self.assertEqual(r.json()['data']['committed'], 1)
+
+        self.cli_delete(['interfaces', 'dummy'])
+        self.cli_commit()
+
     @ignore_warning(InsecureRequestWarning)
     def test_api_config_file(self):
         address = '127.0.0.1'
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+#
+# Copyright (C) 2024 VyOS maintainers and contributors
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 2 or later as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import tempfile
+import unittest
+from ipaddress import ip_address
+from time import perf_counter
+
+from vyos.cgnat import AllocationIndex
+from vyos.cgnat import PortBlockAllocator
+from vyos.cgnat import load_allocation
+from vyos.cgnat import range_to_ints
+from vyos.cgnat import save_allocation
+
+# 4194304 subscribers with 128 ports each on 16384 external addresses
+INTERNAL = '100.64.0.0/10'
+EXTERNAL = '198.18.0.0/18'
+PORT_RANGE = '1024-65535'
+PORTS = 128
+
+class TestCGNATAllocation(unittest.TestCase):
+    def test_incremental_update(self):
+        first, last = range_to_ints(EXTERNAL)
+        externals = list(range(first, last + 1))
+
+        start = perf_counter()
+        alloc = PortBlockAllocator(externals, PORT_RANGE, PORTS)
+        _, internal, _ = alloc.update([range_to_ints(INTERNAL)])
+        full_time = perf_counter() - start
+        self.assertEqual(len(internal), 2 ** 22)
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'state')
+            start = perf_counter()
+            save_allocation({'100': alloc}, path)
+            save_time = perf_counter() - start
+
+            # next commit: one subscriber /24 is added
+            start = perf_counter()
+            previous = load_allocation(path)['100']
+            update = PortBlockAllocator(externals, PORT_RANGE, PORTS)
+            moved = update.adopt(previous)
+            released, internal, slot = update.update([range_to_ints(INTERNAL),
+                                                      range_to_ints('10.0.0.0/24')])
+            update_time = perf_counter() - start
+
+        print(f'{INTERNAL}: full allocation {full_time:.2f}s, '
+              f'state saved in {save_time:.2f}s, '
+              f'adding a /24 {update_time:.2f}s')
+        self.assertEqual((len(moved), len(released), len(internal)), (0, 0, 256))
+        for addr in range(*range_to_ints('100.64.0.0/16')):
+            self.assertEqual(update.find(addr), alloc.find(addr))
+
+    def test_index_lookup(self):
+        first, last = range_to_ints(EXTERNAL)
+        alloc = PortBlockAllocator(list(range(first, last + 1)), PORT_RANGE, PORTS)
+        alloc.update([range_to_ints(INTERNAL)])
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'state')
+            save_allocation({'100': alloc}, path)
+            start = perf_counter()
+            index = AllocationIndex(path)
+            load_time = perf_counter() - start
+
+        lookups = 10000
+        start = perf_counter()
+        for i in range(lookups):
+            # the first 8192 external addresses are fully allocated
+            external = first + (i * 7919) % 8192
+            res = index.external(external, 1024 + (i * 104729) % 64512)
+            self.assertEqual(len(res), 1)
+            internal = index.internal(int(ip_address(res[0]['internal_address'])))
+            self.assertEqual(internal, res)
+        lookup_time = perf_counter() - start
+
+        print(f'index loaded in {load_time:.2f}s, {lookups} external and internal '
+              f'lookups in {lookup_time:.2f}s')
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
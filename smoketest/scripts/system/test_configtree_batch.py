@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+#
+# Copyright (C) 2024 VyOS maintainers and contributors
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 2 or later as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import unittest
+from time import perf_counter
+
+from vyos.configtree import ConfigTree
+
+OPS = 10000
+
+class TestConfigTreeBatch(unittest.TestCase):
+    def setUp(self):
+        self.paths = [['firewall', 'group', 'address-group', f'grp{i // 100}',
+                       'address', f'192.0.2.{i % 100}'] for i in range(OPS)]
+
+    def test_batch_matches_single_ops(self):
+        single = ConfigTree('\n')
+        start = perf_counter()
+        for p in self.paths:
+            single.set(p[:-1], value=p[-1], replace=False)
+        single_time = perf_counter() - start
+
+        batched = ConfigTree('\n')
+        start = perf_counter()
+        res = batched.apply_batch([('set', p[:-1], p[-1], False) for p in self.paths])
+        batch_time = perf_counter() - start
+
+        print(f'{OPS} set operations: single {single_time:.3f}s, '
+              f'batch {batch_time:.3f}s')
+        self.assertEqual(res, [0] * OPS)
+        self.assertEqual(single.to_string(), batched.to_string())
+
+    def test_batch_queries(self):
+        config = ConfigTree('\n')
+        config.apply_batch([('set', p[:-1], p[-1], False) for p in self.paths])
+
+        path = self.paths[0]
+        res = config.apply_batch([('exists', path[:-1]),
+                                  ('exists', ['nonexistent']),
+                                  ('return_values', path[:-1]),
+                                  ('return_values', ['nonexistent']),
+                                  ('delete_value', path[:-1], path[-1]),
+                                  ('delete', ['firewall'])])
+        self.assertTrue(res[0])
+        self.assertFalse(res[1])
+        self.assertIn(path[-1], res[2])
+        self.assertIsNone(res[3])
+        self.assertEqual(res[4:], [0, 0])
+        self.assertFalse(config.exists(['firewall']))
+
+    def test_batch_rejects_unknown_op(self):
+        config = ConfigTree('\n')
+        with self.assertRaises(ValueError):
+            config.apply_batch([('set', ['system', 'host-name'], 'vyos'),
+                                ('rename', ['system'], 'sys')])
+        self.assertFalse(config.exists(['system']))
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+#
+# Copyright (C) 2024 VyOS maintainers and contributors
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 2 or later as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import unittest
+from time import perf_counter
+
+from vyos.ifconfig import DummyIf
+from vyos.ifconfig import netlink
+from vyos.utils.network import get_interface_config
+
+INTERFACES = 50
+
+def interface_config(ifname, index):
+    return {
+        'ifname': ifname,
+        'description': f'netlink benchmark {index}',
+        'mtu': '1400',
+        'address': [f'192.0.2.{index + 1}/32', f'2001:db8::{index + 1:x}/128'],
+    }
+
+class TestIfconfigNetlink(unittest.TestCase):
+    def setUp(self):
+        self.interfaces = [DummyIf(f'dum9{i:03}') for i in range(INTERFACES)]
+
+    def tearDown(self):
+        netlink.enabled = netlink.IPRoute is not None
+        for intf in self.interfaces:
+            intf.remove()
+
+    def update_all(self):
+        start = perf_counter()
+        for index, intf in enumerate(self.interfaces):
+            intf.update(interface_config(intf.ifname, index))
+        return (perf_counter() - start) / INTERFACES
+
+    def test_update_throughput(self):
+        self.assertTrue(netlink.enabled)
+        netlink_time = self.update_all()
+
+        for intf in self.interfaces:
+            intf.flush_addrs()
+            intf.set_alias('')
+        # fresh objects, without the cache of assigned addresses
+        self.interfaces = [DummyIf(intf.ifname) for intf in self.interfaces]
+
+        netlink.enabled = False
+        shell_time = self.update_all()
+
+        print(f'update() per interface: netlink {netlink_time * 1000:.1f}ms, '
+              f'iproute2 {shell_time * 1000:.1f}ms')
+
+        for index, intf in enumerate(self.interfaces):
+            tmp = get_interface_config(intf.ifname)
+            self.assertEqual(tmp['mtu'], 1400)
+            self.assertEqual(tmp['ifalias'], f'netlink benchmark {index}')
+            self.assertIn(f'192.0.2.{index + 1}/32', intf.get_addr())
+
+    def test_backends_agree(self):
+        intf = self.interfaces[0]
+        intf.update(interface_config(intf.ifname, 0))
+        for name in ['admin_state', 'alias', 'mac', 'min_mtu', 'max_mtu',
+                     'mtu', 'oper_state', 'vrf']:
+            netlink.enabled = True
+            value = intf.get_interface(name)
+            netlink.enabled = False
+            self.assertEqual(value, intf.get_interface(name), name)
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
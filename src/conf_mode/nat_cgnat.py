@@ -19,9 +19,20 @@
 import logging
 import os
 
+from array import array
 from sys import exit
 from logging.handlers import SysLogHandler
 
+from vyos.cgnat import AllocationError
+from vyos.cgnat import PortBlockAllocator
+from vyos.cgnat import allocation_changes
+from vyos.cgnat import cgnat_allocation_history
+from vyos.cgnat import collapse_addresses
+from vyos.cgnat import load_allocation
+from vyos.cgnat import ntoa
+from vyos.cgnat import range_to_ints
+from vyos.cgnat import release_allocation
+from vyos.cgnat import save_allocation
 from vyos.config import Config
 from vyos.configdict import is_node_changed
 from vyos.template import render
@@ -64,60 +75,8 @@ def get_ips_count(self) -> int:
         % ip.get_ips_count()
         3
         """
-        if '-' in self.ip_prefix:
-            start_ip, end_ip = self.ip_prefix.split('-')
-            start_ip = ipaddress.ip_address(start_ip)
-            end_ip = ipaddress.ip_address(end_ip)
-            return int(end_ip) - int(start_ip) + 1
-        elif '/31' in self.ip_prefix:
-            return 2
-        elif '/32' in self.ip_prefix:
-            return 1
-        else:
-            return sum(
-                1
-                for _ in [self.ip_network.network_address]
-                + list(self.ip_network.hosts())
-                + [self.ip_network.broadcast_address]
-            )
-
-    def convert_prefix_to_list_ips(self) -> list:
-        """Converts a prefix or IP range to a list of IPs including the network and broadcast addresses.
-
-        Example:
-        % ip = IPOperations('192.0.2.0/30')
-        % ip.convert_prefix_to_list_ips()
-        ['192.0.2.0', '192.0.2.1', '192.0.2.2', '192.0.2.3']
-        %
-        % ip = IPOperations('192.0.0.1-192.0.2.5')
-        % ip.convert_prefix_to_list_ips()
-        ['192.0.2.1', '192.0.2.2', '192.0.2.3', '192.0.2.4', '192.0.2.5']
-        """
-        if '-' in self.ip_prefix:
-            start_ip, end_ip = self.ip_prefix.split('-')
-            start_ip = ipaddress.ip_address(start_ip)
-            end_ip = ipaddress.ip_address(end_ip)
-            return [
-                str(ipaddress.ip_address(ip))
-                for ip in range(int(start_ip), int(end_ip) + 1)
-            ]
-        elif '/31' in self.ip_prefix:
-            return [
-                str(ip)
-                for ip in [
-                    self.ip_network.network_address,
-                    self.ip_network.broadcast_address,
-                ]
-            ]
-        elif '/32' in self.ip_prefix:
-            return [str(self.ip_network.network_address)]
-        else:
-            return [
-                str(ip)
-                for ip in [self.ip_network.network_address]
-                + list(self.ip_network.hosts())
-                + [self.ip_network.broadcast_address]
-            ]
+        first, last = range_to_ints(self.ip_prefix)
+        return last - first + 1
 
     def get_prefix_by_ip_range(self) -> list[ipaddress.IPv4Network]:
         """Return the common prefix for the address range
@@ -152,58 +111,32 @@ def _delete_conntrack_entries(source_prefixes: list[ipaddress.IPv4Network]) -> N
         run(f'conntrack -D -s {source_prefix}')
 
 
-def generate_port_rules(
-    external_hosts: list,
-    internal_hosts: list,
-    port_count: int,
-    global_port_range: str = '1024-65535',
-) -> list:
-    """Generates a list of nftables option rules for the batch file.
-
-    Args:
-        external_hosts (list): A list of external host IPs.
-        internal_hosts (list): A list of internal host IPs.
-        port_count (int): The number of ports required per host.
-        global_port_range (str): The global port range to be used. Default is '1024-65535'.
-
-    Returns:
-        list: A list containing two elements:
-            - proto_map_elements (list): A list of proto map elements.
-            - other_map_elements (list): A list of other map elements.
-    """
-    rules = []
-    proto_map_elements = []
-    other_map_elements = []
-    start_port, end_port = map(int, global_port_range.split('-'))
-    total_possible_ports = (end_port - start_port) + 1
+def _external_hosts(pool_config: dict) -> list[int]:
+    """Return the external addresses of a pool in order of the range sequence"""
+    ranges = sorted(pool_config['range'],
+                    key=lambda r: int(pool_config['range'][r].get('seq', 999999)))
+    hosts = []
+    for ext_range in ranges:
+        first, last = range_to_ints(ext_range)
+        hosts.extend(range(first, last + 1))
+    return hosts
 
-    # Calculate the required number of ports per host
-    required_ports_per_host = port_count
-    current_port = start_port
-    current_external_index = 0
-
-    for internal_host in internal_hosts:
-        external_host = external_hosts[current_external_index]
-        next_end_port = current_port + required_ports_per_host - 1
-
-        # If the port range exceeds the end_port, move to the next external host
-        while next_end_port > end_port:
-            current_external_index = (current_external_index + 1) % len(external_hosts)
-            external_host = external_hosts[current_external_index]
-            current_port = start_port
-            next_end_port = current_port + required_ports_per_host - 1
 
+def _map_elements(allocator: PortBlockAllocator, internal, slot) -> tuple[list, list]:
+    """Returns the proto and other map elements of allocations as lists"""
+    proto_map_elements = []
+    other_map_elements = []
+    external_names = {}
+    for addr, external, first_port, last_port in allocator.elements(internal, slot):
+        if external not in external_names:
+            external_names[external] = ntoa(external)
+        internal_host = ntoa(addr)
+        external_host = external_names[external]
         proto_map_elements.append(
-            f'{internal_host} : {external_host} . {current_port}-{next_end_port}'
+            f'{internal_host} : {external_host} . {first_port}-{last_port}'
         )
         other_map_elements.append(f'{internal_host} : {external_host}')
-
-        current_port = next_end_port + 1
-        if current_port > end_port:
-            current_port = start_port
-            current_external_index += 1  # Move to the next external host
-
-    return [proto_map_elements, other_map_elements]
+    return proto_map_elements, other_map_elements
 
 
 def get_config(config=None):
@@ -315,23 +248,15 @@ def verify(config):
         ports_per_range_count: int = (end_port - start_port) + 1
 
         external_list_hosts_count = []
-        external_list_hosts = []
         internal_list_hosts_count = []
-        internal_list_hosts = []
         for ext_range in external_ip_ranges:
             # External hosts count
             e_count = IPOperations(ext_range).get_ips_count()
             external_list_hosts_count.append(e_count)
-            # External hosts list
-            e_hosts = IPOperations(ext_range).convert_prefix_to_list_ips()
-            external_list_hosts.extend(e_hosts)
         for int_range in internal_ip_ranges:
             # Internal hosts count
             i_count = IPOperations(int_range).get_ips_count()
             internal_list_hosts_count.append(i_count)
-            # Internal hosts list
-            i_hosts = IPOperations(int_range).convert_prefix_to_list_ips()
-            internal_list_hosts.extend(i_hosts)
 
         external_host_count = sum(external_list_hosts_count)
         internal_host_count = sum(internal_list_hosts_count)
@@ -352,6 +277,18 @@ def generate(config):
     if 'deleted' in config:
         return None
 
+    # Allocation of the previous commit, only valid while its table exists
+    previous = load_allocation()
+    # History records of the blocks released and allocated by this commit
+    changes = array('I')
+    if previous is not None and 'table ip cgnat' not in cmd('nft list tables ip'):
+        # the blocks were released along with the table
+        for rule_previous in previous.values():
+            changes.extend(allocation_changes(rule_previous, rule_previous.internal))
+        previous = None
+
+    allocators = {}
+    released = []
     proto_maps = []
     other_maps = []
 
@@ -359,35 +296,10 @@ def generate(config):
         ext_pool_name: str = rule_config['translation']['pool']
         int_pool_name: str = rule_config['source']['pool']
 
-        # Sort the external ranges by sequence
-        external_ranges: list = sorted(
-            config['pool']['external'][ext_pool_name]['range'],
-            key=lambda r: int(config['pool']['external'][ext_pool_name]['range'][r].get('seq', 999999))
-        )
-        internal_ranges: list = [range for range in config['pool']['internal'][int_pool_name]['range']]
-        external_list_hosts_count = []
-        external_list_hosts = []
-        internal_list_hosts_count = []
-        internal_list_hosts = []
-
-        for ext_range in external_ranges:
-            # External hosts count
-            e_count = IPOperations(ext_range).get_ips_count()
-            external_list_hosts_count.append(e_count)
-            # External hosts list
-            e_hosts = IPOperations(ext_range).convert_prefix_to_list_ips()
-            external_list_hosts.extend(e_hosts)
+        external_hosts = _external_hosts(config['pool']['external'][ext_pool_name])
+        internal_ranges = [range_to_ints(int_range) for int_range in
+                           config['pool']['internal'][int_pool_name]['range']]
 
-        for int_range in internal_ranges:
-            # Internal hosts count
-            i_count = IPOperations(int_range).get_ips_count()
-            internal_list_hosts_count.append(i_count)
-            # Internal hosts list
-            i_hosts = IPOperations(int_range).convert_prefix_to_list_ips()
-            internal_list_hosts.extend(i_hosts)
-
-        external_host_count = sum(external_list_hosts_count)
-        internal_host_count = sum(internal_list_hosts_count)
         ports_per_user = int(
             jmespath.search(f'pool.external."{ext_pool_name}".per_user_limit.port', config)
         )
@@ -395,13 +307,44 @@ def generate(config):
             f'pool.external."{ext_pool_name}".external_port_range', config
         )
 
-        rule_proto_maps, rule_other_maps = generate_port_rules(
-            external_list_hosts, internal_list_hosts, ports_per_user, external_port_range
-        )
-
+        # Existing subscribers keep their port blocks, unless the port
+        # ranges changed
+        allocator = PortBlockAllocator(external_hosts, external_port_range, ports_per_user)
+        rule_previous = previous.pop(rule, None) if previous else None
+        if rule_previous and allocator.same_ports(rule_previous):
+            released.append(allocator.adopt(rule_previous))
+        elif rule_previous:
+            released.append(rule_previous.internal)
+
+        try:
+            rule_released, internal, slot = allocator.update(internal_ranges)
+        except AllocationError as e:
+            raise ConfigError(f'Rule "{rule}": {e}')
+        released.append(rule_released)
+        allocators[rule] = allocator
+
+        if rule_previous:
+            for addresses in released[-2:]:
+                changes.extend(allocation_changes(rule_previous, addresses))
+        changes.extend(allocation_changes(allocator=allocator, allocated=internal,
+                                          allocated_slot=slot))
+
+        rule_proto_maps, rule_other_maps = _map_elements(allocator, internal, slot)
         proto_maps.extend(rule_proto_maps)
         other_maps.extend(rule_other_maps)
 
+    if previous is not None:
+        # Rules deleted since the previous commit
+        for rule_previous in previous.values():
+            released.append(rule_previous.internal)
+            changes.extend(allocation_changes(rule_previous, rule_previous.internal))
+        # Only the changed map elements are written
+        config['incremental'] = {}
+        config['released'] = [addr for rule_released in released for addr in rule_released]
+        config['released_map_elements'] = ', '.join(ntoa(addr) for addr in config['released'])
+
+    config['allocation'] = allocators
+    config['allocation_changes'] = changes
     config['proto_map_elements'] = ', '.join(proto_maps)
     config['other_map_elements'] = ', '.join(other_maps)
 
@@ -419,12 +362,18 @@ def apply(config):
         cmd('nft delete table ip cgnat')
         if os.path.isfile(nftables_cgnat_config):
             os.unlink(nftables_cgnat_config)
+        release_allocation(history=cgnat_allocation_history)
     else:
         cmd(f'nft --file {nftables_cgnat_config}')
-
-    # Delete conntrack entries
-    # if the pool configuration has changed
-    if 'delete_conntrack_entries' in config and 'effective' in config:
+        save_allocation(config['allocation'], changes=config['allocation_changes'],
+                        history=cgnat_allocation_history)
+
+    # Delete conntrack entries of the subscribers which lost their port
+    # block, or of all pools if the whole table was replaced and the pool
+    # configuration has changed
+    if 'incremental' in config:
+        _delete_conntrack_entries(collapse_addresses(config['released']))
+    elif 'delete_conntrack_entries' in config and 'effective' in config:
         # Prepare the list of internal pool prefixes
         internal_pool_prefix_list: list[ipaddress.IPv4Network] = []
 
@@ -447,10 +396,13 @@ def apply(config):
         # Delete required sources for conntrack
         _delete_conntrack_entries(internal_pool_prefix_list)
 
-    # Logging allocations
+    # Logging allocations, only the new ones on incremental updates
     if 'log_allocation' in config:
+        for internal_host in config.get('released_map_elements', '').split(', '):
+            if internal_host:
+                logger.info(f'Internal host: {internal_host}, released')
         allocations = config['proto_map_elements']
-        allocations = allocations.split(',')
+        allocations = allocations.split(',') if allocations else []
         for allocation in allocations:
             try:
                 # Split based on the delimiters used in the nft data format
@@ -31,7 +31,6 @@
 from vyos.utils.network import get_interface_vrf
 from vyos.utils.network import is_addr_assigned
 from vyos.utils.process import process_named_running
-from vyos.utils.process import call
 from vyos import ConfigError
 from vyos import frr
 from vyos import airbag
@@ -615,7 +614,10 @@ def apply(bgp):
         # This is not possible with old config backend
         # priority bug
         if {'vrf', 'vni'} <= set(bgp):
-            call('vtysh -c "conf t" -c "vrf {vrf}" -c "no vni {vni}"'.format(**bgp))
+            try:
+                frr.configure([f'vrf {bgp["vrf"]}', f'no vni {bgp["vni"]}'], daemon='zebra')
+            except (frr.FrrError, OSError):
+                pass
 
     bgp_daemon = 'bgpd'
 
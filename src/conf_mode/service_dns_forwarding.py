@@ -332,61 +332,66 @@ def apply(dns):
         ### first apply vyos-hostsd config
         hc = hostsd_client()
 
-        # add static nameservers to hostsd so they can be joined with other
-        # sources
-        hc.delete_name_servers([hostsd_tag])
-        if 'name_server' in dns:
-            # 'name_server' is of the form
-            # {'192.0.2.1': {'port': 53}, '2001:db8::1': {'port': 853}, ...}
-            # canonicalize them as ['192.0.2.1:53', '[2001:db8::1]:853', ...]
-            nslist = [(lambda h, p: f"{bracketize_ipv6(h)}:{p['port']}")(h, p)
-                      for (h, p) in dns['name_server'].items()]
-            hc.add_name_servers({hostsd_tag: nslist})
-
-        # delete all nameserver tags
-        hc.delete_name_server_tags_recursor(hc.get_name_server_tags_recursor())
-
-        ## add nameserver tags - the order determines the nameserver order!
-        # our own tag (static)
-        hc.add_name_server_tags_recursor([hostsd_tag])
-
-        if 'system' in dns:
-            hc.add_name_server_tags_recursor(['system'])
-        else:
-            hc.delete_name_server_tags_recursor(['system'])
-
-        # add dhcp nameserver tags for configured interfaces
-        if 'system_name_server' in dns:
-            for interface in dns['system_name_server']:
-                # system_name_server key contains both IP addresses and interface
-                # names (DHCP) to use DNS servers. We need to check if the
-                # value is an interface name - only if this is the case, add the
-                # interface based DNS forwarder.
-                if interface_exists(interface):
-                    hc.add_name_server_tags_recursor(['dhcp-' + interface,
-                                                      'dhcpv6-' + interface ])
-
-        # hostsd will generate the forward-zones file
         # the list and keys() are required as get returns a dict, not list
-        hc.delete_forward_zones(list(hc.get_forward_zones().keys()))
-        if 'domain' in dns:
-            zones = dns['domain']
-            for domain in zones.keys():
+        recursor_tags = hc.get_name_server_tags_recursor()
+        forward_zones = list(hc.get_forward_zones().keys())
+        authoritative_zones = list(hc.get_authoritative_zones())
+
+        # all changes are applied at once
+        with hc.batch():
+            # add static nameservers to hostsd so they can be joined with other
+            # sources
+            hc.delete_name_servers([hostsd_tag])
+            if 'name_server' in dns:
                 # 'name_server' is of the form
                 # {'192.0.2.1': {'port': 53}, '2001:db8::1': {'port': 853}, ...}
                 # canonicalize them as ['192.0.2.1:53', '[2001:db8::1]:853', ...]
-                zones[domain]['name_server'] = [(lambda h, p: f"{bracketize_ipv6(h)}:{p['port']}")(h, p)
-                                                for (h, p) in zones[domain]['name_server'].items()]
-            hc.add_forward_zones(zones)
-
-        # hostsd generates NTAs for the authoritative zones
-        # the list and keys() are required as get returns a dict, not list
-        hc.delete_authoritative_zones(list(hc.get_authoritative_zones()))
-        if 'authoritative_zones' in dns:
-            hc.add_authoritative_zones(list(map(lambda zone: zone['name'], dns['authoritative_zones'])))
-
-        # call hostsd to generate forward-zones and its lua-config-file
-        hc.apply()
+                nslist = [(lambda h, p: f"{bracketize_ipv6(h)}:{p['port']}")(h, p)
+                          for (h, p) in dns['name_server'].items()]
+                hc.add_name_servers({hostsd_tag: nslist})
+
+            # delete all nameserver tags
+            hc.delete_name_server_tags_recursor(recursor_tags)
+
+            ## add nameserver tags - the order determines the nameserver order!
+            # our own tag (static)
+            hc.add_name_server_tags_recursor([hostsd_tag])
+
+            if 'system' in dns:
+                hc.add_name_server_tags_recursor(['system'])
+            else:
+                hc.delete_name_server_tags_recursor(['system'])
+
+            # add dhcp nameserver tags for configured interfaces
+            if 'system_name_server' in dns:
+                for interface in dns['system_name_server']:
+                    # system_name_server key contains both IP addresses and interface
+                    # names (DHCP) to use DNS servers. We need to check if the
+                    # value is an interface name - only if this is the case, add the
+                    # interface based DNS forwarder.
+                    if interface_exists(interface):
+                        hc.add_name_server_tags_recursor(['dhcp-' + interface,
+                                                          'dhcpv6-' + interface ])
+
+            # hostsd will generate the forward-zones file
+            hc.delete_forward_zones(forward_zones)
+            if 'domain' in dns:
+                zones = dns['domain']
+                for domain in zones.keys():
+                    # 'name_server' is of the form
+                    # {'192.0.2.1': {'port': 53}, '2001:db8::1': {'port': 853}, ...}
+                    # canonicalize them as ['192.0.2.1:53', '[2001:db8::1]:853', ...]
+                    zones[domain]['name_server'] = [(lambda h, p: f"{bracketize_ipv6(h)}:{p['port']}")(h, p)
+                                                    for (h, p) in zones[domain]['name_server'].items()]
+                hc.add_forward_zones(zones)
+
+            # hostsd generates NTAs for the authoritative zones
+            hc.delete_authoritative_zones(authoritative_zones)
+            if 'authoritative_zones' in dns:
+                hc.add_authoritative_zones(list(map(lambda zone: zone['name'], dns['authoritative_zones'])))
+
+            # call hostsd to generate forward-zones and its lua-config-file
+            hc.apply()
 
         ### finally (re)start pdns-recursor
         call(f'systemctl reload-or-restart {systemd_service}')
@@ -35,6 +35,7 @@
 from vyos.version import get_version_data
 from vyos import ConfigError
 from vyos import airbag
+from vyos import frr
 airbag.enable()
 
 config_file_client  = r'/etc/snmp/snmp.conf'
@@ -267,7 +268,10 @@ def apply(snmp):
     # Following daemons from FRR 9.0/stable have SNMP module compiled in VyOS
     frr_daemons_list = ['zebra', 'bgpd', 'ospf6d', 'ospfd', 'ripd', 'isisd', 'ldpd']
     for frr_daemon in frr_daemons_list:
-        call(f'vtysh -c "configure terminal" -d {frr_daemon} -c "agentx" >/dev/null')
+        try:
+            frr.configure('agentx', daemon=frr_daemon)
+        except (frr.FrrError, OSError):
+            pass
 
     return None
 
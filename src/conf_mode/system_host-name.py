@@ -135,30 +135,33 @@ def apply(config):
     ## Send the updated data to vyos-hostsd
     try:
         hc = vyos.hostsd_client.Client()
+        system_tags = hc.get_name_server_tags_system()
 
-        hc.set_host_name(config['hostname'], config['domain_name'])
+        # all changes are applied at once
+        with hc.batch():
+            hc.set_host_name(config['hostname'], config['domain_name'])
 
-        hc.delete_search_domains([hostsd_tag])
-        if config['domain_search']:
-            hc.add_search_domains({hostsd_tag: config['domain_search']})
+            hc.delete_search_domains([hostsd_tag])
+            if config['domain_search']:
+                hc.add_search_domains({hostsd_tag: config['domain_search']})
 
-        hc.delete_name_servers([hostsd_tag])
-        if config['nameserver']:
-            hc.add_name_servers({hostsd_tag: config['nameserver']})
+            hc.delete_name_servers([hostsd_tag])
+            if config['nameserver']:
+                hc.add_name_servers({hostsd_tag: config['nameserver']})
 
-        # add our own tag's (system) nameservers and search to resolv.conf
-        hc.delete_name_server_tags_system(hc.get_name_server_tags_system())
-        hc.add_name_server_tags_system([hostsd_tag])
+            # add our own tag's (system) nameservers and search to resolv.conf
+            hc.delete_name_server_tags_system(system_tags)
+            hc.add_name_server_tags_system([hostsd_tag])
 
-        # this will add the dhcp client nameservers to resolv.conf
-        for intf in config['nameservers_dhcp_interfaces']:
-            hc.add_name_server_tags_system([f'dhcp-{intf}', f'dhcpv6-{intf}'])
+            # this will add the dhcp client nameservers to resolv.conf
+            for intf in config['nameservers_dhcp_interfaces']:
+                hc.add_name_server_tags_system([f'dhcp-{intf}', f'dhcpv6-{intf}'])
 
-        hc.delete_hosts([hostsd_tag])
-        if config['static_host_mapping']:
-            hc.add_hosts({hostsd_tag: config['static_host_mapping']})
+            hc.delete_hosts([hostsd_tag])
+            if config['static_host_mapping']:
+                hc.add_hosts({hostsd_tag: config['static_host_mapping']})
 
-        hc.apply()
+            hc.apply()
     except vyos.hostsd_client.VyOSHostsdError as e:
         raise ConfigError(str(e))
 
@@ -14,17 +14,26 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+# Domains are resolved concurrently and each record is refreshed when its
+# DNS TTL expires, bounded by the resolver interval. nftables sets are only
+# changed by the addresses added and removed since the last update.
+
+import asyncio
 import json
 import time
 
+import dns.asyncresolver
+import dns.exception
+
 from vyos.configdict import dict_merge
 from vyos.configquery import ConfigTreeQuery
 from vyos.firewall import fqdn_config_parse
 from vyos.firewall import fqdn_resolve
 from vyos.utils.commit import commit_in_progress
 from vyos.utils.dict import dict_search_args
+from vyos.utils.file import write_file
 from vyos.utils.process import cmd
-from vyos.utils.process import run
+from vyos.utils.process import rc_cmd
 from vyos.xml_ref import get_defaults
 
 base = ['firewall']
@@ -33,7 +42,16 @@
 base_firewall = ['firewall']
 base_nat = ['nat']
 
-domain_state = {}
+# Lower bound for refreshing a record, and the retry interval after failures
+min_ttl = 10
+retry_interval = 30
+# Records due within this window are resolved together
+batch_window = 1
+max_concurrent = 64
+# Latency samples kept for the statistics
+latency_samples = 1000
+
+stats_file = '/run/vyos-domain-resolver.stats'
 
 ipv4_tables = {
     'ip vyos_mangle',
@@ -68,31 +86,6 @@ def get_config(conf, node):
 
     return node_config
 
-def resolve(domains, ipv6=False):
-    global domain_state
-
-    ip_list = set()
-
-    for domain in domains:
-        resolved = fqdn_resolve(domain, ipv6=ipv6)
-
-        if resolved and cache:
-            domain_state[domain] = resolved
-        elif not resolved:
-            if domain not in domain_state:
-                continue
-            resolved = domain_state[domain]
-
-        ip_list = ip_list | resolved
-    return ip_list
-
-def nft_output(table, set_name, ip_list):
-    output = [f'flush set {table} {set_name}']
-    if ip_list:
-        ip_str = ','.join(ip_list)
-        output.append(f'add element {table} {set_name} {{ {ip_str} }}')
-    return output
-
 def nft_valid_sets():
     try:
         valid_sets = []
@@ -110,10 +103,12 @@ def nft_valid_sets():
     except:
         return []
 
-def update_fqdn(config, node):
-    conf_lines = []
-    count = 0
-    valid_sets = nft_valid_sets()
+def get_sets(config, node):
+    """
+    Returns dict of the nftables sets filled from domains, keyed by (table,
+    set name), with the domains and address family of each
+    """
+    sets = {}
 
     if node == 'firewall':
         domain_groups = dict_search_args(config, 'group', 'domain_group')
@@ -124,46 +119,190 @@ def update_fqdn(config, node):
                 nft_set_name = f'D_{set_name}'
                 domains = domain_config['address']
 
-                ip_list = resolve(domains, ipv6=False)
                 for table in ipv4_tables:
-                    if (table, nft_set_name) in valid_sets:
-                        conf_lines += nft_output(table, nft_set_name, ip_list)
-                ip6_list = resolve(domains, ipv6=True)
+                    sets[(table, nft_set_name)] = {'domains': domains, 'ipv6': False}
                 for table in ipv6_tables:
-                    if (table, nft_set_name) in valid_sets:
-                        conf_lines += nft_output(table, nft_set_name, ip6_list)
-                count += 1
+                    sets[(table, nft_set_name)] = {'domains': domains, 'ipv6': True}
 
         for set_name, domain in config['ip_fqdn'].items():
-            table = 'ip vyos_filter'
-            nft_set_name = f'FQDN_{set_name}'
-            ip_list = resolve([domain], ipv6=False)
-            if (table, nft_set_name) in valid_sets:
-                conf_lines += nft_output(table, nft_set_name, ip_list)
-            count += 1
+            sets[('ip vyos_filter', f'FQDN_{set_name}')] = {'domains': [domain], 'ipv6': False}
 
         for set_name, domain in config['ip6_fqdn'].items():
-            table = 'ip6 vyos_filter'
-            nft_set_name = f'FQDN_{set_name}'
-            ip_list = resolve([domain], ipv6=True)
-            if (table, nft_set_name) in valid_sets:
-                conf_lines += nft_output(table, nft_set_name, ip_list)
-            count += 1
+            sets[('ip6 vyos_filter', f'FQDN_{set_name}')] = {'domains': [domain], 'ipv6': True}
 
     else:
         # It's NAT
         for set_name, domain in config['ip_fqdn'].items():
-            table = 'ip vyos_nat'
-            nft_set_name = f'FQDN_nat_{set_name}'
-            ip_list = resolve([domain], ipv6=False)
-            if (table, nft_set_name) in valid_sets:
-                conf_lines += nft_output(table, nft_set_name, ip_list)
-            count += 1
-
-    nft_conf_str = "\n".join(conf_lines) + "\n"
-    code = run(f'nft --file -', input=nft_conf_str)
+            sets[('ip vyos_nat', f'FQDN_nat_{set_name}')] = {'domains': [domain], 'ipv6': False}
+
+    return sets
+
+def nft_output(table, set_name, old, new):
+    """
+    Returns nft commands changing a set from the old to the new addresses,
+    replacing the whole content if the old addresses are unknown
+    """
+    output = []
+    if old is None:
+        output.append(f'flush set {table} {set_name}')
+        old = set()
+    if old - new:
+        output.append(f'delete element {table} {set_name} {{ {",".join(sorted(old - new))} }}')
+    if new - old:
+        output.append(f'add element {table} {set_name} {{ {",".join(sorted(new - old))} }}')
+    return output
 
-    print(f'Updated {count} sets in {node} - result: {code}')
+class Record:
+    """Addresses of a domain for one address family, and when to refresh them"""
+    def __init__(self, domain, ipv6):
+        self.domain = domain
+        self.ipv6 = ipv6
+        self.addresses = set()
+        self.due = 0
+        self.sets = []
+
+class DomainResolver:
+    def __init__(self, sets):
+        self.sets = sets
+        self.records = {}
+        for key, set_config in sets.items():
+            for domain in set_config['domains']:
+                record_key = (domain, set_config['ipv6'])
+                if record_key not in self.records:
+                    self.records[record_key] = Record(domain, set_config['ipv6'])
+                self.records[record_key].sets.append(key)
+
+        # Set contents as last written, None until replaced completely
+        self.applied = {key: None for key in sets}
+
+        self.resolver = dns.asyncresolver.Resolver()
+        self.resolver.lifetime = 5
+        self.semaphore = asyncio.Semaphore(max_concurrent)
+
+        self.latency = []
+        self.stats = {'queries': 0, 'failures': 0, 'updates': 0,
+                      'added': 0, 'removed': 0, 'errors': 0}
+
+    async def lookup(self, record):
+        """Return addresses and TTL of a record, addresses are None on failure"""
+        rdtype = 'AAAA' if record.ipv6 else 'A'
+        try:
+            answer = await self.resolver.resolve(record.domain, rdtype)
+            # minimum TTL of the answer, including CNAME records
+            ttl = answer.expiration - time.time()
+            return set(rdata.address for rdata in answer), ttl
+        except dns.exception.DNSException:
+            pass
+
+        # static host mappings are only known to the system resolver
+        resolved = await asyncio.get_running_loop().run_in_executor(
+            None, fqdn_resolve, record.domain, record.ipv6)
+        return resolved, timeout
+
+    async def refresh(self, record):
+        """Resolve record, returns True if its addresses changed"""
+        async with self.semaphore:
+            start = time.perf_counter()
+            addresses, ttl = await self.lookup(record)
+            self.latency.append(time.perf_counter() - start)
+        self.stats['queries'] += 1
+
+        now = time.monotonic()
+        if addresses is None:
+            self.stats['failures'] += 1
+            record.due = now + min(retry_interval, timeout)
+            if cache:
+                return False
+            addresses = set()
+        else:
+            record.due = now + min(max(ttl, min_ttl), timeout)
+
+        if addresses == record.addresses:
+            return False
+        record.addresses = addresses
+        return True
+
+    def set_content(self, key):
+        content = set()
+        for domain in self.sets[key]['domains']:
+            content |= self.records[(domain, self.sets[key]['ipv6'])].addresses
+        return content
+
+    def apply(self, keys, contents):
+        conf_lines = []
+        for key in keys:
+            conf_lines += nft_output(*key, self.applied[key], contents[key])
+        if not conf_lines:
+            return True
+
+        code, output = rc_cmd('nft --file -', input='\n'.join(conf_lines) + '\n')
+        if code != 0:
+            print(f'Updating {len(keys)} sets failed - result: {code}: {output}')
+            self.stats['errors'] += 1
+            return False
+        return True
+
+    def update_sets(self, keys):
+        contents = {key: self.set_content(key) for key in keys}
+
+        if not self.apply(keys, contents):
+            # The sets may have been changed or removed meanwhile: replace
+            # the content of the remaining ones
+            valid_sets = nft_valid_sets()
+            for key in list(self.applied):
+                if key not in valid_sets:
+                    del self.applied[key]
+            keys = [key for key in keys if key in self.applied]
+            for key in keys:
+                self.applied[key] = None
+            if not self.apply(keys, contents):
+                return
+
+        for key in keys:
+            old = self.applied[key] or set()
+            self.stats['added'] += len(contents[key] - old)
+            self.stats['removed'] += len(old - contents[key])
+            self.applied[key] = contents[key]
+        if keys:
+            self.stats['updates'] += 1
+
+    def write_stats(self):
+        self.latency = self.latency[-latency_samples:]
+        latency = sorted(self.latency)
+
+        def percentile(p):
+            if not latency:
+                return 0
+            return round(latency[int(p * (len(latency) - 1))] * 1000, 1)
+
+        stats = dict(self.stats)
+        stats['domains'] = len(self.records)
+        stats['sets'] = len(self.applied)
+        stats['latency_ms'] = {'p50': percentile(0.5), 'p95': percentile(0.95),
+                               'max': percentile(1)}
+        stats['updated'] = int(time.time())
+        write_file(stats_file, json.dumps(stats))
+
+    async def run(self):
+        while True:
+            now = time.monotonic()
+            due = [record for record in self.records.values()
+                   if record.due <= now + batch_window]
+
+            changed = await asyncio.gather(*(self.refresh(record) for record in due))
+            keys = set()
+            for record, record_changed in zip(due, changed):
+                if record_changed:
+                    keys.update(key for key in record.sets if key in self.applied)
+            # sets never written are replaced, even if empty
+            keys.update(key for key, content in self.applied.items() if content is None)
+
+            self.update_sets(keys)
+            self.write_stats()
+
+            next_due = min((record.due for record in self.records.values()),
+                           default=time.monotonic() + timeout)
+            await asyncio.sleep(max(next_due - time.monotonic(), 0))
 
 if __name__ == '__main__':
     print(f'VyOS domain resolver')
@@ -181,7 +320,12 @@ def update_fqdn(config, node):
 
     print(f'interval: {timeout}s - cache: {cache}')
 
-    while True:
-        update_fqdn(firewall, 'firewall')
-        update_fqdn(nat, 'nat')
-        time.sleep(timeout)
+    # The service is restarted when the sets change
+    valid_sets = nft_valid_sets()
+    sets = get_sets(firewall, 'firewall')
+    sets.update(get_sets(nat, 'nat'))
+    sets = {key: value for key, value in sets.items() if key in valid_sets}
+
+    resolver = DomainResolver(sets)
+    print(f'Resolving {len(resolver.records)} domains for {len(sets)} sets')
+    asyncio.run(resolver.run())
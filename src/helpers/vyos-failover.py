@@ -15,10 +15,13 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 import argparse
+import asyncio
 import json
-import socket
-import time
 
+from vyos.probe import ProbeEngine
+from vyos.probe import ProbeError
+from vyos.probe import TargetState
+from vyos.utils.file import write_file
 from vyos.utils.process import rc_cmd
 from pathlib import Path
 from systemd import journal
@@ -26,6 +29,10 @@
 
 my_name = Path(__file__).stem
 
+# Probe state and RTT histograms of all targets, refreshed every stats_interval
+stats_file = f'/run/{my_name}.stats'
+stats_interval = 10
+
 
 def is_route_exists(route, gateway, interface, metric):
     """Check if route with expected gateway, dev and metric exists"""
@@ -72,89 +79,129 @@ def get_best_route_options(route, debug=False):
         return best_gateway, best_interface, best_metric
 
 
-def is_port_open(ip, port):
-    """
-    Check connection to remote host and port
-    Return True if host alive
-
-    % is_port_open('example.com', 8080)
-    True
-    """
-    s = socket.socket(socket.AF_INET, socket.SOCK_STREAM, socket.IPPROTO_TCP)
-    s.settimeout(2)
+def update_route(route, next_hop, nexthop_config, alive, changed, debug=False):
+    """Add or delete the route via next_hop according to its check result"""
+    conf_iface = nexthop_config.get('interface')
+    conf_metric = int(nexthop_config.get('metric'))
+    port = nexthop_config.get('check').get('port')
+    port_opt = f'port {port}' if port else ''
+    proto = nexthop_config.get('check').get('type')
+    target = nexthop_config.get('check').get('target')
+    onlink = 'onlink' if 'onlink' in nexthop_config else ''
+
+    if debug:
+        get_best_route_options(route, debug=debug)
+
+    # Route not found in the current routing table
+    if not is_route_exists(route, next_hop, conf_iface, conf_metric):
+        if debug: print(f"    [NEW_ROUTE_DETECTED] route: [{route}]")
+        # Add route if check-target alive
+        if alive:
+            if debug: print(f'    [ ADD ] -- ip route add {route} via {next_hop} dev {conf_iface} '
+                            f'metric {conf_metric} proto failover\n###')
+            rc, command = rc_cmd(f'ip route add {route} via {next_hop} dev {conf_iface} '
+                                 f'{onlink} metric {conf_metric} proto failover')
+            # If something is wrong and gateway not added
+            # Example: Error: Next-hop has invalid gateway.
+            if rc !=0:
+                if debug: print(f'{command} -- return-code [RC: {rc}] {next_hop} dev {conf_iface}')
+            else:
+                journal.send(f'ip route add {route} via {next_hop} dev {conf_iface} '
+                             f'{onlink} metric {conf_metric} proto failover', SYSLOG_IDENTIFIER=my_name)
+        else:
+            if debug: print(f'    [ TARGET_FAIL ] target checks fails for [{target}], do nothing')
+            if changed:
+                journal.send(f'Check fail for route {route} target {target} proto {proto} '
+                             f'{port_opt}', SYSLOG_IDENTIFIER=my_name)
+
+    # Route was added, check if the target is alive
+    # We should delete route if check fails only if route exists in the routing table
+    elif not alive:
+        if debug:
+            print(f'Nexh_hop {next_hop} fail, target not response')
+            print(f'    [ DEL ] -- ip route del {route} via {next_hop} dev {conf_iface} '
+                  f'metric {conf_metric} proto failover [DELETE]')
+        rc_cmd(f'ip route del {route} via {next_hop} dev {conf_iface} metric {conf_metric} proto failover')
+        journal.send(f'ip route del {route} via {next_hop} dev {conf_iface} '
+                     f'metric {conf_metric} proto failover', SYSLOG_IDENTIFIER=my_name)
+
+
+class NextHop:
+    """Check targets of one route next-hop and their probe state"""
+    def __init__(self, route, next_hop, config):
+        check = config.get('check')
+        self.route = route
+        self.next_hop = next_hop
+        self.config = config
+        self.iface = config.get('interface')
+        self.proto = check.get('type')
+        self.port = check.get('port')
+        self.policy = check.get('policy')
+        self.interval = int(check.get('timeout'))
+        rise = int(check.get('success_count', 1))
+        fall = int(check.get('failure_count', 1))
+        self.targets = {target: TargetState(rise, fall) for target in check.get('target')}
+        self.alive = None
+
+    def is_alive(self):
+        """Check result according to the policy any-available or all-available"""
+        states = [state.alive for state in self.targets.values()]
+        if self.policy == 'all-available':
+            return all(states)
+        return any(states)
+
+    async def probe(self, engine, target, debug=False):
+        try:
+            rtt = await engine.probe(self.proto, target, self.iface, self.port)
+        except ProbeError as e:
+            print(f'Check of target {target} via {self.next_hop} failed: {e}')
+            rtt = None
+        if debug:
+            print(f'    [ CHECK-TARGET ]: [{self.proto} {target} dev {self.iface}] -- rtt [{rtt}]')
+        return rtt
+
+    async def watch(self, engine, debug=False):
+        while True:
+            targets = list(self.targets)
+            results = await asyncio.gather(*(self.probe(engine, target, debug)
+                                             for target in targets))
+            for target, rtt in zip(targets, results):
+                self.targets[target].update(rtt)
+
+            alive = self.is_alive()
+            changed = alive != self.alive
+            self.alive = alive
+            await asyncio.to_thread(update_route, self.route, self.next_hop,
+                                    self.config, alive, changed, debug)
+            await asyncio.sleep(self.interval)
+
+    def stats(self):
+        return {
+            'state': 'up' if self.alive else 'down',
+            'targets': {target: {'state': state.state, 'rtt': state.histogram.to_dict()}
+                        for target, state in self.targets.items()},
+        }
+
+
+async def write_stats(next_hops):
+    while True:
+        await asyncio.sleep(stats_interval)
+        stats = {}
+        for nh in next_hops:
+            stats.setdefault(nh.route, {})[nh.next_hop] = nh.stats()
+        write_file(stats_file, json.dumps(stats))
+
+
+async def main(config, debug=False):
+    engine = ProbeEngine()
+    next_hops = [NextHop(route, next_hop, nexthop_config)
+                 for route, route_config in config.get('route').items()
+                 for next_hop, nexthop_config in route_config.get('next_hop').items()]
     try:
-        s.connect((ip, int(port)))
-        s.shutdown(socket.SHUT_RDWR)
-        return True
-    except:
-        return False
+        await asyncio.gather(write_stats(next_hops),
+                             *(nh.watch(engine, debug) for nh in next_hops))
     finally:
-        s.close()
-
-
-def is_target_alive(target_list=None,
-                    iface='',
-                    proto='icmp',
-                    port=None,
-                    debug=False,
-                    policy='any-available') -> bool:
-    """Check the availability of each target in the target_list using
-    the specified protocol ICMP, ARP, TCP
-
-    Args:
-        target_list (list): A list of IP addresses or hostnames to check.
-        iface (str): The name of the network interface to use for the check.
-        proto (str): The protocol to use for the check. Options are 'icmp', 'arp', or 'tcp'.
-        port (int): The port number to use for the TCP check. Only applicable if proto is 'tcp'.
-        debug (bool): If True, print debug information during the check.
-        policy (str): The policy to use for the check. Options are 'any-available' or 'all-available'.
-
-    Returns:
-        bool: True if all targets are reachable according to the policy, False otherwise.
-
-    Example:
-        % is_target_alive(['192.0.2.1', '192.0.2.5'], 'eth1', proto='arp', policy='all-available')
-        True
-    """
-    if iface != '':
-        iface = f'-I {iface}'
-
-    num_reachable_targets = 0
-    for target in target_list:
-        match proto:
-            case 'icmp':
-                command = f'/usr/bin/ping -q {target} {iface} -n -c 2 -W 1'
-                rc, response = rc_cmd(command)
-                if debug:
-                    print(f'    [ CHECK-TARGET ]: [{command}] -- return-code [RC: {rc}]')
-                if rc == 0:
-                    num_reachable_targets += 1
-                    if policy == 'any-available':
-                        return True
-
-            case 'arp':
-                command = f'/usr/bin/arping -b -c 2 -f -w 1 -i 1 {iface} {target}'
-                rc, response = rc_cmd(command)
-                if debug:
-                    print(f'    [ CHECK-TARGET ]: [{command}] -- return-code [RC: {rc}]')
-                if rc == 0:
-                    num_reachable_targets += 1
-                    if policy == 'any-available':
-                        return True
-
-            case _ if proto == 'tcp' and port is not None:
-                if is_port_open(target, port):
-                    num_reachable_targets += 1
-                    if policy == 'any-available':
-                        return True
-
-            case _:
-                return False
-
-        if policy == 'all-available' and num_reachable_targets == len(target_list):
-            return True
-
-    return False
+        engine.close()
 
 
 if __name__ == '__main__':
@@ -182,54 +229,4 @@ def is_target_alive(target_list=None,
     # sudo /usr/libexec/vyos/vyos-failover.py --config /run/vyos-failover.conf
     debug = False
 
-    while(True):
-
-        for route, route_config in config.get('route').items():
-
-            exists_gateway, exists_iface, exists_metric =  get_best_route_options(route, debug=debug)
-
-            for next_hop, nexthop_config in route_config.get('next_hop').items():
-                conf_iface = nexthop_config.get('interface')
-                conf_metric = int(nexthop_config.get('metric'))
-                port = nexthop_config.get('check').get('port')
-                port_opt = f'port {port}' if port else ''
-                policy = nexthop_config.get('check').get('policy')
-                proto = nexthop_config.get('check').get('type')
-                target = nexthop_config.get('check').get('target')
-                timeout = nexthop_config.get('check').get('timeout')
-                onlink = 'onlink' if 'onlink' in nexthop_config else ''
-
-                # Route not found in the current routing table
-                if not is_route_exists(route, next_hop, conf_iface, conf_metric):
-                    if debug: print(f"    [NEW_ROUTE_DETECTED] route: [{route}]")
-                    # Add route if check-target alive
-                    if is_target_alive(target, conf_iface, proto, port, debug=debug, policy=policy):
-                        if debug: print(f'    [ ADD ] -- ip route add {route} via {next_hop} dev {conf_iface} '
-                                        f'metric {conf_metric} proto failover\n###')
-                        rc, command = rc_cmd(f'ip route add {route} via {next_hop} dev {conf_iface} '
-                                             f'{onlink} metric {conf_metric} proto failover')
-                        # If something is wrong and gateway not added
-                        # Example: Error: Next-hop has invalid gateway.
-                        if rc !=0:
-                            if debug: print(f'{command} -- return-code [RC: {rc}] {next_hop} dev {conf_iface}')
-                        else:
-                            journal.send(f'ip route add {route} via {next_hop} dev {conf_iface} '
-                                         f'{onlink} metric {conf_metric} proto failover', SYSLOG_IDENTIFIER=my_name)
-                    else:
-                        if debug: print(f'    [ TARGET_FAIL ] target checks fails for [{target}], do nothing')
-                        journal.send(f'Check fail for route {route} target {target} proto {proto} '
-                                     f'{port_opt}', SYSLOG_IDENTIFIER=my_name)
-
-                # Route was added, check if the target is alive
-                # We should delete route if check fails only if route exists in the routing table
-                if not is_target_alive(target, conf_iface, proto, port, debug=debug, policy=policy) and \
-                        is_route_exists(route, next_hop, conf_iface, conf_metric):
-                    if debug:
-                        print(f'Nexh_hop {next_hop} fail, target not response')
-                        print(f'    [ DEL ] -- ip route del {route} via {next_hop} dev {conf_iface} '
-                              f'metric {conf_metric} proto failover [DELETE]')
-                    rc_cmd(f'ip route del {route} via {next_hop} dev {conf_iface} metric {conf_metric} proto failover')
-                    journal.send(f'ip route del {route} via {next_hop} dev {conf_iface} '
-                                 f'metric {conf_metric} proto failover', SYSLOG_IDENTIFIER=my_name)
-
-                time.sleep(int(timeout))
+    asyncio.run(main(config, debug=debug))
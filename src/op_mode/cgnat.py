@@ -18,22 +18,58 @@
 import sys
 import typing
 
+from datetime import datetime
+from ipaddress import ip_address
 from tabulate import tabulate
 
 import vyos.opmode
 
+from vyos.cgnat import AllocationIndex
 from vyos.configquery import ConfigTreeQuery
 from vyos.utils.process import cmd
 
 CGNAT_TABLE = 'cgnat'
 
 
-def _get_raw_data(external_address: str = '', internal_address: str = '') -> list[dict]:
-    """Get CGNAT dictionary and filter by external or internal address if provided."""
-    cmd_output = cmd(f'nft --json list table ip {CGNAT_TABLE}')
+def _get_index():
+    """Return the allocation index written at commit, or None"""
+    try:
+        return AllocationIndex()
+    except (OSError, ValueError):
+        return None
+
+
+def _timestamp(when: str):
+    """Return a time given as seconds since the epoch or in ISO format as
+    seconds since the epoch"""
+    if not when:
+        return None
+    if when.isdigit():
+        return int(when)
+    try:
+        return int(datetime.fromisoformat(when).timestamp())
+    except ValueError:
+        raise vyos.opmode.IncorrectValue(f'Invalid time "{when}", expected '
+                                         'YYYY-MM-DDTHH:MM:SS or seconds since the epoch')
+
+
+def _isotime(timestamp):
+    return datetime.fromtimestamp(timestamp).isoformat() if timestamp else None
+
+
+def _address(address: str) -> int:
+    try:
+        return int(ip_address(address))
+    except ValueError:
+        raise vyos.opmode.IncorrectValue(f'Invalid IPv4 address "{address}"')
+
+
+def _get_raw_nft_data(external_address: str = '', internal_address: str = '') -> list[dict]:
+    """Get CGNAT allocations from the nftables map"""
+    cmd_output = cmd(f'nft --json list map ip {CGNAT_TABLE} tcp_nat_map')
     data = json.loads(cmd_output)
 
-    elements = data['nftables'][2]['map']['elem']
+    elements = next(item['map'].get('elem', []) for item in data['nftables'] if 'map' in item)
     allocations = []
     for elem in elements:
         internal = elem[0]  # internal
@@ -58,34 +94,138 @@ def _get_raw_data(external_address: str = '', internal_address: str = '') -> lis
     return allocations
 
 
+def _lookup(index: AllocationIndex, external_address: str = '',
+            internal_address: str = '', external_port: int = None,
+            when: int = None) -> list[dict]:
+    try:
+        if internal_address:
+            allocations = index.internal(_address(internal_address), when)
+            if external_address:
+                allocations = [a for a in allocations
+                               if a['external_address'] == external_address]
+        elif external_address:
+            allocations = index.external(_address(external_address), external_port, when)
+        elif when is None:
+            allocations = list(index.all())
+        else:
+            raise vyos.opmode.IncorrectValue('A time requires an internal or external address')
+    except ValueError:
+        raise vyos.opmode.DataUnavailable(f'No allocation history before {_isotime(index.start)}')
+
+    for allocation in allocations:
+        allocation['allocated'] = _isotime(allocation['allocated'])
+    return allocations
+
+
+def _get_raw_data(external_address: str = '', internal_address: str = '',
+                  external_port: int = None, time: str = None) -> list[dict]:
+    """Get CGNAT allocations, filtered by external or internal address if provided."""
+    when = _timestamp(time)
+    index = _get_index()
+    if index is None:
+        if when is not None:
+            raise vyos.opmode.DataUnavailable('CGNAT allocation history is not available')
+        allocations = _get_raw_nft_data(external_address, internal_address)
+        if external_port is not None:
+            allocations = [a for a in allocations if
+                           int(a['port_range'].split('-')[0]) <= external_port <=
+                           int(a['port_range'].split('-')[1])]
+        return allocations
+    return _lookup(index, external_address, internal_address, external_port, when)
+
+
+def _get_raw_lookup(queries: list[str], time: str = None) -> list[dict]:
+    """
+    Look up the allocations of many addresses with one index, at a time in
+    the past if given. A query is an internal or external address, or an
+    external address and port as <address>:<port>
+    """
+    when = _timestamp(time)
+    index = _get_index()
+    if index is None:
+        raise vyos.opmode.DataUnavailable('CGNAT allocation index is not available')
+
+    state_time = _isotime(index.time)
+    results = []
+    for query in queries:
+        address, _, port = query.partition(':')
+        if port:
+            if not port.isdigit():
+                raise vyos.opmode.IncorrectValue(f'Invalid port in "{query}"')
+            allocations = _lookup(index, external_address=address,
+                                  external_port=int(port), when=when)
+        else:
+            allocations = (_lookup(index, internal_address=address, when=when) or
+                           _lookup(index, external_address=address, when=when))
+        results.append({'query': query, 'time': _isotime(when) or state_time,
+                        'state_time': state_time, 'allocations': allocations})
+    return results
+
+
 def _get_formatted_output(allocations: list[dict]) -> str:
     # Convert the list of dictionaries to a list of tuples for tabulate
-    headers = ['Internal IP', 'External IP', 'Port range']
+    headers = ['Internal IP', 'External IP', 'Port range', 'Allocated']
     data = [
-        (alloc['internal_address'], alloc['external_address'], alloc['port_range'])
+        (alloc['internal_address'], alloc['external_address'], alloc['port_range'],
+         alloc.get('allocated') or '-')
         for alloc in allocations
     ]
     output = tabulate(data, headers, numalign="left")
     return output
 
 
+def _get_formatted_lookup(results: list[dict]) -> str:
+    headers = ['Query', 'Internal IP', 'External IP', 'Port range', 'Allocated']
+    data = []
+    for result in results:
+        if not result['allocations']:
+            data.append((result['query'], '-', '-', '-', '-'))
+        for alloc in result['allocations']:
+            data.append((result['query'], alloc['internal_address'],
+                         alloc['external_address'], alloc['port_range'],
+                         alloc['allocated'] or '-'))
+    output = tabulate(data, headers, numalign="left")
+    if results:
+        output += f'\n\nAllocations as of {results[0]["time"]}'
+    return output
+
+
+def _verify_configured():
+    config = ConfigTreeQuery()
+    if not config.exists('nat cgnat'):
+        raise vyos.opmode.UnconfiguredSubsystem('CGNAT is not configured')
+
+
 def show_allocation(
     raw: bool,
     external_address: typing.Optional[str],
     internal_address: typing.Optional[str],
+    external_port: typing.Optional[int],
+    time: typing.Optional[str],
 ) -> str:
-    config = ConfigTreeQuery()
-    if not config.exists('nat cgnat'):
-        raise vyos.opmode.UnconfiguredSubsystem('CGNAT is not configured')
+    _verify_configured()
 
     if raw:
-        return _get_raw_data(external_address, internal_address)
+        return _get_raw_data(external_address, internal_address, external_port, time)
 
     else:
-        raw_data = _get_raw_data(external_address, internal_address)
+        raw_data = _get_raw_data(external_address, internal_address, external_port, time)
         return _get_formatted_output(raw_data)
 
 
+def show_allocation_lookup(raw: bool, query: list[str], time: typing.Optional[str]):
+    """Look up allocations of internal addresses, external addresses or
+    external address:port pairs in bulk, at a time in the past if given"""
+    _verify_configured()
+
+    results = _get_raw_lookup(query, time)
+    if raw:
+        return results
+
+    else:
+        return _get_formatted_lookup(results)
+
+
 if __name__ == '__main__':
     try:
         res = vyos.opmode.run(sys.modules[__name__])
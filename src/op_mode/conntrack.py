@@ -14,50 +14,120 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+import socket
 import sys
 import typing
-import xmltodict
 
+from ipaddress import ip_address
+from itertools import islice
+
+from pyroute2.netlink.nfnetlink.nfctsocket import NFCTSocket
+from pyroute2.netlink.nfnetlink.nfctsocket import NFCTAttrTuple
 from tabulate import tabulate
+from vyos.utils.file import read_json
 from vyos.utils.process import cmd
+from vyos.utils.process import is_systemd_service_running
 
 import vyos.opmode
 
 ArgFamily = typing.Literal['inet', 'inet6']
+ArgProtocol = typing.Literal['tcp', 'udp', 'icmp', 'icmpv6', 'sctp', 'gre']
 
-def _get_xml_data(family):
-    """
-    Get conntrack XML output
-    """
-    return cmd(f'sudo conntrack --dump --family {family} --output xml')
+PROTOCOLS = {
+    'icmp': socket.IPPROTO_ICMP,
+    'tcp': socket.IPPROTO_TCP,
+    'udp': socket.IPPROTO_UDP,
+    'gre': socket.IPPROTO_GRE,
+    'icmpv6': socket.IPPROTO_ICMPV6,
+    'sctp': socket.IPPROTO_SCTP,
+}
+PROTOCOL_NAMES = {v: k for k, v in PROTOCOLS.items()}
+
+# include/uapi/linux/netfilter/nf_conntrack_tcp.h
+TCP_STATES = ('NONE', 'SYN_SENT', 'SYN_RECV', 'ESTABLISHED', 'FIN_WAIT',
+              'CLOSE_WAIT', 'LAST_ACK', 'TIME_WAIT', 'CLOSE', 'SYN_SENT2')
 
+# rows per table when printing the whole table in CLI mode
+PAGE_SIZE = 1000
 
-def _xml_to_dict(xml):
+logger_stats_file = r'/run/vyos-conntrack-logger.stats'
+
+
+def _parse_tuple(prefix: str, cta) -> tuple:
     """
-    Convert XML to dictionary
-    Return: dictionary
+    Return (src, dst, sport, dport) of a conntrack tuple attribute
     """
-    parse = xmltodict.parse(xml, attr_prefix='')
-    # If only one conntrack entry we must change dict
-    if 'meta' in parse['conntrack']['flow']:
-        return dict(conntrack={'flow': [parse['conntrack']['flow']]})
-    return parse
+    ip = cta.get_attr('CTA_TUPLE_IP')
+    proto = cta.get_attr('CTA_TUPLE_PROTO')
+    return (ip.get_attr(f'{prefix}_SRC'), ip.get_attr(f'{prefix}_DST'),
+            proto.get_attr('CTA_PROTO_SRC_PORT'),
+            proto.get_attr('CTA_PROTO_DST_PORT'))
+
+
+def _parse_state(msg) -> str:
+    protoinfo = msg.get_attr('CTA_PROTOINFO')
+    if not protoinfo:
+        return ''
+    tcp = protoinfo.get_attr('CTA_PROTOINFO_TCP')
+    if not tcp:
+        return ''
+    state = tcp.get_attr('CTA_PROTOINFO_TCP_STATE')
+    return TCP_STATES[state] if state < len(TCP_STATES) else str(state)
 
 
-def _get_raw_data(family):
+def _get_flows(family: int, protocol: typing.Optional[str] = None,
+               address: typing.Optional[str] = None,
+               zone: typing.Optional[int] = None) -> typing.Iterator[dict]:
     """
-    Return: dictionary
+    Stream conntrack flows from netlink as compact records. The dump is
+    filtered by family and protocol in the kernel, by address (in
+    compressed form) and zone while streaming, so that no more than one
+    flow is held in memory.
     """
-    xml = _get_xml_data(family)
-    if len(xml) == 0:
-        output = {'conntrack':
-            {
-                'error': True,
-                'reason': 'entries not found'
+    prefix = 'CTA_IP_V4' if family == socket.AF_INET else 'CTA_IP_V6'
+    proto_num = PROTOCOLS[protocol] if protocol else None
+
+    tuple_orig = None
+    if proto_num is not None:
+        tuple_orig = NFCTAttrTuple(family=family, proto=proto_num)
+
+    with NFCTSocket(nfgen_family=family, nlm_generator=True) as ct:
+        for msg in ct.dump(tuple_orig=tuple_orig):
+            if msg['nfgen_family'] != family:
+                continue
+            orig = msg.get_attr('CTA_TUPLE_ORIG')
+            reply = msg.get_attr('CTA_TUPLE_REPLY')
+            if orig is None or reply is None:
+                continue
+
+            num = orig.get_attr('CTA_TUPLE_PROTO').get_attr('CTA_PROTO_NUM')
+            if proto_num is not None and num != proto_num:
+                continue
+            flow_zone = msg.get_attr('CTA_ZONE')
+            if zone is not None and flow_zone != zone:
+                continue
+            src, dst, sport, dport = _parse_tuple(prefix, orig)
+            r_src, r_dst, r_sport, r_dport = _parse_tuple(prefix, reply)
+            if address and address not in (src, dst, r_src, r_dst):
+                continue
+
+            yield {
+                'id': msg.get_attr('CTA_ID'),
+                'protocol': PROTOCOL_NAMES.get(num, str(num)),
+                'src': src,
+                'dst': dst,
+                'sport': sport,
+                'dport': dport,
+                'reply_src': r_src,
+                'reply_dst': r_dst,
+                'reply_sport': r_sport,
+                'reply_dport': r_dport,
+                'state': _parse_state(msg),
+                # T6138 flowtable offload conntrack entries without 'timeout'
+                'timeout': msg.get_attr('CTA_TIMEOUT'),
+                'mark': msg.get_attr('CTA_MARK'),
+                'zone': flow_zone,
             }
-        }
-        return output
-    return _xml_to_dict(xml)
 
 
 def _get_raw_statistics():
@@ -92,66 +162,77 @@ def get_formatted_statistics(entries):
     return output
 
 
-def get_formatted_output(dict_data):
+def _format_endpoint(address, port):
+    return f'{address}:{port}' if port is not None else address
+
+
+def get_formatted_output(flows: typing.Iterable[dict]):
     """
-    :param xml:
+    :param flows: conntrack flow records
     :return: formatted output
     """
     data_entries = []
-    if 'error' in dict_data['conntrack']:
-        return 'Entries not found'
-    for entry in dict_data['conntrack']['flow']:
-        orig_src, orig_dst, orig_sport, orig_dport = {}, {}, {}, {}
-        reply_src, reply_dst, reply_sport, reply_dport = {}, {}, {}, {}
-        proto = {}
-        for meta in entry['meta']:
-            direction = meta['direction']
-            if direction in ['original']:
-                if 'layer3' in meta:
-                    orig_src = meta['layer3']['src']
-                    orig_dst = meta['layer3']['dst']
-                if 'layer4' in meta:
-                    if meta.get('layer4').get('sport'):
-                        orig_sport = meta['layer4']['sport']
-                    if meta.get('layer4').get('dport'):
-                        orig_dport = meta['layer4']['dport']
-                    proto = meta['layer4']['protoname']
-            if direction in ['reply']:
-                if 'layer3' in meta:
-                    reply_src = meta['layer3']['src']
-                    reply_dst = meta['layer3']['dst']
-                if 'layer4' in meta:
-                    if meta.get('layer4').get('sport'):
-                        reply_sport = meta['layer4']['sport']
-                    if meta.get('layer4').get('dport'):
-                        reply_dport = meta['layer4']['dport']
-                    proto = meta['layer4']['protoname']
-            if direction == 'independent':
-                conn_id = meta['id']
-                # T6138 flowtable offload conntrack entries without 'timeout'
-                timeout = meta.get('timeout', 'n/a')
-                orig_src = f'{orig_src}:{orig_sport}' if orig_sport else orig_src
-                orig_dst = f'{orig_dst}:{orig_dport}' if orig_dport else orig_dst
-                reply_src = f'{reply_src}:{reply_sport}' if reply_sport else reply_src
-                reply_dst = f'{reply_dst}:{reply_dport}' if reply_dport else reply_dst
-                state = meta['state'] if 'state' in meta else ''
-                mark = meta['mark'] if 'mark' in meta else ''
-                zone = meta['zone'] if 'zone' in meta else ''
-                data_entries.append(
-                    [conn_id, orig_src, orig_dst, reply_src, reply_dst, proto, state, timeout, mark, zone])
+    for flow in flows:
+        timeout = flow['timeout']
+        data_entries.append([flow['id'],
+                             _format_endpoint(flow['src'], flow['sport']),
+                             _format_endpoint(flow['dst'], flow['dport']),
+                             _format_endpoint(flow['reply_src'], flow['reply_sport']),
+                             _format_endpoint(flow['reply_dst'], flow['reply_dport']),
+                             flow['protocol'], flow['state'],
+                             timeout if timeout is not None else 'n/a',
+                             flow['mark'] if flow['mark'] is not None else '',
+                             flow['zone'] if flow['zone'] is not None else ''])
     headers = ["Id", "Original src", "Original dst", "Reply src", "Reply dst", "Protocol", "State", "Timeout", "Mark",
                "Zone"]
     output = tabulate(data_entries, headers, numalign="left")
     return output
 
 
-def show(raw: bool, family: ArgFamily):
-    family = 'ipv6' if family == 'inet6' else 'ipv4'
-    conntrack_data = _get_raw_data(family)
+def show(raw: bool, family: ArgFamily,
+         protocol: typing.Optional[ArgProtocol],
+         address: typing.Optional[str],
+         zone: typing.Optional[int],
+         offset: typing.Optional[int],
+         limit: typing.Optional[int]):
+    """
+    Show the conntrack table, the flows from offset on, at most limit
+
+    Raw output is a list of flow records as yielded by _get_flows(), an
+    empty list if no flow matches. It replaced the conntrack tool's XML
+    converted to a dict, {'conntrack': {'flow': [{'meta': [...]}]}} or
+    {'conntrack': {'error': True, ...}} for an empty table: the original
+    and reply tuple are the src/dst/sport/dport and reply_* keys, ports
+    are integers and are None for protocols without ports, as are
+    timeout, mark and zone if the flow has none.
+    """
+    family = socket.AF_INET6 if family == 'inet6' else socket.AF_INET
+    if address:
+        try:
+            address = ip_address(address).compressed
+        except ValueError as e:
+            raise vyos.opmode.IncorrectValue(f'Invalid address: {address}') from e
+
+    offset = offset or 0
+    stop = offset + limit if limit is not None else None
+    flows = islice(_get_flows(family, protocol, address, zone), offset, stop)
+
     if raw:
-        return conntrack_data
-    else:
-        return get_formatted_output(conntrack_data)
+        return list(flows)
+
+    if limit is not None:
+        page = list(flows)
+        return get_formatted_output(page) if page else 'Entries not found'
+
+    # print the whole table page by page, as it may hold millions of flows
+    found = False
+    while page := list(islice(flows, PAGE_SIZE)):
+        if found:
+            print()
+        print(get_formatted_output(page))
+        found = True
+    if not found:
+        return 'Entries not found'
 
 
 def show_statistics(raw: bool):
@@ -162,6 +243,22 @@ def show_statistics(raw: bool):
         return get_formatted_statistics(conntrack_statistics)
 
 
+def show_logger_statistics(raw: bool):
+    if not is_systemd_service_running('vyos-conntrack-logger.service'):
+        raise vyos.opmode.UnconfiguredSubsystem('Conntrack logging is not configured')
+
+    stats = read_json(logger_stats_file, defaultonfailure={})
+    if not stats:
+        raise vyos.opmode.DataUnavailable('Conntrack logger statistics are not available')
+    if raw:
+        return stats
+
+    headers = ['Received', 'Dropped', 'Overruns', 'Filtered', 'Logged',
+               'Aggregated', 'Errors']
+    row = [stats.get(h.lower(), 0) for h in headers]
+    return tabulate([row], headers, numalign="left")
+
+
 if __name__ == '__main__':
     try:
         res = vyos.opmode.run(sys.modules[__name__])
@@ -18,6 +18,7 @@
 import sys
 import typing
 
+from collections import Counter
 from datetime import datetime
 from glob import glob
 from ipaddress import ip_address
@@ -29,8 +30,11 @@
 from vyos.configquery import ConfigTreeQuery
 
 from vyos.kea import kea_get_active_config
-from vyos.kea import kea_get_leases
-from vyos.kea import kea_get_pool_from_subnet_id
+from vyos.kea import kea_get_active_config_async
+from vyos.kea import kea_get_lease
+from vyos.kea import kea_get_leases_paged
+from vyos.kea import kea_get_leases_paged_async
+from vyos.kea import kea_get_subnet_pool_index
 from vyos.kea import kea_delete_lease
 from vyos.utils.process import is_systemd_service_running
 from vyos.utils.process import call
@@ -62,16 +66,14 @@ def _format_hex_string(in_str):
     return out_str
 
 
-def _find_list_of_dict_index(lst, key='ip', value='') -> int:
+def _get_server_leases(inet_suffix):
     """
-    Find the index entry of list of dict matching the dict value
-    Exampe:
-        % lst = [{'ip': '192.0.2.1'}, {'ip': '192.0.2.2'}]
-        % _find_list_of_dict_index(lst, key='ip', value='192.0.2.2')
-        % 1
+    Stream leases from the DHCP server
     """
-    idx = next((index for (index, d) in enumerate(lst) if d[key] == value), None)
-    return idx
+    try:
+        yield from kea_get_leases_paged(inet_suffix)
+    except:
+        raise vyos.opmode.DataUnavailable('Cannot fetch DHCP server lease information')
 
 
 def _get_raw_server_leases(family='inet', pool=None, sorted=None, state=[], origin=None) -> list:
@@ -80,22 +82,55 @@ def _get_raw_server_leases(family='inet', pool=None, sorted=None, state=[], orig
     :return list
     """
     inet_suffix = '6' if family == 'inet6' else '4'
+
     try:
-        leases = kea_get_leases(inet_suffix)
+        active_config = kea_get_active_config(inet_suffix)
+    except:
+        raise vyos.opmode.DataUnavailable('Cannot fetch DHCP server configuration')
+
+    return _server_lease_data(_get_server_leases(inet_suffix), active_config,
+                              family=family, pool=pool, sorted=sorted, state=state)
+
+
+async def _get_raw_server_leases_async(family='inet', pool=None, sorted=None, state=[], origin=None) -> list:
+    """
+    Get DHCP server leases with the asyncio control socket client, for the
+    API server
+    :return list
+    """
+    inet_suffix = '6' if family == 'inet6' else '4'
+
+    try:
+        active_config = await kea_get_active_config_async(inet_suffix)
+    except:
+        raise vyos.opmode.DataUnavailable('Cannot fetch DHCP server configuration')
+
+    try:
+        leases = [lease async for lease in kea_get_leases_paged_async(inet_suffix)]
     except:
         raise vyos.opmode.DataUnavailable('Cannot fetch DHCP server lease information')
 
+    return _server_lease_data(leases, active_config, family=family, pool=pool,
+                              sorted=sorted, state=state)
+
+
+def _server_lease_data(leases, active_config, family='inet', pool=None, sorted=None, state=[]) -> list:
+    """
+    Raw data of the leases fetched from the DHCP server
+    :return list
+    """
+    inet_suffix = '6' if family == 'inet6' else '4'
+
     if pool is None:
         pool = _get_dhcp_pools(family=family)
     else:
         pool = [pool]
 
-    try:
-        active_config = kea_get_active_config(inet_suffix)
-    except:
-        raise vyos.opmode.DataUnavailable('Cannot fetch DHCP server configuration')
+    pool_index = kea_get_subnet_pool_index(active_config, inet_suffix) if active_config else {}
+    lease_state_long = {0: 'active', 1: 'rejected', 2: 'expired'}
 
-    data = []
+    # leases by address: a later lease for an address replaces the earlier one
+    data = {}
     for lease in leases:
         lifetime = lease['valid-lft']
         expiry = (lease['cltt'] + lifetime)
@@ -105,9 +140,8 @@ def _get_raw_server_leases(family='inet', pool=None, sorted=None, state=[], orig
 
         data_lease = {}
         data_lease['ip'] = lease['ip-address']
-        lease_state_long = {0: 'active', 1: 'rejected', 2: 'expired'}
         data_lease['state'] = lease_state_long[lease['state']]
-        data_lease['pool'] = kea_get_pool_from_subnet_id(active_config, inet_suffix, lease['subnet-id']) if active_config else '-'
+        data_lease['pool'] = pool_index.get(int(lease['subnet-id'])) if active_config else '-'
         data_lease['end'] = lease['expire_timestamp'].timestamp() if lease['expire_timestamp'] else None
         data_lease['origin'] = 'local' # TODO: Determine remote in HA
 
@@ -138,17 +172,10 @@ def _get_raw_server_leases(family='inet', pool=None, sorted=None, state=[], orig
         # Do not add old leases
         if data_lease['remaining'] != '' and data_lease['pool'] in pool and data_lease['state'] != 'free':
             if not state or state == 'all' or data_lease['state'] in state:
-                data.append(data_lease)
-
-        # deduplicate
-        checked = []
-        for entry in data:
-            addr = entry.get('ip')
-            if addr not in checked:
-                checked.append(addr)
-            else:
-                idx = _find_list_of_dict_index(data, key='ip', value=addr)
-                data.pop(idx)
+                data.pop(data_lease['ip'], None)
+                data[data_lease['ip']] = data_lease
+
+    data = list(data.values())
 
     if sorted:
         if sorted == 'ip':
@@ -225,6 +252,10 @@ def _get_pool_size(pool, family='inet'):
 
 
 def _get_raw_pool_statistics(family='inet', pool=None):
+    # fetch the leases of all pools at once, not once per pool
+    lease_count = Counter(lease['pool'] for lease in
+                          _get_raw_server_leases(family=family, pool=pool))
+
     if pool is None:
         pool = _get_dhcp_pools(family=family)
     else:
@@ -235,7 +266,7 @@ def _get_raw_pool_statistics(family='inet', pool=None):
     for p in pool:
         subnet = config.list_nodes(f'service dhcp{v}-server shared-network-name {p} subnet')
         size = _get_pool_size(family=family, pool=p)
-        leases = len(_get_raw_server_leases(family=family, pool=p))
+        leases = lease_count[p]
         use_percentage = round(leases / size * 100) if size != 0 else 0
         pool_stats = {'pool': p, 'size': size, 'leases': leases,
                       'available': (size - leases), 'use_percentage': use_percentage, 'subnet': subnet}
@@ -345,10 +376,7 @@ def show_pool_statistics(raw: bool, family: ArgFamily, pool: typing.Optional[str
         return _get_formatted_pool_statistics(pool_data, family=family)
 
 
-@_verify
-def show_server_leases(raw: bool, family: ArgFamily, pool: typing.Optional[str],
-                       sorted: typing.Optional[str], state: typing.Optional[ArgState],
-                       origin: typing.Optional[ArgOrigin] ):
+def _check_server_leases(family, pool, sorted, state):
     # if dhcp server is down, inactive leases may still be shown as active, so warn the user.
     v = '6' if family == 'inet6' else '4'
     if not is_systemd_service_running(f'kea-dhcp{v}-server.service'):
@@ -365,12 +393,31 @@ def show_server_leases(raw: bool, family: ArgFamily, pool: typing.Optional[str],
     if sorted and sorted not in sort_valid:
         raise vyos.opmode.IncorrectValue(f'DHCP{v} sort "{sorted}" is invalid!')
 
+
+@_verify
+def show_server_leases(raw: bool, family: ArgFamily, pool: typing.Optional[str],
+                       sorted: typing.Optional[str], state: typing.Optional[ArgState],
+                       origin: typing.Optional[ArgOrigin] ):
+    _check_server_leases(family, pool, sorted, state)
+
     lease_data = _get_raw_server_leases(family=family, pool=pool, sorted=sorted, state=state, origin=origin)
     if raw:
         return lease_data
     else:
         return _get_formatted_server_leases(lease_data, family=family)
 
+
+@_verify
+async def _show_server_leases_async(family: ArgFamily, pool: typing.Optional[str] = None,
+                                    sorted: typing.Optional[str] = None,
+                                    state: typing.Optional[ArgState] = None,
+                                    origin: typing.Optional[ArgOrigin] = None):
+    """Raw show_server_leases for the API server, which runs an event loop"""
+    _check_server_leases(family, pool, sorted, state)
+
+    return await _get_raw_server_leases_async(family=family, pool=pool, sorted=sorted,
+                                              state=state, origin=origin)
+
 @_verify
 def show_server_static_mappings(raw: bool, family: ArgFamily, pool: typing.Optional[str],
                                 sorted: typing.Optional[str]):
@@ -388,11 +435,7 @@ def show_server_static_mappings(raw: bool, family: ArgFamily, pool: typing.Optio
         return _get_formatted_server_static_mappings(static_mappings, family=family)
 
 def _lease_valid(inet, address):
-    leases = kea_get_leases(inet)
-    for lease in leases:
-        if address == lease['ip-address']:
-            return True
-    return False
+    return kea_get_lease(inet, address) is not None
 
 @_verify
 def clear_dhcp_server_lease(family: ArgFamily, address: str):
@@ -24,6 +24,7 @@
 from vyos.config import Config
 from vyos.utils.process import cmd
 from vyos.utils.dict import dict_search_args
+from vyos.utils.file import read_file
 
 def get_config_node(conf, node=None, family=None, hook=None, priority=None):
     if node == 'nat':
@@ -698,6 +699,28 @@ def show_statistics():
                 for prior, prior_conf in firewall[family][hook].items():
                     output_firewall_name_statistics(family, hook,prior, prior_conf)
 
+def show_domain_resolver_statistics():
+    try:
+        stats = json.loads(read_file('/run/vyos-domain-resolver.stats'))
+    except (FileNotFoundError, ValueError):
+        print('Domain resolver statistics are not available')
+        return
+
+    latency = stats['latency_ms']
+    rows = [
+        ['Domains', stats['domains']],
+        ['Sets', stats['sets']],
+        ['Queries', stats['queries']],
+        ['Failed queries', stats['failures']],
+        ['Latency p50/p95/max (ms)', f"{latency['p50']} / {latency['p95']} / {latency['max']}"],
+        ['Set updates', stats['updates']],
+        ['Elements added', stats['added']],
+        ['Elements removed', stats['removed']],
+        ['Failed set updates', stats['errors']],
+    ]
+    print('Domain Resolver Statistics\n')
+    print(tabulate.tabulate(rows, tablefmt='plain'))
+
 if __name__ == '__main__':
     parser = argparse.ArgumentParser()
     parser.add_argument('--action', help='Action', required=False)
@@ -720,6 +743,8 @@ def show_statistics():
         show_firewall()
     elif args.action == 'show_family':
         show_firewall_family(args.family)
+    elif args.action == 'show_domain_resolver':
+        show_domain_resolver_statistics()
     elif args.action == 'show_group':
         show_firewall_group(args.name)
     elif args.action == 'show_statistics':
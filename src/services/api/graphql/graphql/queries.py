@@ -14,6 +14,7 @@
 # along with this library.  If not, see <http://www.gnu.org/licenses/>.
 
 from importlib import import_module
+from inspect import isawaitable
 
 # used below by func_sig
 from typing import Any, Dict, Optional  # pylint: disable=W0611 # noqa: F401
@@ -98,6 +99,8 @@ async def func_impl(*args, **kwargs):
             k = klass(session, data)
             method = getattr(k, session_func)
             result = method()
+            if isawaitable(result):
+                result = await result
             data['result'] = result
 
             return {'success': True, 'data': data}
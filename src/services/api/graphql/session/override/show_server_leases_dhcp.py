@@ -0,0 +1,34 @@
+# Copyright 2024 VyOS maintainers and contributors <maintainers@vyos.io>
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this library.  If not, see <http://www.gnu.org/licenses/>.
+
+from api.graphql.libs.op_mode import load_op_mode_as_module
+from api.graphql.libs.op_mode import normalize_output
+from api.graphql.session.session import Session
+from api.session import SessionState
+
+class ShowServerLeasesDhcp(Session):
+    # Leases are fetched with the asyncio Kea control socket client, so a
+    # large lease table does not hold an op-mode worker thread while the
+    # server sends it
+
+    async def gen_op_query(self):
+        executor = SessionState().op_executor
+        if executor is not None:
+            dhcp = executor.module('dhcp.py')
+        else:
+            dhcp = load_op_mode_as_module('dhcp.py')
+
+        res = await dhcp._show_server_leases_async(**self._data)
+        return normalize_output(res)
@@ -22,9 +22,11 @@
 from vyos.configtree import ConfigTree
 from vyos.defaults import directories
 from vyos.opmode import Error as OpModeError
+from vyos.opmode_executor import ExecutorBusy
 
 from api.graphql.libs.op_mode import load_op_mode_as_module, split_compound_op_mode_name
 from api.graphql.libs.op_mode import normalize_output
+from api.session import SessionState
 
 op_mode_include_file = os.path.join(directories['data'], 'op-mode-standardized.json')
 
@@ -185,10 +187,17 @@ def gen_op_query(self):
         if scriptname == '':
             raise FileNotFoundError(f"No op-mode file named in string '{name}'")
 
-        mod = load_op_mode_as_module(f'{scriptname}')
-        func = getattr(mod, func_name)
+        executor = SessionState().op_executor
         try:
-            res = func(True, **data)
+            if executor is not None:
+                try:
+                    res = executor.call(scriptname, func_name, data, raw=True)
+                except ExecutorBusy:
+                    executor = None
+            if executor is None:
+                mod = load_op_mode_as_module(f'{scriptname}')
+                func = getattr(mod, func_name)
+                res = func(True, **data)
         except OpModeError as e:
             raise e
 
@@ -0,0 +1,219 @@
+# Copyright 2024 VyOS maintainers and contributors <maintainers@vyos.io>
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this library.  If not, see <http://www.gnu.org/licenses/>.
+
+# Configuration requests are queued and applied by a single worker thread.
+# Queued jobs not touching the same part of the configuration are committed
+# together; if such a commit fails, the jobs are committed one by one so
+# that the error is reported for the job causing it.
+
+import logging
+import threading
+import time
+import traceback
+
+from collections import OrderedDict
+from uuid import uuid4
+
+from vyos.configsession import ConfigSessionError
+
+LOG = logging.getLogger('http_api.commit_queue')
+
+max_batch = 50
+history_size = 1000
+
+
+def paths_conflict(a: list, b: list) -> bool:
+    # one path is the same as or contains the other
+    n = min(len(a), len(b))
+    return a[:n] == b[:n]
+
+
+class Job:
+    def __init__(self, commands: list, paths: list):
+        self.id = uuid4().hex
+        self.commands = commands
+        # None conflicts with any other job
+        self.paths = paths
+        self.status = 'queued'
+        self.submitted = time.time()
+        self.started = None
+        self.finished = None
+        self.batch_size = None
+        self.commit_time = None
+        self.message = None
+        self.error = None
+
+    def conflicts(self, other: 'Job') -> bool:
+        if self.paths is None or other.paths is None:
+            return True
+        return any(paths_conflict(a, b) for a in self.paths for b in other.paths)
+
+    def to_dict(self) -> dict:
+        return {
+            'id': self.id,
+            'status': self.status,
+            'submitted': self.submitted,
+            'started': self.started,
+            'finished': self.finished,
+            'batch_size': self.batch_size,
+            'commit_time': self.commit_time,
+            'message': self.message,
+            'error': self.error,
+        }
+
+
+class CommitQueue:
+    """
+    Applies and commits queued jobs in the background
+
+    apply(job) adds the changes of a job to the session, commit() commits
+    them and returns the output, discard() drops uncommitted changes; all
+    are called holding lock.
+    """
+
+    def __init__(self, apply, commit, discard, lock):
+        self._apply_job = apply
+        self._commit = commit
+        self._discard = discard
+        self._lock = lock
+        self._cond = threading.Condition()
+        self._queue = []
+        self._jobs = OrderedDict()
+        self.stats = {
+            'jobs': 0,
+            'committed': 0,
+            'failed': 0,
+            'commits': 0,
+            'commit_time_total': 0.0,
+            'commit_time_last': None,
+            'batch_size_max': 0,
+        }
+        self._worker = threading.Thread(target=self._run, name='commit-queue', daemon=True)
+        self._worker.start()
+
+    def submit(self, commands: list, paths: list) -> Job:
+        job = Job(commands, paths)
+        with self._cond:
+            self._jobs[job.id] = job
+            while len(self._jobs) > history_size:
+                oldest = next(iter(self._jobs.values()))
+                if oldest.finished is None:
+                    break
+                self._jobs.popitem(last=False)
+            self._queue.append(job)
+            self.stats['jobs'] += 1
+            self._cond.notify()
+        return job
+
+    def job(self, job_id: str):
+        with self._cond:
+            return self._jobs.get(job_id)
+
+    def status(self) -> dict:
+        with self._cond:
+            stats = dict(self.stats)
+            stats['queued'] = len(self._queue)
+        commits = stats.pop('commit_time_total')
+        stats['commit_time_average'] = commits / stats['commits'] if stats['commits'] else None
+        return stats
+
+    def _next_batch(self) -> list:
+        # leading jobs of the queue, up to the first one conflicting with
+        # any job before it
+        with self._cond:
+            while not self._queue:
+                self._cond.wait()
+            batch = []
+            for job in self._queue[:max_batch]:
+                if any(job.conflicts(other) for other in batch):
+                    break
+                batch.append(job)
+            del self._queue[:len(batch)]
+        return batch
+
+    def _finish(self, job: Job, status: str, message=None, error=None):
+        job.status = status
+        job.message = message
+        job.error = error
+        job.finished = time.time()
+        job.commands = None
+        self.stats[status] += 1
+
+    def _apply(self, batch: list) -> list:
+        applied = []
+        for job in batch:
+            try:
+                self._apply_job(job)
+                applied.append(job)
+            except Exception as e:
+                if isinstance(e, ConfigSessionError):
+                    error = str(e)
+                else:
+                    LOG.critical(traceback.format_exc())
+                    error = 'An internal error occured. Check the logs for details.'
+                self._discard()
+                self._finish(job, 'failed', error=error)
+                # changes of the jobs before it were discarded too
+                applied = self._apply(applied)
+        return applied
+
+    def _process(self, batch: list) -> None:
+        applied = self._apply(batch)
+        if not applied:
+            return
+
+        start = time.monotonic()
+        try:
+            out = self._commit()
+        except Exception as e:
+            self._discard()
+            if len(applied) > 1:
+                for job in applied:
+                    self._process([job])
+                return
+            if isinstance(e, ConfigSessionError):
+                error = str(e)
+            else:
+                LOG.critical(traceback.format_exc())
+                error = 'An internal error occured. Check the logs for details.'
+            self._finish(applied[0], 'failed', error=error)
+            return
+
+        commit_time = time.monotonic() - start
+        self.stats['commits'] += 1
+        self.stats['commit_time_total'] += commit_time
+        self.stats['commit_time_last'] = commit_time
+        self.stats['batch_size_max'] = max(self.stats['batch_size_max'], len(applied))
+        for job in applied:
+            job.batch_size = len(applied)
+            job.commit_time = commit_time
+            self._finish(job, 'committed', message=out if out else None)
+        LOG.info(f'Committed {len(applied)} queued configuration jobs in {commit_time:.2f}s')
+
+    def _run(self) -> None:
+        while True:
+            batch = self._next_batch()
+            with self._lock:
+                started = time.time()
+                for job in batch:
+                    job.status = 'running'
+                    job.started = started
+                try:
+                    self._process(batch)
+                except Exception:
+                    LOG.critical(traceback.format_exc())
+                    for job in batch:
+                        if job.finished is None:
+                            self._finish(job, 'failed', error='An internal error occured. Check the logs for details.')
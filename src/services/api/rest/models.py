@@ -22,6 +22,7 @@
 from typing import List
 from typing import Union
 from typing import Dict
+from typing import Optional
 from typing import Self
 
 from pydantic import BaseModel
@@ -279,6 +280,20 @@ class Config:
         }
 
 
+class CommitQueueModel(ApiModel):
+    op: StrictStr
+    id: Optional[StrictStr] = None
+
+    class Config:
+        json_schema_extra = {
+            'example': {
+                'key': 'id_key',
+                'op': 'status',
+                'id': 'job id (optional)',
+            }
+        }
+
+
 class Success(BaseModel):
     success: bool
     data: Union[str, bool, Dict]
@@ -0,0 +1,113 @@
+# Copyright 2024 VyOS maintainers and contributors <maintainers@vyos.io>
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this library.  If not, see <http://www.gnu.org/licenses/>.
+
+# /retrieve reads the working config of the API session, which equals the
+# running config unless a configuration request holds the session lock.
+# Responses are only cached while it equals the running config: not while
+# the lock is held, and not across a release of the lock, as the changes
+# made holding it may have been discarded without a commit.
+
+from threading import Lock
+
+from vyos.config import Config
+from vyos.utils.commit import commit_generation
+
+# Responses kept per commit generation
+retrieve_cache_size = 1024
+
+
+class SessionLock:
+    """
+    Lock held while changing the working config of the API session; counts
+    how often it was acquired
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+        self.acquired = 0
+
+    def acquire(self, *args, **kwargs):
+        res = self._lock.acquire(*args, **kwargs)
+        if res:
+            self.acquired += 1
+        return res
+
+    def release(self):
+        self._lock.release()
+
+    def locked(self):
+        return self._lock.locked()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *args):
+        self.release()
+
+
+class RetrieveCache:
+    """
+    /retrieve responses for one generation of the running config. The
+    config is read once, and the serialized response of each operation,
+    path and format is kept until the next commit or change of the session.
+    """
+
+    def __init__(self, generation, acquired, env):
+        self.generation = generation
+        self.acquired = acquired
+        self.env = env
+        self.responses = {}
+        self._config = None
+
+    @property
+    def config(self):
+        if self._config is None:
+            self._config = Config(session_env=self.env)
+        return self._config
+
+    def valid(self, lock: SessionLock, generation=None) -> bool:
+        if generation is None:
+            generation = commit_generation()
+        return (not lock.locked() and self.acquired == lock.acquired
+                and self.generation == generation)
+
+    def add(self, key, body: bytes, lock: SessionLock):
+        # the session may have been changed while the response was created
+        if not self.valid(lock):
+            return
+        if len(self.responses) < retrieve_cache_size:
+            self.responses[key] = body
+
+
+retrieve_cache = None
+
+
+def get_retrieve_cache(env, lock: SessionLock):
+    """
+    Return the cache of the current commit generation, None if the
+    generation is unknown or the session is being changed and the config
+    has to be read for each request
+    """
+    # pylint: disable=global-statement
+
+    global retrieve_cache
+
+    generation = commit_generation()
+    if generation is None or lock.locked():
+        return None
+    if retrieve_cache is None or not retrieve_cache.valid(lock, generation):
+        retrieve_cache = RetrieveCache(generation, lock.acquired, env)
+    return retrieve_cache
@@ -22,7 +22,6 @@
 import copy
 import logging
 import traceback
-from threading import Lock
 from typing import Union
 from typing import Callable
 from typing import TYPE_CHECKING
@@ -33,6 +32,7 @@
 from fastapi import HTTPException
 from fastapi import APIRouter
 from fastapi import BackgroundTasks
+from fastapi.responses import HTMLResponse
 from fastapi.routing import APIRoute
 from starlette.datastructures import FormData
 from starlette.formparsers import FormParser
@@ -44,6 +44,7 @@
 from vyos.configtree import ConfigTree
 from vyos.configdiff import get_config_diff
 from vyos.configsession import ConfigSessionError
+from vyos.opmode import Error as OpModeError
 
 from ..session import SessionState
 from .models import success
@@ -68,6 +69,10 @@
 from .models import ResetModel
 from .models import ImportPkiModel
 from .models import PoweroffModel
+from .models import CommitQueueModel
+from .commit_queue import CommitQueue
+from .retrieve_cache import SessionLock
+from .retrieve_cache import get_retrieve_cache
 
 
 if TYPE_CHECKING:
@@ -76,7 +81,7 @@
 
 LOG = logging.getLogger('http_api.routers')
 
-lock = Lock()
+lock = SessionLock()
 
 
 def check_auth(key_list, key):
@@ -209,6 +214,7 @@ async def body(self) -> bytes:
                         '/container-image',
                         '/image',
                         '/configure-section',
+                        '/commit-queue',
                     ):
                         if 'path' not in c:
                             self.form_err = (
@@ -289,14 +295,102 @@ async def custom_route_handler(request: Request) -> Response:
 
 
 def call_commit(s: SessionState):
-    try:
-        s.session.commit()
-    except ConfigSessionError as e:
-        s.session.discard()
-        if s.debug:
-            LOG.warning(f'ConfigSessionError:\n {traceback.format_exc()}')
-        else:
-            LOG.warning(f'ConfigSessionError: {e}')
+    # the changes were made by a request which released the lock already
+    with lock:
+        try:
+            s.session.commit()
+        except ConfigSessionError as e:
+            s.session.discard()
+            if s.debug:
+                LOG.warning(f'ConfigSessionError:\n {traceback.format_exc()}')
+            else:
+                LOG.warning(f'ConfigSessionError: {e}')
+
+
+def _apply_commands(state: SessionState, commands: list):
+    # pylint: disable=too-many-branches
+
+    session = state.session
+    config = Config(session_env=session.get_session_env())
+
+    for c in commands:
+        op = c.op
+        if not isinstance(c, BaseConfigSectionTreeModel):
+            path = c.path
+
+        if isinstance(c, BaseConfigureModel):
+            if c.value:
+                value = c.value
+            else:
+                value = ''
+            # For vyos.configsession calls that have no separate value arguments,
+            # and for type checking too
+            cfg_path = ' '.join(path + [value]).strip()
+
+        elif isinstance(c, BaseConfigSectionModel):
+            section = c.section
+
+        elif isinstance(c, BaseConfigSectionTreeModel):
+            mask = c.mask
+            tree = c.config
+
+        if isinstance(c, BaseConfigureModel):
+            if op == 'set':
+                session.set(path, value=value)
+            elif op == 'delete':
+                if state.strict and not config.exists(cfg_path):
+                    raise ConfigSessionError(
+                        f'Cannot delete [{cfg_path}]: path/value does not exist'
+                    )
+                session.delete(path, value=value)
+            elif op == 'comment':
+                session.comment(path, value=value)
+            else:
+                raise ConfigSessionError(f"'{op}' is not a valid operation")
+
+        elif isinstance(c, BaseConfigSectionModel):
+            if op == 'set':
+                session.set_section(path, section)
+            elif op == 'load':
+                session.load_section(path, section)
+            else:
+                raise ConfigSessionError(f"'{op}' is not a valid operation")
+
+        elif isinstance(c, BaseConfigSectionTreeModel):
+            if op == 'set':
+                session.set_section_tree(tree)
+            elif op == 'load':
+                session.load_section_tree(mask, tree)
+            else:
+                raise ConfigSessionError(f"'{op}' is not a valid operation")
+
+
+def _command_paths(commands: list) -> Union[list, None]:
+    # configuration paths changed by commands, None if unknown
+    paths = []
+    for c in commands:
+        if isinstance(c, BaseConfigSectionTreeModel):
+            return None
+        paths.append(c.path)
+    return paths
+
+
+commit_queue = None
+
+
+def get_commit_queue(state: SessionState) -> CommitQueue:
+    # pylint: disable=global-statement
+
+    global commit_queue
+    if commit_queue is None:
+        session = state.session
+        commit_queue = CommitQueue(
+            apply=lambda job: _apply_commands(state, job.commands),
+            commit=session.commit,
+            discard=session.discard,
+            lock=lock,
+        )
+    return commit_queue
 
 
 def _configure_op(
@@ -310,7 +404,6 @@ def _configure_op(
     _request: Request,
     background_tasks: BackgroundTasks,
 ):
-    # pylint: disable=too-many-branches,too-many-locals,too-many-nested-blocks,too-many-statements
     # pylint: disable=consider-using-with
 
     state = SessionState()
@@ -323,68 +416,24 @@ def _configure_op(
     else:
         data = data.commands
 
+    # Changes are committed in the background, see /commit-queue for the
+    # result
+    if state.commit_queue:
+        job = get_commit_queue(state).submit(data, _command_paths(data))
+        LOG.info(f"Configuration change queued via HTTP API using key '{state.id}' as job {job.id}")
+        return success({'job_id': job.id, 'status': job.status})
+
     # We don't want multiple people/apps to be able to commit at once,
     # or modify the shared session while someone else is doing the same,
     # so the lock is really global
     lock.acquire()
 
-    config = Config(session_env=env)
-
     status = 200
     msg = None
     error_msg = None
     try:
-        for c in data:
-            op = c.op
-            if not isinstance(c, BaseConfigSectionTreeModel):
-                path = c.path
-
-            if isinstance(c, BaseConfigureModel):
-                if c.value:
-                    value = c.value
-                else:
-                    value = ''
-                # For vyos.configsession calls that have no separate value arguments,
-                # and for type checking too
-                cfg_path = ' '.join(path + [value]).strip()
-
-            elif isinstance(c, BaseConfigSectionModel):
-                section = c.section
-
-            elif isinstance(c, BaseConfigSectionTreeModel):
-                mask = c.mask
-                config = c.config
-
-            if isinstance(c, BaseConfigureModel):
-                if op == 'set':
-                    session.set(path, value=value)
-                elif op == 'delete':
-                    if state.strict and not config.exists(cfg_path):
-                        raise ConfigSessionError(
-                            f'Cannot delete [{cfg_path}]: path/value does not exist'
-                        )
-                    session.delete(path, value=value)
-                elif op == 'comment':
-                    session.comment(path, value=value)
-                else:
-                    raise ConfigSessionError(f"'{op}' is not a valid operation")
-
-            elif isinstance(c, BaseConfigSectionModel):
-                if op == 'set':
-                    session.set_section(path, section)
-                elif op == 'load':
-                    session.load_section(path, section)
-                else:
-                    raise ConfigSessionError(f"'{op}' is not a valid operation")
+        _apply_commands(state, data)
 
-            elif isinstance(c, BaseConfigSectionTreeModel):
-                if op == 'set':
-                    session.set_section_tree(config)
-                elif op == 'load':
-                    session.load_section_tree(mask, config)
-                else:
-                    raise ConfigSessionError(f"'{op}' is not a valid operation")
-        # end for
         config = Config(session_env=env)
         d = get_config_diff(config)
 
@@ -446,17 +495,48 @@ def configure_section_op(
     return _configure_op(data, request, background_tasks)
 
 
+@router.post('/commit-queue')
+def commit_queue_op(data: CommitQueueModel):
+    state = SessionState()
+
+    op = data.op
+
+    if op != 'status':
+        return error(400, f"'{op}' is not a valid operation")
+
+    if commit_queue is None:
+        if data.id:
+            return error(400, f"Job '{data.id}' does not exist")
+        return success({'enabled': state.commit_queue})
+
+    if data.id:
+        job = commit_queue.job(data.id)
+        if job is None:
+            return error(400, f"Job '{data.id}' does not exist")
+        return success(job.to_dict())
+
+    res = commit_queue.status()
+    res['enabled'] = state.commit_queue
+    return success(res)
+
+
 @router.post('/retrieve')
 async def retrieve_op(data: RetrieveModel):
     state = SessionState()
     session = state.session
     env = session.get_session_env()
-    config = Config(session_env=env)
 
     op = data.op
     path = ' '.join(data.path)
 
+    cache = get_retrieve_cache(env, lock)
+    key = (op, tuple(data.path), data.configFormat)
+    if cache is not None and key in cache.responses:
+        return HTMLResponse(cache.responses[key])
+
     try:
+        if op in ['returnValue', 'returnValues', 'exists']:
+            config = cache.config if cache is not None else Config(session_env=env)
         if op == 'returnValue':
             res = config.return_value(path)
         elif op == 'returnValues':
@@ -487,7 +567,10 @@ async def retrieve_op(data: RetrieveModel):
         LOG.critical(traceback.format_exc())
         return error(500, 'An internal error occured. Check the logs for details.')
 
-    return success(res)
+    response = success(res)
+    if cache is not None:
+        cache.add(key, response.body, lock)
+    return response
 
 
 @router.post('/config-file')
@@ -511,16 +594,17 @@ def config_file_op(data: ConfigFileModel, background_tasks: BackgroundTasks):
             else:
                 return error(400, 'Missing required field "file"')
 
-            session.migrate_and_load_config(path)
+            with lock:
+                session.migrate_and_load_config(path)
 
-            config = Config(session_env=env)
-            d = get_config_diff(config)
+                config = Config(session_env=env)
+                d = get_config_diff(config)
 
-            if d.is_node_changed(['service', 'https']):
-                background_tasks.add_task(call_commit, state)
-                msg = self_ref_msg
-            else:
-                session.commit()
+                if d.is_node_changed(['service', 'https']):
+                    background_tasks.add_task(call_commit, state)
+                    msg = self_ref_msg
+                else:
+                    session.commit()
         else:
             return error(400, f"'{op}' is not a valid operation")
     except ConfigSessionError as e:
@@ -622,10 +706,14 @@ def show_op(data: ShowModel):
 
     try:
         if op == 'show':
-            res = session.show(path)
+            res = None
+            if state.op_executor is not None:
+                res = state.op_executor.show(path)
+            if res is None:
+                res = session.show(path)
         else:
             return error(400, f"'{op}' is not a valid operation")
-    except ConfigSessionError as e:
+    except (ConfigSessionError, OpModeError, ValueError) as e:
         return error(400, str(e))
     except Exception:
         LOG.critical(traceback.format_exc())
@@ -33,9 +33,11 @@ def _initialize(self):
         self.rest = False
         self.debug = False
         self.strict = False
+        self.commit_queue = False
         self.graphql = False
         self.origins = []
         self.introspection = False
         self.auth_type = None
         self.token_exp = None
         self.secret_len = None
+        self.op_executor = None
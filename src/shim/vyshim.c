@@ -48,6 +48,14 @@
 #define GET_ACTIVE "cli-shell-api --show-active-only --show-show-defaults --show-ignore-edit showConfig"
 #define GET_SESSION "cli-shell-api --show-working-only --show-show-defaults --show-ignore-edit showConfig"
 
+// init protocol version 2: single multipart message of init data
+#define INIT_VERSION 2
+#define INIT_REPLY_V2 "init:2"
+#define INIT_MAGIC "VYCD\x02"
+#define INIT_MAGIC_LEN 5
+#define HASH_LEN 40
+#define INIT_BUF_LEN 128
+
 #define COMMIT_MARKER "/var/tmp/initial_in_commit"
 #define QUEUE_MARKER "/var/tmp/last_in_queue"
 
@@ -62,12 +70,15 @@ volatile int init_alarm = 0;
 volatile int timeout = 0;
 
 int initialization(void *);
+int send_init_data(void *, const char *, char *, char *, char *, char *);
 int pass_through(char **, int);
 void timer_handler(int);
 
 double get_posix_clock_time(void);
 
 static char * s_recv_string (void *, int);
+static char * read_config (const char *, ssize_t *);
+static void config_hash (const char *, size_t, char *);
 
 int main(int argc, char* argv[])
 {
@@ -171,7 +182,7 @@ int initialization(void* Requester)
 
     char *empty_string = "\n";
 
-    char buffer[16];
+    char buffer[INIT_BUF_LEN];
 
     struct sigaction sa;
     struct itimerval timer, none_timer;
@@ -215,8 +226,9 @@ int initialization(void* Requester)
     debug_print("changes_only_dir is %s\n", changes_only_dir);
 
     debug_print("Sending init announcement\n");
-    char *init_announce = mkjson(MKJSON_OBJ, 1,
-                                 MKJSON_STRING, "type", "init");
+    char *init_announce = mkjson(MKJSON_OBJ, 2,
+                                 MKJSON_STRING, "type", "init",
+                                 MKJSON_INT, "version", INIT_VERSION);
 
     // check for timeout on initial contact
     while (!init_alarm) {
@@ -225,7 +237,10 @@ int initialization(void* Requester)
         setitimer(ITIMER_REAL, &timer, NULL);
 
         zmq_send(Requester, init_announce, strlen(init_announce), 0);
-        zmq_recv(Requester, buffer, 16, 0);
+        int size = zmq_recv(Requester, buffer, INIT_BUF_LEN - 1, 0);
+        if (size > INIT_BUF_LEN - 1)
+            size = INIT_BUF_LEN - 1;
+        buffer[size < 0 ? 0 : size] = '\0';
 
         setitimer(ITIMER_REAL, &none_timer, &timer);
 
@@ -242,6 +257,14 @@ int initialization(void* Requester)
 
     if (timeout) return -1;
 
+    // daemon supporting protocol version 2 replies with the hashes of
+    // the configs it has already parsed
+    if (strncmp(buffer, INIT_REPLY_V2, strlen(INIT_REPLY_V2)) == 0) {
+        debug_print("Using init protocol version %d\n", INIT_VERSION);
+        return send_init_data(Requester, buffer, pid_val, sudo_user,
+                              temp_config_dir, changes_only_dir);
+    }
+
     FILE *fp_a = popen(GET_ACTIVE, "r");
     getdelim(&active_str, &active_len, '\0', fp_a);
     int ret = pclose(fp_a);
@@ -294,6 +317,52 @@ int initialization(void* Requester)
     return 0;
 }
 
+int send_init_data(void *Requester, const char *daemon_hashes,
+                   char *pid_val, char *sudo_user,
+                   char *temp_config_dir, char *changes_only_dir)
+{
+    char buffer[16];
+    char active_hash[HASH_LEN] = "";
+    char session_hash[HASH_LEN] = "";
+    char *empty_string = "";
+
+    ssize_t active_len, session_len;
+    char *active_str = read_config(GET_ACTIVE, &active_len);
+    char *session_str = read_config(GET_SESSION, &session_len);
+
+    if (active_len > 0)
+        config_hash(active_str, active_len, active_hash);
+    if (session_len > 0)
+        config_hash(session_str, session_len, session_hash);
+
+    // omit active config if the daemon has already parsed it
+    size_t active_send_len = active_len;
+    if (active_hash[0] && strstr(daemon_hashes, active_hash)) {
+        debug_print("Active config %s cached by daemon\n", active_hash);
+        active_send_len = 0;
+    }
+
+    debug_print("Sending init data\n");
+    zmq_send(Requester, INIT_MAGIC, INIT_MAGIC_LEN, ZMQ_SNDMORE);
+    zmq_send(Requester, active_hash, strlen(active_hash), ZMQ_SNDMORE);
+    zmq_send(Requester, active_str ? active_str : empty_string,
+             active_send_len, ZMQ_SNDMORE);
+    zmq_send(Requester, session_hash, strlen(session_hash), ZMQ_SNDMORE);
+    zmq_send(Requester, session_str ? session_str : empty_string,
+             session_len, ZMQ_SNDMORE);
+    zmq_send(Requester, pid_val, strlen(pid_val), ZMQ_SNDMORE);
+    zmq_send(Requester, sudo_user, strlen(sudo_user), ZMQ_SNDMORE);
+    zmq_send(Requester, temp_config_dir, strlen(temp_config_dir), ZMQ_SNDMORE);
+    zmq_send(Requester, changes_only_dir, strlen(changes_only_dir), 0);
+    zmq_recv(Requester, buffer, 16, 0);
+    debug_print("Received init data receipt\n");
+
+    free(active_str);
+    free(session_str);
+
+    return 0;
+}
+
 int pass_through(char **argv, int ex_index)
 {
     char **newargv = NULL;
@@ -369,3 +438,33 @@ static char * s_recv_string (void *socket, int bufsize) {
     buffer[size] = '\0';
     return buffer;
 }
+
+//  Read output of config command; on failure return NULL and length 0
+static char * read_config (const char *cmd, ssize_t *len) {
+    char *str = NULL;
+    size_t size = 0;
+    FILE *fp = popen(cmd, "r");
+    if (fp == NULL) {
+        *len = 0;
+        return NULL;
+    }
+    ssize_t n = getdelim(&str, &size, '\0', fp);
+    int ret = pclose(fp);
+    if (ret || n < 0) {
+        free(str);
+        str = NULL;
+        n = 0;
+    }
+    *len = n;
+    return str;
+}
+
+//  FNV-1a 64-bit hash of config content, with content length appended
+static void config_hash (const char *str, size_t len, char *out) {
+    uint64_t hash = 0xcbf29ce484222325ULL;
+    for (size_t i = 0; i < len; i++) {
+        hash ^= (unsigned char)str[i];
+        hash *= 0x100000001b3ULL;
+    }
+    snprintf(out, HASH_LEN, "%016llx-%zx", (unsigned long long)hash, len);
+}
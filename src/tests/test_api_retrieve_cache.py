@@ -0,0 +1,79 @@
+# Copyright (C) 2024 VyOS maintainers and contributors
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 2 or later as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import importlib.util
+import os
+
+from unittest import TestCase
+from unittest.mock import patch
+
+path = os.path.join(os.path.dirname(__file__), '../services/api/rest/retrieve_cache.py')
+spec = importlib.util.spec_from_file_location('retrieve_cache', path)
+retrieve_cache = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(retrieve_cache)
+
+KEY = ('exists', ('service', 'https'), None)
+
+class TestRetrieveCache(TestCase):
+    def setUp(self):
+        retrieve_cache.retrieve_cache = None
+        self.lock = retrieve_cache.SessionLock()
+        self.generation = 1
+        patcher = patch.object(retrieve_cache, 'commit_generation',
+                               side_effect=lambda: self.generation)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def get(self):
+        return retrieve_cache.get_retrieve_cache({}, self.lock)
+
+    def test_cached_until_commit(self):
+        cache = self.get()
+        cache.add(KEY, b'false', self.lock)
+        self.assertIs(self.get(), cache)
+        self.assertEqual(self.get().responses, {KEY: b'false'})
+
+        # a successful commit
+        with self.lock:
+            self.generation += 1
+        self.assertNotIn(KEY, self.get().responses)
+
+    def test_not_cached_while_locked(self):
+        with self.lock:
+            self.assertIsNone(self.get())
+
+    def test_failed_commit(self):
+        cache = self.get()
+        cache.add(KEY, b'false', self.lock)
+
+        # /retrieve runs while /configure changes the session, whose commit
+        # then fails: the changes are discarded, the generation is unchanged
+        cache = self.get()
+        self.lock.acquire()
+        cache.add(('exists', ('system',), None), b'true', self.lock)
+        self.lock.release()
+
+        self.assertEqual(self.get().responses, {})
+        self.assertIsNot(self.get(), cache)
+
+    def test_response_created_across_lock(self):
+        cache = self.get()
+        with self.lock:
+            pass
+        cache.add(KEY, b'true', self.lock)
+        self.assertEqual(self.get().responses, {})
+
+    def test_unknown_generation(self):
+        self.generation = None
+        self.assertIsNone(self.get())
@@ -0,0 +1,268 @@
+# Copyright (C) 2024 VyOS maintainers and contributors
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 2 or later as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import json
+import os
+import tempfile
+
+from unittest import TestCase
+from unittest.mock import patch
+
+from vyos.cgnat import AllocationError
+from vyos.cgnat import AllocationIndex
+from vyos.cgnat import PortBlockAllocator
+from vyos.cgnat import allocation_changes
+from vyos.cgnat import collapse_addresses
+from vyos.cgnat import load_allocation
+from vyos.cgnat import ntoa
+from vyos.cgnat import range_to_ints
+from vyos.cgnat import release_allocation
+from vyos.cgnat import save_allocation
+
+EXTERNALS = [range_to_ints(addr)[0] for addr in ['192.0.2.1/32', '192.0.2.2/32']]
+
+def allocation(allocator):
+    return {ntoa(addr): (ntoa(ext), first, last)
+            for addr, ext, first, last in allocator.elements()}
+
+class TestPortBlockAllocator(TestCase):
+    def allocator(self, externals=EXTERNALS):
+        return PortBlockAllocator(externals, '40000-60000', 5000)
+
+    def test_sequential_allocation(self):
+        alloc = self.allocator()
+        released, internal, slot = alloc.update([range_to_ints('100.64.0.0/29')])
+        self.assertEqual(len(released), 0)
+        self.assertEqual(len(internal), 8)
+        res = allocation(alloc)
+        self.assertEqual(res['100.64.0.0'], ('192.0.2.1', 40000, 44999))
+        self.assertEqual(res['100.64.0.3'], ('192.0.2.1', 55000, 59999))
+        self.assertEqual(res['100.64.0.4'], ('192.0.2.2', 40000, 44999))
+        self.assertEqual(res['100.64.0.7'], ('192.0.2.2', 55000, 59999))
+
+    def test_existing_blocks_kept(self):
+        alloc = self.allocator()
+        alloc.update([range_to_ints('100.64.0.0/30')])
+        before = allocation(alloc)
+
+        # one subscriber leaves, two join
+        released, internal, slot = alloc.update([range_to_ints('100.64.0.1-100.64.0.5')])
+        self.assertEqual([ntoa(addr) for addr in released], ['100.64.0.0'])
+        self.assertEqual([ntoa(addr) for addr in internal], ['100.64.0.4', '100.64.0.5'])
+        after = allocation(alloc)
+        for addr in ['100.64.0.1', '100.64.0.2', '100.64.0.3']:
+            self.assertEqual(before[addr], after[addr])
+        # the released block is reused first
+        self.assertEqual(after['100.64.0.4'], before['100.64.0.0'])
+        self.assertEqual(after['100.64.0.5'], ('192.0.2.2', 40000, 44999))
+
+    def test_external_removed(self):
+        alloc = self.allocator()
+        alloc.update([range_to_ints('100.64.0.0/29')])
+        before = allocation(alloc)
+
+        # 192.0.2.1 is replaced by 192.0.2.3
+        externals = [EXTERNALS[1], range_to_ints('192.0.2.3/32')[0]]
+        new = self.allocator(externals)
+        moved = new.adopt(alloc)
+        released, internal, slot = new.update([range_to_ints('100.64.0.0/29')])
+        self.assertEqual(len(moved), 4)
+        self.assertEqual(len(released), 0)
+        self.assertEqual(sorted(internal), sorted(moved))
+        after = allocation(new)
+        self.assertEqual(after['100.64.0.0'], ('192.0.2.3', 40000, 44999))
+        self.assertEqual(after['100.64.0.7'], before['100.64.0.7'])
+
+    def test_exhausted(self):
+        alloc = self.allocator()
+        with self.assertRaises(AllocationError):
+            alloc.update([range_to_ints('100.64.0.0/28')])
+
+    def test_save_load(self):
+        alloc = self.allocator()
+        alloc.update([range_to_ints('100.64.0.0/29')])
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'state')
+            save_allocation({'100': alloc}, path)
+            loaded = load_allocation(path)
+            self.assertIsNone(load_allocation(os.path.join(tmp, 'missing')))
+        self.assertEqual(allocation(loaded['100']), allocation(alloc))
+        self.assertTrue(alloc.same_ports(loaded['100']))
+
+    def test_collapse_addresses(self):
+        addresses = [range_to_ints(a)[0] for a in
+                     ['100.64.0.3', '100.64.0.0', '100.64.0.1', '100.64.0.2', '100.64.0.9']]
+        self.assertEqual([str(n) for n in collapse_addresses(addresses)],
+                         ['100.64.0.0/30', '100.64.0.9/32'])
+
+class TestAllocationIndex(TestCase):
+    def setUp(self):
+        alloc = PortBlockAllocator(EXTERNALS, '40000-60000', 5000)
+        alloc.update([range_to_ints('100.64.0.0/29')])
+        other = PortBlockAllocator([range_to_ints('198.51.100.1/32')[0]], '1024-65535', 64512)
+        other.update([range_to_ints('100.65.0.1/32')])
+
+        self.tmp = tempfile.TemporaryDirectory()
+        path = os.path.join(self.tmp.name, 'state')
+        save_allocation({'100': alloc, '200': other}, path)
+        self.index = AllocationIndex(path, history=None)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_internal(self):
+        self.assertEqual(self.index.internal(range_to_ints('100.64.0.5')[0]),
+                         [{'internal_address': '100.64.0.5',
+                           'external_address': '192.0.2.2',
+                           'port_range': '45000-49999',
+                           'allocated': None}])
+        self.assertEqual(self.index.internal(range_to_ints('100.65.0.1')[0])[0]['port_range'],
+                         '1024-65535')
+        self.assertEqual(self.index.internal(range_to_ints('100.64.0.8')[0]), [])
+
+    def test_external(self):
+        addr = range_to_ints('192.0.2.1')[0]
+        self.assertEqual([a['internal_address'] for a in self.index.external(addr)],
+                         ['100.64.0.0', '100.64.0.1', '100.64.0.2', '100.64.0.3'])
+        self.assertEqual([a['internal_address'] for a in self.index.external(addr, 52000)],
+                         ['100.64.0.2'])
+        # outside the port range
+        self.assertEqual(self.index.external(addr, 1024), [])
+        self.assertEqual(self.index.external(addr, 60000), [])
+        self.assertEqual(self.index.external(range_to_ints('192.0.2.3')[0]), [])
+
+    def test_all(self):
+        self.assertEqual(len(list(self.index.all())), 9)
+
+    def test_missing(self):
+        with self.assertRaises(OSError):
+            AllocationIndex(os.path.join(self.tmp.name, 'missing'))
+
+    def test_old_version(self):
+        path = os.path.join(self.tmp.name, 'state')
+        with open(path, 'rb') as f:
+            header = json.loads(f.readline())
+            data = f.read()
+        header['version'] = 1
+        with open(path, 'wb') as f:
+            f.write(json.dumps(header).encode() + b'\n' + data)
+        self.assertIsNone(load_allocation(path))
+        with self.assertRaises(ValueError):
+            AllocationIndex(path)
+
+def addr(address):
+    return range_to_ints(address)[0]
+
+class TestAllocationHistory(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, 'state')
+        self.history = os.path.join(self.tmp.name, 'history')
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def commit(self, now, subscribers, history=True):
+        """Allocate blocks to subscribers like nat_cgnat.py at time now"""
+        previous = load_allocation(self.path)
+        alloc = PortBlockAllocator(EXTERNALS, '40000-60000', 5000)
+        changes = allocation_changes()
+        if previous:
+            alloc.adopt(previous['100'])
+        released, internal, slot = alloc.update([range_to_ints(subscribers)])
+        if previous:
+            changes.extend(allocation_changes(previous['100'], released))
+        changes.extend(allocation_changes(allocator=alloc, allocated=internal,
+                                          allocated_slot=slot))
+        with patch('time.time', return_value=now):
+            save_allocation({'100': alloc}, self.path, changes,
+                            self.history if history else None)
+        return AllocationIndex(self.path, self.history)
+
+    def test_internal(self):
+        self.commit(1000, '100.64.0.0/30')
+        index = self.commit(2000, '100.64.0.1-100.64.0.5')
+
+        self.assertEqual(index.internal(addr('100.64.0.0')), [])
+        self.assertEqual(index.internal(addr('100.64.0.0'), 1500),
+                         [{'internal_address': '100.64.0.0',
+                           'external_address': '192.0.2.1',
+                           'port_range': '40000-44999',
+                           'allocated': 1000}])
+        # the released block was given to 100.64.0.4
+        self.assertEqual(index.internal(addr('100.64.0.4')),
+                         [{'internal_address': '100.64.0.4',
+                           'external_address': '192.0.2.1',
+                           'port_range': '40000-44999',
+                           'allocated': 2000}])
+        self.assertEqual(index.internal(addr('100.64.0.4'), 1999), [])
+        self.assertEqual(index.internal(addr('100.64.0.1'), 1000)[0]['allocated'], 1000)
+        with self.assertRaises(ValueError):
+            index.internal(addr('100.64.0.0'), 999)
+
+    def test_external(self):
+        self.commit(1000, '100.64.0.0/30')
+        index = self.commit(2000, '100.64.0.1-100.64.0.5')
+        external = addr('192.0.2.1')
+
+        self.assertEqual([a['internal_address'] for a in index.external(external, 42000)],
+                         ['100.64.0.4'])
+        self.assertEqual([a['internal_address'] for a in index.external(external, 42000, 1500)],
+                         ['100.64.0.0'])
+        self.assertEqual([a['internal_address'] for a in index.external(external, when=1500)],
+                         ['100.64.0.0', '100.64.0.1', '100.64.0.2', '100.64.0.3'])
+        self.assertEqual(index.external(addr('192.0.2.2'), when=1500), [])
+        self.assertEqual([a['internal_address'] for a in index.external(addr('192.0.2.2'))],
+                         ['100.64.0.5'])
+
+    def test_release(self):
+        self.commit(1000, '100.64.0.0/30')
+        with patch('time.time', return_value=2000):
+            release_allocation(self.path, self.history)
+        self.assertFalse(os.path.exists(self.path))
+
+        # the history continues when CGNAT is configured again
+        index = self.commit(3000, '100.64.0.2/31')
+        self.assertEqual(index.start, 1000)
+        self.assertEqual(index.internal(addr('100.64.0.0'), 2500), [])
+        self.assertEqual(index.internal(addr('100.64.0.0'), 1500)[0]['port_range'],
+                         '40000-44999')
+        self.assertEqual(index.internal(addr('100.64.0.2'))[0]['port_range'],
+                         '40000-44999')
+
+    def test_restart(self):
+        self.commit(1000, '100.64.0.0/30')
+        # a commit missing from the history
+        self.commit(2000, '100.64.0.1/32', history=False)
+        self.assertIsNone(AllocationIndex(self.path, self.history).history)
+
+        index = self.commit(3000, '100.64.0.1/32')
+        self.assertEqual(index.start, 3000)
+        with self.assertRaises(ValueError):
+            index.internal(addr('100.64.0.1'), 2500)
+
+    def test_size_limit(self):
+        # 16 bytes of header and 8 records of 20 bytes
+        with patch('vyos.cgnat.history_size', 16 + 8 * 20):
+            self.commit(1000, '100.64.0.0/30')
+            self.commit(2000, '100.64.0.1/32')
+            # does not fit: the records of the first commit are dropped, the
+            # allocation after it can still be reconstructed
+            index = self.commit(3000, '100.64.0.0/30')
+        self.assertEqual(os.path.getsize(self.history), 16 + 6 * 20)
+        self.assertEqual(index.start, 1000)
+        self.assertEqual(len(index.internal(addr('100.64.0.0'), 1500)), 1)
+        self.assertEqual(index.internal(addr('100.64.0.0'), 2500), [])
+        with self.assertRaises(ValueError):
+            index.internal(addr('100.64.0.1'), 999)
\ No newline at end of file
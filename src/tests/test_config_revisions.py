@@ -0,0 +1,112 @@
+# Copyright (C) 2024 VyOS maintainers and contributors
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 2 or later as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import tempfile
+
+from unittest import TestCase
+
+from vyos import config_revisions
+from vyos.config_revisions import RevisionStore
+from vyos.config_revisions import RevisionStoreError
+from vyos.config_revisions import config_section
+
+config = '''interfaces {
+    ethernet eth0 {
+        address dhcp
+        /* uplink */
+        description "WAN link"
+    }
+    ethernet eth1 {
+        address 192.0.2.1/24
+    }
+}
+system {
+    host-name vyos
+}
+// vyos-config-version: "system@27"
+'''
+
+def revision(n):
+    return config.replace('192.0.2.1/24', f'192.0.2.{n}/24')
+
+class TestConfigSection(TestCase):
+    def test_tag_node(self):
+        self.assertEqual(config_section(config, ['interfaces', 'ethernet', 'eth0']),
+                         'interfaces {\n'
+                         '    ethernet eth0 {\n'
+                         '        address dhcp\n'
+                         '        /* uplink */\n'
+                         '        description "WAN link"\n'
+                         '    }\n'
+                         '}\n')
+        self.assertEqual(config_section(config, ['interfaces', 'ethernet', 'eth1', 'address']),
+                         'interfaces {\n'
+                         '    ethernet eth1 {\n'
+                         '        address 192.0.2.1/24\n'
+                         '    }\n'
+                         '}\n')
+
+    def test_node(self):
+        self.assertEqual(config_section(config, ['system']),
+                         'system {\n    host-name vyos\n}\n')
+        self.assertEqual(config_section(config, ['interfaces', 'ethernet']).count('ethernet'), 2)
+        self.assertEqual(config_section(config, ['protocols']), '')
+        self.assertEqual(config_section(config, []), config)
+
+class TestRevisionStore(TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.store = RevisionStore(self.dir.name)
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def add(self, text, **kwargs):
+        return self.store.add(text, user='vyos', commit_via='cli', **kwargs)
+
+    def test_revisions(self):
+        for n in range(25):
+            self.add(revision(n), timestamp=n, max_revisions=15)
+
+        store = RevisionStore(self.dir.name)
+        self.assertEqual(len(store), 15)
+        for rev in range(15):
+            self.assertEqual(store.text(rev), revision(24 - rev))
+        self.assertEqual(store.entry(0)['timestamp'], 24)
+        self.assertEqual([entry['timestamp'] for entry in store.entries()][-1], 10)
+        with self.assertRaises(RevisionStoreError):
+            store.text(15)
+
+        # only objects needed to rebuild the revisions are kept, revision
+        # 10 is a full snapshot
+        objects = store.index['objects']
+        self.assertEqual(sorted(os.listdir(store.objects_dir)), sorted(objects))
+        self.assertTrue(all(meta['depth'] < config_revisions.snapshot_interval
+                            for meta in objects.values()))
+        self.assertEqual(len(objects), 15)
+
+    def test_identical_revisions(self):
+        first = self.add(revision(1))
+        self.add(revision(2))
+        self.assertEqual(self.add(revision(1)), first)
+        self.assertEqual(len(self.store), 3)
+        self.assertEqual(len(os.listdir(self.store.objects_dir)), 2)
+
+    def test_is_revised(self):
+        self.add(revision(1))
+        self.add(revision(2))
+        self.assertTrue(self.store.is_revised(['interfaces', 'ethernet', 'eth1']))
+        self.assertFalse(self.store.is_revised(['interfaces', 'ethernet', 'eth0']))
+        self.assertFalse(self.store.is_revised(['system']))
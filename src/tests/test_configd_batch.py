@@ -0,0 +1,66 @@
+# Copyright (C) 2024 VyOS maintainers and contributors
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 2 or later as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from unittest import TestCase
+
+from vyos.configd_batch import BatchPlan
+
+class Job:
+    def __init__(self, record, fail=False):
+        self.record = record
+        self.fail = fail
+
+    def get(self):
+        if self.fail:
+            raise RuntimeError('worker died')
+        script = self.record.rsplit('_eth', 1)[0]
+        return {'args': [f'{script}.py'], 'start': 0.0, 'end': 1.0}
+
+class TestBatchPlan(TestCase):
+    def setUp(self):
+        self.dispatched = []
+        self.failing = set()
+        self.plan = BatchPlan([['interfaces_ethernet_eth0', 'interfaces_ethernet_eth1',
+                                'interfaces_dummy'], ['nat']], self.dispatch)
+
+    def dispatch(self, records):
+        self.dispatched.append(records)
+        return {r: Job(r, r in self.failing) for r in records}
+
+    def test_dispatch_on_request(self):
+        self.assertEqual(self.dispatched, [])
+        res = self.plan.result('interfaces_ethernet_eth1', ['interfaces_ethernet.py'])
+        self.assertEqual(res['args'], ['interfaces_ethernet.py'])
+        self.assertEqual(self.plan.result('interfaces_dummy', ['interfaces_dummy.py'])['args'],
+                         ['interfaces_dummy.py'])
+        self.assertEqual(len(self.dispatched), 1)
+        # each result is used once
+        self.assertIsNone(self.plan.result('interfaces_dummy', ['interfaces_dummy.py']))
+
+    def test_not_batched(self):
+        self.assertNotIn('nat', self.plan)
+        self.assertIsNone(self.plan.result('nat', ['nat.py']))
+        self.assertEqual(self.dispatched, [])
+
+    def test_argument_mismatch(self):
+        self.assertIsNone(self.plan.result('interfaces_dummy', ['interfaces_dummy.py', '--foo']))
+        self.assertNotIn('interfaces_dummy', self.plan)
+
+    def test_failed_job(self):
+        self.failing.add('interfaces_ethernet_eth0')
+        with self.assertLogs('vyos.configd_batch', level='ERROR'):
+            self.assertIsNone(self.plan.result('interfaces_ethernet_eth0',
+                                               ['interfaces_ethernet.py']))
+        self.assertIsNotNone(self.plan.result('interfaces_ethernet_eth1',
+                                              ['interfaces_ethernet.py']))
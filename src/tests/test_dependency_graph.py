@@ -14,6 +14,7 @@
 
 import os
 from vyos.configdep import check_dependency_graph
+from vyos.configdep import independent_batches
 
 _here = os.path.dirname(__file__)
 ddir = os.path.join(_here, '../../data/config-mode-dependencies')
@@ -27,3 +28,35 @@ def setUp(self):
     def test_acyclic(self):
         res = check_dependency_graph(dependency_dir=ddir)
         self.assertTrue(res)
+
+    def test_independent_batches(self):
+        d = {'pki': {'ethernet': ['interfaces_ethernet']}}
+        scripts = [('interfaces_ethernet_eth0', 'interfaces_ethernet', 318),
+                   ('interfaces_ethernet_eth1', 'interfaces_ethernet', 318),
+                   ('interfaces_dummy_dum0', 'interfaces_dummy', 318),
+                   ('nat', 'nat', 500),
+                   ('protocols_bgp', 'protocols_bgp', 820)]
+        res = independent_batches(scripts, d)
+        self.assertEqual(res, [['interfaces_ethernet_eth0',
+                                'interfaces_ethernet_eth1',
+                                'interfaces_dummy_dum0'],
+                               ['nat'], ['protocols_bgp']])
+
+        # dependents of a script of the same commit are not batched
+        scripts.insert(0, ('pki', 'pki', 300))
+        res = independent_batches(scripts, d)
+        self.assertEqual(res, [['pki'], ['interfaces_ethernet_eth0'],
+                               ['interfaces_ethernet_eth1'],
+                               ['interfaces_dummy_dum0'],
+                               ['nat'], ['protocols_bgp']])
+
+        # the input order is kept around scripts which are not batched
+        scripts = [('interfaces_dummy_dum0', 'interfaces_dummy', 318),
+                   ('interfaces_ethernet_eth0', 'interfaces_ethernet', 318),
+                   ('interfaces_dummy_dum1', 'interfaces_dummy', 318),
+                   ('interfaces_dummy_dum2', 'interfaces_dummy', 318),
+                   ('pki', 'pki', 300)]
+        res = independent_batches(scripts, d)
+        self.assertEqual(res, [['pki'], ['interfaces_dummy_dum0'],
+                               ['interfaces_ethernet_eth0'],
+                               ['interfaces_dummy_dum1', 'interfaces_dummy_dum2']])
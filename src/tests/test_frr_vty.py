@@ -0,0 +1,102 @@
+# Copyright (C) 2024 VyOS maintainers and contributors
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 2 or later as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import socket
+import tempfile
+import threading
+
+from unittest import TestCase
+from unittest.mock import patch
+
+import vyos.frr as frr
+
+class FakeVtyDaemon:
+    """Answers vty commands like an FRR daemon; 'fail' returns CMD_WARNING"""
+    def __init__(self, path):
+        self.commands = []
+        self.connections = 0
+        self.server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.server.bind(path)
+        self.server.listen()
+        threading.Thread(target=self.accept, daemon=True).start()
+
+    def accept(self):
+        while True:
+            try:
+                conn, _ = self.server.accept()
+            except OSError:
+                return
+            self.connections += 1
+            threading.Thread(target=self.serve, args=(conn,), daemon=True).start()
+
+    def serve(self, conn):
+        buf = b''
+        while data := conn.recv(4096):
+            buf += data
+            while b'\0' in buf:
+                command, buf = buf.split(b'\0', 1)
+                command = command.decode()
+                self.commands.append(command)
+                status = 1 if command == 'fail' else 0
+                conn.sendall(f'out: {command}\n'.encode() + b'\0\0\0' + bytes([status]))
+        conn.close()
+
+    def close(self):
+        self.server.close()
+
+class TestFrrVty(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        patcher = patch.object(frr, 'path_config', self.tmp.name)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.bgpd = FakeVtyDaemon(os.path.join(self.tmp.name, 'bgpd.vty'))
+        self.zebra = FakeVtyDaemon(os.path.join(self.tmp.name, 'zebra.vty'))
+        self.pool = frr.VtyPool()
+
+    def tearDown(self):
+        self.pool.close()
+        self.bgpd.close()
+        self.zebra.close()
+        self.tmp.cleanup()
+
+    def test_connection_reused(self):
+        for _ in range(3):
+            status, output = self.pool.run('bgpd', ['show bgp summary'])
+            self.assertEqual(status, 0)
+            self.assertEqual(output, 'out: show bgp summary\n')
+        self.assertEqual(self.bgpd.connections, 1)
+        self.assertEqual(self.bgpd.commands,
+                         ['enable'] + ['show bgp summary'] * 3)
+
+    def test_configure_stops_on_error(self):
+        status, output = self.pool.run('zebra', ['vrf red', 'fail', 'vni 10'],
+                                       configure=True)
+        self.assertEqual(status, 1)
+        self.assertTrue(output.endswith('out: fail\n'))
+        self.assertEqual(self.zebra.commands,
+                         ['enable', 'configure terminal', 'vrf red', 'fail', 'end'])
+
+    def test_unsupported_daemon(self):
+        with self.assertRaises(ValueError):
+            self.pool.run('foo', ['show version'])
+
+    def test_reconnect_stale(self):
+        self.pool.run('bgpd', ['show version'])
+        # connection dropped, for example on restart of the daemon
+        self.pool.connection('bgpd').sock.shutdown(socket.SHUT_RDWR)
+        status, output = self.pool.run('bgpd', ['show version'])
+        self.assertEqual((status, output), (0, 'out: show version\n'))
+        self.assertEqual(self.bgpd.connections, 2)
@@ -0,0 +1,147 @@
+# Copyright (C) 2024 VyOS maintainers and contributors
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 2 or later as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import gzip
+import json
+import os
+import shutil
+import tempfile
+
+from ipaddress import ip_address
+from unittest import TestCase
+from unittest.mock import patch
+
+from vyos import firewall
+
+database = [
+    ('1.0.0.0', '1.0.0.255', 'AU'),
+    ('1.0.1.0', '1.0.3.255', 'CN'),
+    ('1.0.4.0', '1.0.7.255', 'AU'),
+    ('1.0.8.0', '1.0.8.255', 'AU'),
+    ('2.0.0.0', '2.0.0.0', 'SE'),
+    ('2001:200::', '2001:200:ffff:ffff:ffff:ffff:ffff:ffff', 'JP'),
+    ('2001:201::', '2001:201::ffff', 'JP'),
+]
+
+def ip_range(start, end):
+    return (int(ip_address(start)), int(ip_address(end)))
+
+class TestGeoIPIndex(TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.database = os.path.join(self.dir, 'dbip.csv.gz')
+        self.index = os.path.join(self.dir, 'dbip.idx')
+        self.write_database(database)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+    def write_database(self, rows):
+        with gzip.open(self.database, 'wt') as f:
+            for row in rows:
+                f.write(','.join(row) + '\n')
+
+    def test_ranges(self):
+        index = firewall.geoip_load_index(self.database, self.index)
+        # adjacent ranges are merged
+        self.assertEqual(index.ranges('au'), [ip_range('1.0.0.0', '1.0.0.255'),
+                                              ip_range('1.0.4.0', '1.0.8.255')])
+        self.assertEqual(index.ranges('jp', ipv6=True),
+                         [ip_range('2001:200::', '2001:201::ffff')])
+        self.assertEqual(index.ranges('jp'), [])
+        self.assertEqual(index.ranges('xx'), [])
+        self.assertEqual(index.set_ranges(['au', 'cn']), [ip_range('1.0.0.0', '1.0.8.255')])
+
+    def test_rebuild(self):
+        index = firewall.geoip_load_index(self.database, self.index)
+        self.assertEqual(firewall.geoip_load_index(self.database, self.index).source, index.source)
+        self.assertIsNone(firewall.geoip_previous_index(self.index))
+
+        self.write_database(database[:1])
+        os.utime(self.database, ns=(0, 0))
+        updated = firewall.geoip_load_index(self.database, self.index)
+        self.assertNotEqual(updated.source, index.source)
+        self.assertEqual(updated.ranges('au'), [ip_range('1.0.0.0', '1.0.0.255')])
+        self.assertEqual(firewall.geoip_previous_index(self.index).source, index.source)
+
+    def test_set_commands(self):
+        index = firewall.geoip_load_index(self.database, self.index)
+        new = index.set_ranges(['au', 'se'])
+        commands = firewall.geoip_set_commands('ip vyos_filter', 'GEOIP_CC_test', False, new)
+        self.assertEqual(commands[1:], [
+            'flush set ip vyos_filter GEOIP_CC_test',
+            'add element ip vyos_filter GEOIP_CC_test { 1.0.0.0-1.0.0.255,1.0.4.0-1.0.8.255,2.0.0.0 }'])
+
+        old = index.set_ranges(['au'])
+        commands = firewall.geoip_set_commands('ip vyos_filter', 'GEOIP_CC_test', False, new, old)
+        self.assertEqual(commands, ['add element ip vyos_filter GEOIP_CC_test { 2.0.0.0 }'])
+        self.assertEqual(firewall.geoip_set_commands('ip vyos_filter', 'GEOIP_CC_test', False, new, new), [])
+
+class TestGeoIPUpdate(TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir, ignore_errors=True)
+        paths = {name: os.path.join(self.dir, name) for name in
+                 ['geoip_database', 'geoip_index', 'geoip_state',
+                  'geoip_lock_file', 'nftables_geoip_conf']}
+        with gzip.open(paths['geoip_database'], 'wt') as f:
+            for row in database:
+                f.write(','.join(row) + '\n')
+
+        self.table_handle = 1
+        self.set_handle = 2
+        self.loaded = []
+        for name, value in dict(paths, cmd=self.nft_list, run=self.nft_run).items():
+            patcher = patch.object(firewall, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+        self.firewall = {'ipv4': {'name': {'test': {'rule': {'10': {
+            'source': {'geoip': {'country_code': ['au']}}}}}}}}
+
+    def nft_list(self, command):
+        if command.endswith('tables'):
+            obj = {'table': {'family': 'ip', 'name': 'vyos_filter',
+                             'handle': self.table_handle}}
+        else:
+            obj = {'set': {'family': 'ip', 'table': 'vyos_filter',
+                           'name': 'GEOIP_CC_name_test_10', 'handle': self.set_handle}}
+        return json.dumps({'nftables': [{'metainfo': {}}, obj]})
+
+    def nft_run(self, command):
+        with open(firewall.nftables_geoip_conf) as f:
+            self.loaded.append(f.read())
+        return 0
+
+    def test_unchanged(self):
+        self.assertTrue(firewall.geoip_update(self.firewall))
+        self.assertEqual(len(self.loaded), 1)
+        self.assertIn('flush set ip vyos_filter GEOIP_CC_name_test_10', self.loaded[0])
+
+        self.assertTrue(firewall.geoip_update(self.firewall))
+        self.assertEqual(len(self.loaded), 1)
+
+    def test_table_recreated(self):
+        self.assertTrue(firewall.geoip_update(self.firewall))
+        # the set of a recreated table gets the same handle again
+        self.table_handle = 3
+        self.assertTrue(firewall.geoip_update(self.firewall))
+        self.assertEqual(len(self.loaded), 2)
+        self.assertEqual(self.loaded[1], self.loaded[0])
+
+    def test_reload(self):
+        self.assertTrue(firewall.geoip_update(self.firewall))
+        self.assertTrue(firewall.geoip_update(self.firewall, reload=True))
+        self.assertEqual(len(self.loaded), 2)
+        self.assertEqual(self.loaded[1], self.loaded[0])
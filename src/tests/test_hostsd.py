@@ -0,0 +1,142 @@
+# Copyright (C) 2024 VyOS maintainers and contributors
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 2 or later as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import copy
+import importlib.machinery
+import importlib.util
+import os
+
+from unittest import TestCase
+from unittest.mock import patch
+
+HOSTSD = os.path.join(os.path.dirname(__file__), '../services/vyos-hostsd')
+
+def import_hostsd():
+    loader = importlib.machinery.SourceFileLoader('vyos_hostsd', HOSTSD)
+    spec = importlib.util.spec_from_loader('vyos_hostsd', loader)
+    module = importlib.util.module_from_spec(spec)
+    loader.exec_module(module)
+    return module
+
+hostsd = import_hostsd()
+INITIAL_STATE = copy.deepcopy(hostsd.STATE)
+
+def add_name_servers(tag, servers):
+    return {'op': 'add', 'type': 'name_servers', 'data': {tag: servers}}
+
+APPLY = {'op': 'apply'}
+
+class TestHostsd(TestCase):
+    def setUp(self):
+        hostsd.STATE = copy.deepcopy(INITIAL_STATE)
+        hostsd.STATE['name_server_tags_system'] = ['dhcp-eth0']
+        hostsd.STATE['name_server_tags_recursor'] = ['dhcp-eth0']
+        hostsd.rendered.clear()
+        hostsd.pdns_rec_pending.clear()
+        hostsd.pdns_rec_due = None
+
+        self.made = []
+        for name in ['make_resolv_conf', 'make_hosts', 'make_pdns_rec_conf']:
+            patcher = patch.object(hostsd, name, side_effect=lambda state, name=name:
+                                   self.made.append(name))
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        patcher = patch.object(hostsd, 'save_state')
+        self.save_state = patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = patch.object(hostsd, 'pdns_rec_control')
+        self.rec_control = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def message(self, msg):
+        hostsd.validate_schema(msg)
+        return hostsd.handle_message(msg)
+
+    def test_render_changed(self):
+        make = []
+        inputs = ['vyos', {}]
+        self.assertTrue(hostsd.render_changed('hosts', inputs, make.append, 'state'))
+        self.assertFalse(hostsd.render_changed('hosts', copy.deepcopy(inputs), make.append, 'state'))
+        inputs[1]['tag'] = {'host': {'address': ['192.0.2.1'], 'aliases': []}}
+        self.assertTrue(hostsd.render_changed('hosts', inputs, make.append, 'state'))
+        self.assertEqual(make, ['state', 'state'])
+
+    def test_apply_renders_changed_files(self):
+        self.message(APPLY)
+        self.assertEqual(self.made, ['make_resolv_conf', 'make_hosts', 'make_pdns_rec_conf'])
+
+        self.made.clear()
+        self.message(APPLY)
+        self.assertEqual(self.made, [])
+
+        # name servers are rendered to resolv.conf and the recursor config
+        self.message(add_name_servers('dhcp-eth0', ['192.0.2.53']))
+        self.message(APPLY)
+        self.assertEqual(self.made, ['make_resolv_conf', 'make_pdns_rec_conf'])
+
+    def test_state_saved_on_change(self):
+        self.message(add_name_servers('dhcp-eth0', ['192.0.2.53']))
+        self.assertEqual(self.save_state.call_count, 1)
+
+        # unchanged state and queries are not saved
+        self.message(add_name_servers('dhcp-eth0', ['192.0.2.53']))
+        self.message({'op': 'get', 'type': 'name_servers', 'tag_regex': '.*'})
+        self.assertEqual(self.save_state.call_count, 1)
+
+        # the change counter is reset by apply
+        self.message(APPLY)
+        self.assertEqual(self.save_state.call_count, 2)
+
+    def test_batch(self):
+        res = self.message({'op': 'batch', 'data': [
+            add_name_servers('dhcp-eth0', ['192.0.2.53']),
+            {'op': 'add', 'type': 'search_domains', 'data': {'dhcp-eth0': ['example.com']}},
+            APPLY]})
+        self.assertEqual(res[:2], [None, None])
+        self.assertEqual(list(hostsd.STATE['name_servers']['dhcp-eth0']), ['192.0.2.53'])
+        self.assertEqual(self.save_state.call_count, 1)
+
+    def test_batch_rollback(self):
+        self.message(add_name_servers('dhcp-eth0', ['192.0.2.53']))
+        state = copy.deepcopy(hostsd.STATE)
+        self.save_state.reset_mock()
+
+        with patch.object(hostsd, 'make_resolv_conf', side_effect=OSError('read-only')):
+            with self.assertRaises(OSError):
+                self.message({'op': 'batch', 'data': [
+                    {'op': 'delete', 'type': 'name_servers', 'data': ['dhcp-eth0']},
+                    add_name_servers('dhcp-eth1', ['198.51.100.53']),
+                    APPLY]})
+        self.assertEqual(hostsd.STATE, state)
+        self.save_state.assert_not_called()
+
+    def test_batch_rejects_get(self):
+        with self.assertRaises(ValueError):
+            self.message({'op': 'batch', 'data': [
+                {'op': 'get', 'type': 'name_servers', 'tag_regex': '.*'}]})
+
+    def test_rec_control_delayed(self):
+        with patch.object(hostsd.time, 'monotonic', return_value=100):
+            self.message(APPLY)
+            self.message(add_name_servers('dhcp-eth0', ['192.0.2.53']))
+            self.message(APPLY)
+            hostsd.pdns_rec_control_due()
+        self.rec_control.assert_not_called()
+
+        # a steady stream of requests does not postpone the reload
+        with patch.object(hostsd.time, 'monotonic', return_value=100 + hostsd.REC_CONTROL_DELAY):
+            hostsd.pdns_rec_control_due()
+        self.assertEqual([c.args[0] for c in self.rec_control.call_args_list],
+                         ['reload-lua-config', 'reload-zones'])
+        self.assertIsNone(hostsd.pdns_rec_due)
@@ -0,0 +1,86 @@
+# Copyright (C) 2024 VyOS maintainers and contributors
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 2 or later as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import json
+import os
+import tempfile
+import threading
+import zmq
+
+from unittest import TestCase
+from unittest.mock import patch
+
+from vyos import hostsd_client
+
+class TestHostsdClientBatch(TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.path = f'ipc://{os.path.join(self.dir.name, "hostsd.sock")}'
+        self.context = zmq.Context()
+        self.requests = []
+        self.stop = threading.Event()
+        self.ready = threading.Event()
+        self.thread = threading.Thread(target=self.serve, daemon=True)
+        self.thread.start()
+        self.ready.wait()
+
+    def tearDown(self):
+        self.stop.set()
+        self.thread.join()
+        self.context.term()
+        self.dir.cleanup()
+
+    def serve(self):
+        # answer get requests with an empty list, others with None
+        server = self.context.socket(zmq.REP)
+        server.bind(self.path)
+        self.ready.set()
+        while not self.stop.is_set():
+            if not server.poll(50):
+                continue
+            msg = json.loads(server.recv())
+            self.requests.append(msg)
+            data = [] if msg['op'] == 'get' else None
+            server.send(json.dumps({'data': data}).encode())
+        server.close(linger=0)
+
+    def client(self):
+        with patch.object(hostsd_client, 'SOCKET_PATH', self.path):
+            client = hostsd_client.Client()
+        self.addCleanup(client._Client__socket.close)
+        return client
+
+    def test_batch(self):
+        client = self.client()
+        with client.batch():
+            client.delete_name_servers(['dhcp-eth0'])
+            self.assertEqual(client.get_name_server_tags_system(), [])
+            client.add_name_servers({'dhcp-eth0': ['192.0.2.1']})
+            client.apply()
+
+        self.assertEqual([msg['op'] for msg in self.requests], ['get', 'batch'])
+        self.assertEqual([msg['op'] for msg in self.requests[1]['data']],
+                         ['delete', 'add', 'apply'])
+
+        # requests are sent one by one again after the batch
+        client.apply()
+        self.assertEqual(self.requests[-1], {'op': 'apply'})
+
+    def test_batch_error(self):
+        client = self.client()
+        with self.assertRaises(ValueError):
+            with client.batch():
+                client.delete_hosts(['static'])
+                raise ValueError()
+        self.assertEqual(self.requests, [])
@@ -0,0 +1,62 @@
+# Copyright (C) 2024 VyOS maintainers and contributors
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 2 or later as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import shutil
+import tempfile
+
+from unittest import TestCase
+
+from vyos.ifconfig.control import SysctlCache
+from vyos.ifconfig.control import sysfs_stats
+
+class TestSysctlCache(TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        for name, value in [('forwarding', '1'), ('accept_ra', '0')]:
+            with open(os.path.join(self.dir, name), 'w') as f:
+                f.write(f'{value}\n')
+        self.cache = SysctlCache()
+        sysfs_stats(reset=True)
+
+    def tearDown(self):
+        self.cache.close()
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+    def read(self, name):
+        with open(os.path.join(self.dir, name)) as f:
+            return f.read()
+
+    def test_elide_current_value(self):
+        self.assertEqual(self.cache.read(self.dir, 'forwarding'), '1')
+        self.assertTrue(self.cache.write(self.dir, 'forwarding', '1'))
+        self.assertTrue(self.cache.write(self.dir, 'accept_ra', '2'))
+        self.assertTrue(self.cache.write(self.dir, 'accept_ra', '2'))
+        self.assertEqual(self.read('accept_ra'), '2')
+        self.assertEqual(sysfs_stats(), {'written': 1, 'elided': 2})
+
+    def test_missing(self):
+        self.assertFalse(self.cache.write(self.dir, 'nonexistent', '1'))
+        self.assertIsNone(self.cache.read(self.dir, 'nonexistent'))
+        self.assertFalse(self.cache.write(f'{self.dir}/nodir', 'forwarding', '1'))
+
+    def test_recreated_directory(self):
+        self.cache.write(self.dir, 'accept_ra', '2')
+        # the kernel recreates the directory with default values
+        shutil.rmtree(self.dir)
+        os.mkdir(self.dir)
+        with open(os.path.join(self.dir, 'accept_ra'), 'w') as f:
+            f.write('0\n')
+        self.assertTrue(self.cache.write(self.dir, 'accept_ra', '1'))
+        self.assertEqual(self.read('accept_ra'), '1')
@@ -0,0 +1,185 @@
+# Copyright (C) 2024 VyOS maintainers and contributors
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 2 or later as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import asyncio
+import json
+import os
+import socket
+import tempfile
+import threading
+
+from unittest import TestCase
+from unittest.mock import patch
+
+import vyos.kea as kea
+
+LEASES = [{'ip-address': f'192.0.2.{i}', 'subnet-id': 1} for i in range(1, 8)]
+
+def fake_get_page(inet, command, args):
+    assert command == f'lease{inet}-get-page'
+    if args['from'] == 'start':
+        start = 0
+    else:
+        start = next(i for i, lease in enumerate(LEASES) if lease['ip-address'] == args['from']) + 1
+    page = LEASES[start:start + args['limit']]
+    if not page:
+        return {'result': 3, 'text': '0 IPv4 lease(s) found.'}
+    return {'result': 0, 'arguments': {'leases': page, 'count': len(page)}}
+
+class FakeKeaServer:
+    """
+    Answers control socket commands like Kea; the connection is closed after
+    each response unless keepalive is set
+    """
+    def __init__(self, path, keepalive=False):
+        self.keepalive = keepalive
+        self.connections = 0
+        self.server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.server.bind(path)
+        os.chmod(path, 0o775)
+        self.server.listen()
+        threading.Thread(target=self.accept, daemon=True).start()
+
+    def accept(self):
+        while True:
+            try:
+                conn, _ = self.server.accept()
+            except OSError:
+                return
+            self.connections += 1
+            threading.Thread(target=self.serve, args=(conn,), daemon=True).start()
+
+    def serve(self, conn):
+        decoder = json.JSONDecoder()
+        buf = ''
+        with conn:
+            while data := conn.recv(4096):
+                buf += data.decode()
+                try:
+                    request, end = decoder.raw_decode(buf)
+                except ValueError:
+                    continue
+                buf = buf[end:]
+                conn.sendall(json.dumps(self.response(request), indent=4).encode())
+                if not self.keepalive:
+                    return
+
+    def response(self, request):
+        if request['command'] == 'lease4-get-all':
+            leases = [{'ip-address': f'10.{i >> 16}.{(i >> 8) & 255}.{i & 255}',
+                       'hostname': 'host-with-a-long-name-' * 4} for i in range(20000)]
+            return {'result': 0, 'arguments': {'leases': leases}}
+        return {'result': 0, 'text': request['command'],
+                'arguments': request.get('arguments', {})}
+
+    def close(self):
+        self.server.close()
+
+class TestKeaCtrlClient(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, 'kea4-ctrl-socket')
+
+    def tearDown(self):
+        self.server.close()
+        self.tmp.cleanup()
+
+    def test_large_response(self):
+        self.server = FakeKeaServer(self.path)
+        with kea.KeaCtrlClient('4', path=self.path) as client:
+            res = client.command('lease4-get-all')
+        self.assertEqual(len(res['arguments']['leases']), 20000)
+
+    def test_reconnect_after_close(self):
+        self.server = FakeKeaServer(self.path)
+        with kea.KeaCtrlClient('4', path=self.path) as client:
+            for i in range(3):
+                res = client.command('lease4-get', {'ip-address': f'192.0.2.{i}'})
+                self.assertEqual(res['arguments'], {'ip-address': f'192.0.2.{i}'})
+        self.assertEqual(self.server.connections, 3)
+
+    def test_connection_reused(self):
+        self.server = FakeKeaServer(self.path, keepalive=True)
+        with kea.KeaCtrlClient('4', path=self.path) as client:
+            res = client.commands([('config-get', None), ('status-get', None)])
+        self.assertEqual([r['text'] for r in res], ['config-get', 'status-get'])
+        self.assertEqual(self.server.connections, 1)
+
+    def test_concurrent_commands(self):
+        self.server = FakeKeaServer(self.path, keepalive=True)
+        errors = []
+        with kea.KeaCtrlClient('4', path=self.path) as client:
+            def run(n):
+                try:
+                    for i in range(50):
+                        address = f'192.0.{n}.{i}'
+                        res = client.command('lease4-get', {'ip-address': address})
+                        if res['arguments'] != {'ip-address': address}:
+                            errors.append(res)
+                except Exception as e:
+                    errors.append(e)
+            threads = [threading.Thread(target=run, args=(n,)) for n in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.assertEqual(errors, [])
+        self.assertEqual(self.server.connections, 1)
+
+    def test_async(self):
+        self.server = FakeKeaServer(self.path)
+        async def run():
+            client = kea.AsyncKeaCtrlClient('4', path=self.path)
+            try:
+                res = await asyncio.gather(client.command('lease4-get-all'),
+                                           client.command('config-get'))
+            finally:
+                await client.close()
+            return res
+        leases, config = asyncio.run(run())
+        self.assertEqual(len(leases['arguments']['leases']), 20000)
+        self.assertEqual(config['text'], 'config-get')
+
+class TestKea(TestCase):
+    def test_leases_paged(self):
+        for page_size in [1, 3, 7, 10]:
+            with patch.object(kea, '_ctrl_socket_command', side_effect=fake_get_page) as cmd:
+                self.assertEqual(list(kea.kea_get_leases_paged('4', page_size)), LEASES)
+                self.assertEqual(cmd.call_count, len(LEASES) // page_size + 1)
+
+    def test_leases_paged_async(self):
+        async def get_page(inet, command, args):
+            return fake_get_page(inet, command, args)
+        async def leases(page_size):
+            return [lease async for lease in kea.kea_get_leases_paged_async('4', page_size)]
+
+        for page_size in [1, 3, 7, 10]:
+            with patch.object(kea, '_async_ctrl_socket_command', side_effect=get_page) as cmd:
+                self.assertEqual(asyncio.run(leases(page_size)), LEASES)
+                self.assertEqual(cmd.call_count, len(LEASES) // page_size + 1)
+
+    def test_leases_paged_no_socket(self):
+        with patch.object(kea, '_ctrl_socket_command', return_value=None):
+            self.assertEqual(list(kea.kea_get_leases_paged('4')), [])
+
+    def test_subnet_pool_index(self):
+        config = {'arguments': {'Dhcp4': {'shared-networks': [
+            {'name': 'LAN', 'subnet4': [{'id': 1}, {'id': 2}]},
+            {'name': 'DMZ', 'subnet4': [{'id': 3}]},
+        ]}}}
+        index = kea.kea_get_subnet_pool_index(config, '4')
+        self.assertEqual(index, {1: 'LAN', 2: 'LAN', 3: 'DMZ'})
+        for subnet_id in index:
+            self.assertEqual(index[subnet_id],
+                             kea.kea_get_pool_from_subnet_id(config, '4', subnet_id))
@@ -12,6 +12,8 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+import json
+
 from unittest import TestCase
 
 import vyos.opmode
@@ -60,3 +62,19 @@ def test_dict_fields_normalization_primitive(self):
 
         data = [1, False, "foo"]
         self.assertEqual(_normalize_field_names(data), [1, False, "foo"])
+
+    def test_list_arguments(self):
+        import sys
+        import types
+        import typing
+        from unittest.mock import patch
+
+        module = types.ModuleType('op_mode_test')
+        def show_queries(raw: bool, query: list[str], limit: typing.Optional[list[int]]):
+            return {'query': query, 'limit': limit}
+        module.show_queries = show_queries
+
+        argv = ['test', 'show_queries', '--raw', '--query', 'a', 'b:1', '--limit', '1', '2']
+        with patch.object(sys, 'argv', argv):
+            res = vyos.opmode.run(module)
+        self.assertEqual(json.loads(res), {'query': ['a', 'b:1'], 'limit': [1, 2]})
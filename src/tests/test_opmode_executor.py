@@ -0,0 +1,147 @@
+# Copyright (C) 2024 VyOS maintainers and contributors
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 2 or later as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import sys
+import tempfile
+import textwrap
+
+from unittest import TestCase
+from unittest.mock import patch
+
+from vyos.defaults import directories
+from vyos import opmode
+from vyos import opmode_executor
+
+script = textwrap.dedent('''
+    import sys
+    import threading
+    import time
+    import typing
+
+    import vyos.opmode
+
+    calls = []
+    release = threading.Event()
+
+    def show(raw: bool, name: typing.Optional[str]):
+        calls.append(name)
+        if raw:
+            return {'name': name, 'calls': len(calls)}
+        print('header')
+        return f'name {name}'
+
+    def show_slow(raw: bool):
+        time.sleep(1)
+        return {}
+
+    def show_blocked(raw: bool):
+        release.wait()
+        return {}
+
+    def show_failed(raw: bool):
+        raise vyos.opmode.UnconfiguredSubsystem('not configured')
+
+    if __name__ == '__main__':
+        print(vyos.opmode.run(sys.modules[__name__]))
+''')
+
+templates = {
+    'show/test/node.def': 'help: Show test\nrun: ${vyos_op_scripts_dir}/test.py show\n',
+    'show/test/node.tag/node.def': 'help: Show test\nrun: sudo ${vyos_op_scripts_dir}/test.py show --name="$3"\n',
+    'show/test/node.tag/json/node.def': 'help: JSON\nrun: ${vyos_op_scripts_dir}/test.py show --name "${3}" --raw\n',
+    'show/piped/node.def': 'help: Piped\nrun: ${vyos_op_scripts_dir}/test.py show | tail -1\n',
+    'show/legacy/node.def': 'help: Legacy\nrun: ${vyos_op_scripts_dir}/legacy.py --show\n',
+}
+
+class TestOpModeExecutor(TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        op_mode = os.path.join(self.dir.name, 'op_mode')
+        op_templates = os.path.join(self.dir.name, 'templates')
+        os.makedirs(op_mode)
+        with open(os.path.join(op_mode, 'test.py'), 'w') as f:
+            f.write(script)
+        with open(os.path.join(op_mode, 'legacy.py'), 'w') as f:
+            f.write('print("legacy")\n')
+        for path, content in templates.items():
+            path = os.path.join(op_templates, path)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'w') as f:
+                f.write(content)
+
+        patcher = patch.dict(directories, {'op_mode': op_mode, 'op_templates': op_templates})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(setattr, sys, 'stdout', sys.stdout)
+
+        self.executor = opmode_executor.OpModeExecutor(timeout=0.2)
+        self.addCleanup(self.executor.shutdown)
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def test_resolve(self):
+        self.assertEqual(self.executor.resolve(['test']),
+                         ('test.py', 'show', {'raw': False, 'name': None}))
+        self.assertEqual(self.executor.resolve(['test', 'eth0']),
+                         ('test.py', 'show', {'raw': False, 'name': 'eth0'}))
+        self.assertEqual(self.executor.resolve(['test', 'eth0', 'json']),
+                         ('test.py', 'show', {'raw': True, 'name': 'eth0'}))
+        self.assertIsNone(self.executor.resolve(['piped']))
+        self.assertIsNone(self.executor.resolve(['legacy']))
+        self.assertIsNone(self.executor.resolve(['unknown']))
+
+    def test_show(self):
+        self.assertEqual(self.executor.show(['test', 'eth0']), 'header\nname eth0\n')
+        self.assertEqual(self.executor.show(['test', 'eth0', 'json']),
+                         '{\n    "name": "eth0",\n    "calls": 2\n}\n')
+        self.assertIsNone(self.executor.show(['legacy']))
+
+    def test_cache(self):
+        res = self.executor.call('test.py', 'show', {'name': 'eth0'}, raw=True)
+        self.assertIs(self.executor.call('test.py', 'show', {'name': 'eth0'}, raw=True), res)
+        self.assertEqual(self.executor.call('test.py', 'show', {'name': 'eth1'}, raw=True)['calls'], 2)
+        # formatted output is not cached
+        self.executor.call('test.py', 'show', {'name': 'eth0'})
+        self.executor.call('test.py', 'show', {'name': 'eth0'})
+        self.assertEqual(len(self.executor.module('test.py').calls), 4)
+
+        self.executor.ttl['test.show'] = 0
+        self.assertEqual(self.executor.call('test.py', 'show', {'name': 'eth0'}, raw=True)['calls'], 5)
+
+    def test_errors(self):
+        with self.assertRaises(opmode.UnconfiguredSubsystem):
+            self.executor.call('test.py', 'show_failed', {}, raw=True)
+        with self.assertRaises(opmode.DataUnavailable):
+            self.executor.call('test.py', 'show_slow', {}, raw=True)
+        with self.assertRaises(ValueError):
+            self.executor.call('legacy.py', 'show', {})
+
+    def test_busy(self):
+        executor = opmode_executor.OpModeExecutor(workers=1, timeout=0.2)
+        self.addCleanup(executor.shutdown)
+        module = executor.module('test.py')
+        self.addCleanup(module.release.set)
+
+        with self.assertRaises(opmode.DataUnavailable):
+            executor.call('test.py', 'show_blocked', {}, raw=True)
+        # the call which timed out still occupies the only worker
+        with self.assertRaises(opmode_executor.ExecutorBusy):
+            executor.call('test.py', 'show', {'name': 'eth0'})
+        self.assertIsNone(executor.show(['test', 'eth0']))
+
+        module.release.set()
+        executor.pool.submit(lambda: None).result()
+        self.assertEqual(executor.show(['test', 'eth0']), 'header\nname eth0\n')
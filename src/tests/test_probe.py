@@ -0,0 +1,93 @@
+# Copyright (C) 2024 VyOS maintainers and contributors
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 2 or later as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import asyncio
+import socket
+import struct
+
+from unittest import TestCase
+
+from vyos import probe
+
+class TestPackets(TestCase):
+    def test_icmp_echo(self):
+        packet = probe.icmp_echo_request(0x1234, 7, b'abc')
+        self.assertEqual(probe.checksum(packet), 0)
+        # echo reply as received on a raw socket, behind a 20 byte IPv4 header
+        ip_header = bytes([0x45]) + bytes(11) + socket.inet_aton('192.0.2.1') + bytes(4)
+        reply = bytes([probe.ICMP_ECHO_REPLY]) + packet[1:]
+        self.assertEqual(probe.parse_icmp_echo_reply(ip_header + reply),
+                         ('192.0.2.1', 0x1234, 7))
+        self.assertIsNone(probe.parse_icmp_echo_reply(ip_header + packet))
+        self.assertIsNone(probe.parse_icmp_echo_reply(ip_header[:10]))
+
+    def test_arp(self):
+        mac = bytes.fromhex('001122334455')
+        frame = probe.arp_request(mac, '192.0.2.2', '192.0.2.1')
+        self.assertEqual(len(frame), 42)
+        self.assertIsNone(probe.parse_arp_reply(frame))
+
+        reply = bytearray(frame)
+        struct.pack_into('!H', reply, 20, probe.ARP_REPLY)
+        reply[28:32] = socket.inet_aton('192.0.2.1')
+        self.assertEqual(probe.parse_arp_reply(bytes(reply)), '192.0.2.1')
+
+class TestTargetState(TestCase):
+    def test_thresholds(self):
+        state = probe.TargetState(rise=2, fall=3)
+        self.assertFalse(state.update(0.001))
+        self.assertEqual(state.state, 'unknown')
+        self.assertTrue(state.update(0.001))
+        self.assertTrue(state.alive)
+        self.assertFalse(state.update(None))
+        self.assertFalse(state.update(None))
+        self.assertTrue(state.alive)
+        # a success in between restarts the count
+        state.update(0.001)
+        for _ in range(2):
+            state.update(None)
+        self.assertTrue(state.update(None))
+        self.assertEqual(state.state, 'down')
+
+    def test_histogram(self):
+        histogram = probe.RttHistogram()
+        for rtt in [0.0005, 0.001, 0.003, 5, None]:
+            histogram.add(rtt)
+        result = histogram.to_dict()
+        self.assertEqual(result['buckets_ms']['<=1'], 2)
+        self.assertEqual(result['buckets_ms']['<=5'], 1)
+        self.assertEqual(result['buckets_ms']['>2000'], 1)
+        self.assertEqual(result['received'], 4)
+        self.assertEqual(result['lost'], 1)
+
+class TestProbeEngine(TestCase):
+    def test_tcp(self):
+        async def run():
+            server = await asyncio.start_server(lambda r, w: w.close(), '127.0.0.1', 0)
+            port = server.sockets[0].getsockname()[1]
+            engine = probe.ProbeEngine()
+            open_rtt = await engine.probe('tcp', '127.0.0.1', port=port)
+            server.close()
+            await server.wait_closed()
+            closed_rtt = await engine.probe('tcp', '127.0.0.1', port=port)
+            return open_rtt, closed_rtt
+
+        open_rtt, closed_rtt = asyncio.run(run())
+        self.assertIsNotNone(open_rtt)
+        self.assertIsNone(closed_rtt)
+
+    def test_unsupported(self):
+        engine = probe.ProbeEngine()
+        with self.assertRaises(probe.ProbeError):
+            asyncio.run(engine.probe('tcp', '127.0.0.1'))
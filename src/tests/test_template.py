@@ -12,6 +12,8 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+import os
+import tempfile
 import vyos.template
 
 from vyos.utils.network import interface_exists
@@ -190,3 +192,43 @@ def test_cipher_to_string(self):
         for group_name, group_config in data['ike_group'].items():
             ciphers = vyos.template.get_esp_ike_cipher(group_config)
             self.assertIn(IKEv2_DEFAULT, ','.join(ciphers))
+
+class TestPrecompiledTemplates(TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.templates = os.path.join(self.dir.name, 'templates')
+        self.compiled = os.path.join(self.dir.name, 'compiled')
+        self.write('test/address.j2', 'address {{ prefix | address_from_cidr }}\n')
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def write(self, name, content):
+        path = os.path.join(self.templates, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w') as f:
+            f.write(content)
+
+    def render(self, name, content):
+        loader = vyos.template._PrecompiledLoader(self.templates, self.compiled)
+        env = vyos.template._get_environment(self.templates)
+        template = loader.load(env, name, env.make_globals(None))
+        return template, template.render(content)
+
+    def test_precompiled(self):
+        names = vyos.template.precompile_templates(self.compiled, location=self.templates)
+        self.assertEqual(names, ['test/address.j2'])
+
+        template, rendered = self.render('test/address.j2', {'prefix': '192.0.2.0/24'})
+        self.assertEqual(rendered, 'address 192.0.2.0')
+        self.assertTrue(template.filename.startswith(self.compiled))
+
+    def test_modified(self):
+        vyos.template.precompile_templates(self.compiled, location=self.templates)
+        self.write('test/address.j2', 'prefix {{ prefix | address_from_cidr }}\n')
+        self.write('test/new.j2', 'new\n')
+
+        template, rendered = self.render('test/address.j2', {'prefix': '192.0.2.0/24'})
+        self.assertEqual(rendered, 'prefix 192.0.2.0')
+        self.assertTrue(template.filename.startswith(self.templates))
+        self.assertEqual(self.render('test/new.j2', {})[1], 'new')
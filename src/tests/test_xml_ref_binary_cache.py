@@ -0,0 +1,72 @@
+# Copyright (C) 2024 VyOS maintainers and contributors
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 2 or later as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import tempfile
+from unittest import TestCase
+
+from vyos.xml_ref import definition
+from vyos.xml_ref.binary_cache import dump
+from vyos.xml_ref.binary_cache import load
+
+def node_data(node_type, default_value=None, multi=False, owner=None,
+              priority=None):
+    return {'node_type': node_type, 'multi': multi, 'valueless': False,
+            'default_value': default_value, 'owner': owner,
+            'priority': priority}
+
+reference = {
+    'service': {
+        'node_data': node_data('node'),
+        'ntp': {
+            'node_data': node_data('node', owner='${vyos_conf_scripts_dir}/service_ntp.py',
+                                   priority='900'),
+            'interface': {'node_data': node_data('leaf', multi=True)},
+            'leap-second': {'node_data': node_data('leaf', default_value='smear')},
+            'server': {
+                'node_data': node_data('tag'),
+                'pool': {'node_data': node_data('leaf')},
+            },
+        },
+    },
+    'component_version': {'ntp': '3'},
+}
+
+class TestXmlRefBinaryCache(TestCase):
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp()
+        os.close(fd)
+        dump(reference, self.path)
+        self.ref = load(self.path)
+
+    def tearDown(self):
+        os.remove(self.path)
+
+    def test_round_trip(self):
+        self.assertEqual(self.ref.to_dict(), reference)
+        self.assertEqual(list(self.ref['service']['ntp']),
+                         list(reference['service']['ntp']))
+        self.assertNotIn('dns', self.ref['service'])
+
+    def test_xml_queries(self):
+        xml = definition.Xml()
+        xml.define(self.ref)
+        self.assertTrue(xml.is_tag(['service', 'ntp', 'server']))
+        self.assertTrue(xml.is_multi(['service', 'ntp', 'interface']))
+        self.assertEqual(xml.owner(['service', 'ntp', 'server', 'foo']),
+                         'service_ntp.py')
+        self.assertEqual(xml.get_defaults(['service', 'ntp']),
+                         {'ntp': {'leap-second': 'smear'}})
+        self.assertEqual(xml.component_version(), {'ntp': 3})
+        self.assertTrue(xml.cli_defined(['service', 'ntp'], 'pool', non_local=True))
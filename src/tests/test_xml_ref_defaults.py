@@ -0,0 +1,67 @@
+# Copyright (C) 2024 VyOS maintainers and contributors
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 2 or later as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from unittest import TestCase
+
+from vyos.xml_ref import definition
+
+def node(node_type, default_value=None, multi=False, **children):
+    d = {'node_data': {'node_type': node_type, 'multi': multi,
+                       'valueless': False, 'default_value': default_value,
+                       'owner': None, 'priority': None}}
+    d.update({k.replace('_', '-'): v for k, v in children.items()})
+    return d
+
+reference = {
+    'interfaces': node('node',
+        ethernet=node('tag',
+            mtu=node('leaf', default_value='1500'),
+            vif=node('tag',
+                mtu=node('leaf', default_value='1500'),
+                ip=node('node',
+                    arp_cache_timeout=node('leaf', default_value='30')))))
+}
+
+class TestXmlRefDefaults(TestCase):
+    def setUp(self):
+        self.xml = definition.Xml()
+        self.xml.define(reference)
+
+    def test_tag_values_collapsed(self):
+        vif = {'mtu': '1500', 'ip': {'arp-cache-timeout': '30'}}
+        for i in range(10):
+            path = ['interfaces', 'ethernet', 'eth0', 'vif', str(i)]
+            res = self.xml.get_defaults(path, recursive=True)
+            self.assertEqual(res, {str(i): vif})
+
+        stats = self.xml.defaults_cache_stats(reset=True)
+        self.assertEqual(stats['hits'], 9)
+        stats = self.xml.defaults_cache_stats()
+        self.assertEqual((stats['hits'], stats['misses']), (0, 0))
+        self.assertGreater(stats['size'], 0)
+
+    def test_template_copy(self):
+        path = ['interfaces', 'ethernet', 'eth0', 'vif', '10']
+        res = self.xml.get_defaults(path, get_first_key=True, recursive=True)
+        res['ip']['arp-cache-timeout'] = '60'
+        res = self.xml.get_defaults(path, get_first_key=True, recursive=True)
+        self.assertEqual(res['ip']['arp-cache-timeout'], '30')
+
+    def test_relative_defaults(self):
+        conf = {'eth0': {'vif': {'10': {}, '20': {'mtu': '9000'}}}}
+        res = self.xml.relative_defaults(['interfaces', 'ethernet'], conf,
+                                         get_first_key=True, recursive=True)
+        vif = {'mtu': '1500', 'ip': {'arp-cache-timeout': '30'}}
+        self.assertEqual(res, {'eth0': {'mtu': '1500',
+                                        'vif': {'10': vif, '20': vif}}})